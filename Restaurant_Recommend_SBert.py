@@ -6,10 +6,24 @@ from nltk.stem.porter import PorterStemmer
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics.pairwise import cosine_similarity
 import pickle
-from sentence_transformers import SentenceTransformer
+import scipy.sparse as sp
+from data_io import iter_table, read_table
+import inference
+from embedding_cache import EmbeddingCache
+from parallel_encode import ParallelEncoder
+from sparse_tfidf import TOP_K, top_k_neighbors
+
+# Input tables, can be pointed at other (e.g. synthetic) data in xlsx, csv or parquet
+RESULTS_PATH = os.environ.get("RESULTS_PATH", "data/results.xlsx")
+REVIEWS_PATH = os.environ.get("REVIEWS_PATH", "data/yelp_reviews.xlsx")
+
+# top-K neighbors are always saved, the dense restaurant x restaurant similarity matrix only up
+# to this many restaurants
+SIMILARITY_MAX_ROWS = int(os.environ.get("SBERT_SIMILARITY_MAX_ROWS", 10000))
+NEIGHBORS_PKL = 'models_sbert/restaurant_neighbors_sbert.pkl'
 
 # Read restaurant basic information and validate required columns
-df = pd.read_excel("data/results.xlsx")
+df = read_table(RESULTS_PATH)
 if 'BizId' in df.columns:
     df.rename(columns={'BizId': 'business_id'}, inplace=True)
 
@@ -17,7 +31,7 @@ required_cols = {'ReviewCount', 'Ranking'}
 missing = required_cols - set(df.columns)
 if missing:
     raise KeyError(
-        f"results.xlsx is missing required column(s): {', '.join(missing)}"
+        f"{RESULTS_PATH} is missing required column(s): {', '.join(missing)}"
     )
 
 # Basic restaurant information
@@ -40,8 +54,19 @@ df_restaurant.drop(columns=['Neighborhoods_0'], inplace=True)
 for col in ['categories', 'PriceRange', 'Rating', 'review_count', 'ranking']:
     df_restaurant[col] = df_restaurant[col].astype(str)
 
-# Read review file and aggregate English reviews
-reviews = pd.read_excel("data/yelp_reviews.xlsx")
+SBERT_MODEL = 'all-MiniLM-L6-v2'
+# reviews are read, encoded and pooled CHUNK_SIZE rows at a time
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 50000))
+# review weights in the pooled restaurant vector: "mean" (all equal), "recency", "rating",
+# or both, e.g. "recency,rating"
+POOLING = [w.strip() for w in os.environ.get("SBERT_POOLING", "mean").split(",") if w.strip()]
+RECENCY_HALF_LIFE_DAYS = float(os.environ.get("SBERT_RECENCY_HALF_LIFE_DAYS", 365))
+# share of the categories and location embedding in the vector of a restaurant with reviews
+META_WEIGHT = float(os.environ.get("SBERT_META_WEIGHT", 0.25))
+
+unknown = set(POOLING) - {"mean", "recency", "rating"}
+if unknown:
+    raise ValueError(f"Unknown SBERT_POOLING weight(s): {', '.join(unknown)}, use mean, recency or rating")
 
 
 def extract_english_text(cell):
@@ -52,28 +77,34 @@ def extract_english_text(cell):
         return ''
 
 
-reviews['text'] = reviews['text'].apply(extract_english_text)
-reviews = reviews[reviews['text'].astype(bool)].copy()
+# weight of every review of a chunk in its restaurant's pooled vector
+def review_weights(chunk):
+    weights = np.ones(len(chunk))
+    if "recency" in POOLING and 'time_created' in chunk:
+        dates = pd.to_datetime(chunk['time_created'], errors='coerce', utc=True, format='mixed')
+        age_days = (pd.Timestamp.now(tz='UTC') - dates).dt.total_seconds().clip(lower=0) / 86400
+        decay = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+        # undated reviews count like a typical review of the chunk
+        weights *= decay.fillna(decay.median() if decay.notna().any() else 1).to_numpy()
+    if "rating" in POOLING and 'rating' in chunk:
+        rating = pd.to_numeric(chunk['rating'], errors='coerce').clip(lower=0) / 5
+        weights *= rating.fillna(rating.mean() if rating.notna().any() else 1).to_numpy()
+    return weights
+
 
-agg = (reviews
-       .groupby('business_id')['text']
-       .apply(lambda seg: ' '.join(seg))
-       .reset_index()
-       .rename(columns={'text': 'all_reviews'}))
+def normalize_rows(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
 
-df_restaurant = df_restaurant.merge(agg, on='business_id', how='left')
-df_restaurant['all_reviews'] = df_restaurant['all_reviews'].fillna('')
 
-# Build textual tags
-df_restaurant['tags'] = (
-        df_restaurant['categories'] + ' '
-        + df_restaurant['location'] + ' '
-        + df_restaurant['all_reviews']
-).str.lower()
+df_restaurant = df_restaurant.reset_index(drop=True)
+n = len(df_restaurant)
+row_of = pd.Series(np.arange(n), index=df_restaurant['business_id'])
+row_of = row_of[~row_of.index.duplicated()]
 
-# Stemming
+# Build textual tags (the review text is in the embeddings, not in the tags)
 ps = PorterStemmer()
-df_restaurant['tags'] = df_restaurant['tags'].apply(
+meta_texts = (df_restaurant['categories'] + ' ' + df_restaurant['location']).str.lower()
+df_restaurant['tags'] = meta_texts.apply(
     lambda txt: ' '.join(ps.stem(w) for w in txt.split())
 )
 
@@ -87,15 +118,51 @@ new_df = df_restaurant[[
     'tags'
 ]].copy()
 
-# Sentence-BERT
-print("Encoding with Sentence-BERT…")
-sbert = SentenceTransformer('all-MiniLM-L6-v2')
-
-vectors = sbert.encode(
-    new_df['tags'].tolist(),
-    show_progress_bar=True,
-    convert_to_numpy=True
-)
+# Sentence-BERT embedding of every English review, pooled per restaurant chunk by chunk.
+# Reviews already in the embedding cache are not encoded again, the others are sharded over
+# SBERT_WORKERS processes and added to the cache after every chunk, so an interrupted build
+# resumes from the cache.
+print(f"Encoding reviews with Sentence-BERT ({inference.BACKEND} backend), pooling: {','.join(POOLING)}")
+cache = EmbeddingCache(SBERT_MODEL, variant="" if inference.BACKEND == "torch" else inference.BACKEND)
+encoder = ParallelEncoder(SBERT_MODEL, checkpoint_dir=None)
+sums = None
+weight_sums = np.zeros(n)
+n_reviews = 0
+try:
+    for chunk in iter_table(REVIEWS_PATH, CHUNK_SIZE):
+        texts = chunk['text'].apply(extract_english_text)
+        rows = chunk['business_id'].map(row_of)
+        keep = (texts.astype(bool) & rows.notna()).to_numpy()
+        if not keep.any():
+            continue
+        chunk, texts, rows = chunk[keep], texts[keep].tolist(), rows[keep].astype(int).to_numpy()
+
+        embeddings = normalize_rows(cache.encode(texts, encoder.encode))
+        weights = review_weights(chunk)
+        # weighted sum of the review embeddings of every restaurant in the chunk
+        indicator = sp.csr_matrix((weights, (rows, np.arange(len(rows)))), shape=(n, len(rows)))
+        pooled = indicator @ embeddings
+        sums = pooled if sums is None else sums + pooled
+        weight_sums += np.bincount(rows, weights, minlength=n)
+        n_reviews += len(texts)
+        print(f"Pooled {n_reviews} reviews ({cache.hits} cached, {cache.encoded} encoded in this chunk)")
+
+    meta_vectors = normalize_rows(cache.encode(meta_texts.tolist(), encoder.encode))
+finally:
+    encoder.close()
+encoder.report()
+# one shard per chunk would slow down the lookups of later builds
+cache.compact()
+
+# weighted mean of the reviews, mixed with the categories and location; restaurants without
+# reviews only have the latter
+vectors = meta_vectors
+if sums is not None:
+    has_reviews = weight_sums > 0
+    review_vectors = normalize_rows(sums[has_reviews] / weight_sums[has_reviews, None])
+    vectors = meta_vectors.copy()
+    vectors[has_reviews] = normalize_rows((1 - META_WEIGHT) * review_vectors + META_WEIGHT * meta_vectors[has_reviews])
+    print(f"{int(has_reviews.sum())} of {n} restaurants have reviews")
 
 # map price range to number
 price_num = new_df['PriceRange'].apply(len).values.reshape(-1, 1)
@@ -112,11 +179,20 @@ num_scaled = scaler.fit_transform(num_feats)
 
 # combine text and numerical features
 combined_feats = np.hstack([vectors, num_scaled])
-similarity = cosine_similarity(combined_feats)
+# scored block by block, the features are dense so they all go in as the extra columns
+indices, scores = top_k_neighbors(sp.csr_matrix((n, 0), dtype=np.float32), combined_feats, TOP_K)
 
 # Persist models and data
 os.makedirs('models_sbert', exist_ok=True)
-pickle.dump(similarity, open('models_sbert/restaurant_similarity_sbert.pkl', 'wb'))
+if n <= SIMILARITY_MAX_ROWS:
+    pickle.dump(cosine_similarity(combined_feats), open('models_sbert/restaurant_similarity_sbert.pkl', 'wb'))
+else:
+    print(f"{n} restaurants, more than SBERT_SIMILARITY_MAX_ROWS={SIMILARITY_MAX_ROWS}: "
+          f"no dense similarity matrix, only the top {indices.shape[1]} neighbors")
+    # a similarity matrix of an earlier build would not match the new rows
+    if os.path.exists('models_sbert/restaurant_similarity_sbert.pkl'):
+        os.remove('models_sbert/restaurant_similarity_sbert.pkl')
+pickle.dump({"indices": indices, "scores": scores}, open(NEIGHBORS_PKL, 'wb'))
 pickle.dump(new_df, open('models_sbert/restaurant_info_sbert.pkl', 'wb'))
 pickle.dump(vectors, open('models_sbert/restaurant_embeddings_sbert.pkl', 'wb'))
 print("Saved SBERT models to models_sbert/")
@@ -128,10 +204,7 @@ def recommend(restaurant_name):
         print("Restaurant not found. Please check the name.")
         return
     idx = new_df.index[new_df['restaurant_name'] == restaurant_name][0]
-    sims = sorted(
-        list(enumerate(similarity[idx])),
-        key=lambda x: x[1], reverse=True
-    )[1:11]
+    sims = zip(indices[idx][:10], scores[idx][:10])
     print(f"Restaurants similar to '{restaurant_name}':")
     for i, score in sims:
         rec = new_df.iloc[i]
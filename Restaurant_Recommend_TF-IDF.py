@@ -1,5 +1,6 @@
 import os
 import ast
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 from nltk.stem.porter import PorterStemmer
@@ -7,9 +8,26 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics.pairwise import cosine_similarity
 import pickle
+from data_io import iter_table, read_table
+from sparse_tfidf import NEIGHBORS_PKL, TOP_K, fit_tfidf, group_sum, hashing_vectorizer, top_k_neighbors
+
+# Input tables, can be pointed at other (e.g. synthetic) data in xlsx, csv or parquet
+RESULTS_PATH = os.environ.get("RESULTS_PATH", "data/results.xlsx")
+REVIEWS_PATH = os.environ.get("REVIEWS_PATH", "data/yelp_reviews.xlsx")
+
+# "dense" builds everything in memory, "streaming" reads the reviews in chunks of CHUNK_SIZE rows
+# and keeps the vectors sparse, with top-K neighbors instead of the full similarity matrix
+TFIDF_BUILD = os.environ.get("TFIDF_BUILD", "dense")
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 500000))
+# review text kept per restaurant in the tags of a streaming build
+TAG_MAX_CHARS = int(os.environ.get("TFIDF_TAG_MAX_CHARS", 20000))
+MAX_FEATURES = 5000
+
+if TFIDF_BUILD not in ("dense", "streaming"):
+    raise ValueError(f"Unknown TFIDF_BUILD '{TFIDF_BUILD}', use dense or streaming")
 
 # Read restaurant basic information and validate required columns
-df = pd.read_excel("data/results.xlsx")
+df = read_table(RESULTS_PATH)
 if 'BizId' in df.columns:
     df.rename(columns={'BizId': 'business_id'}, inplace=True)
 
@@ -17,7 +35,7 @@ required_cols = {'ReviewCount', 'Ranking'}
 missing = required_cols - set(df.columns)
 if missing:
     raise KeyError(
-        f"results.xlsx is missing required column(s): {', '.join(missing)}"
+        f"{RESULTS_PATH} is missing required column(s): {', '.join(missing)}"
     )
 
 # Basic restaurant information
@@ -41,8 +59,7 @@ for col in ['categories', 'PriceRange', 'Rating',
             'review_count', 'ranking']:
     df_restaurant[col] = df_restaurant[col].astype(str)
 
-# Read review file and aggregate English reviews
-reviews = pd.read_excel("data/yelp_reviews.xlsx")
+ps = PorterStemmer()
 
 
 def extract_english_text(cell):
@@ -53,73 +70,157 @@ def extract_english_text(cell):
         return ''
 
 
-reviews['text'] = reviews['text'].apply(extract_english_text)
-reviews = reviews[reviews['text'].astype(bool)].copy()
-
-agg = (reviews
-       .groupby('business_id')['text']
-       .apply(lambda seg: ' '.join(seg))
-       .reset_index()
-       .rename(columns={'text': 'all_reviews'}))
-df_restaurant = df_restaurant.merge(agg, on='business_id', how='left')
-df_restaurant['all_reviews'] = df_restaurant['all_reviews'].fillna('')
-
-# Build textual tags
-df_restaurant['tags'] = (
-        df_restaurant['categories'] + ' '
-        + df_restaurant['location'] + ' '
-        + df_restaurant['all_reviews']
-).str.lower()
-
-# Stemming
-ps = PorterStemmer()
-df_restaurant['tags'] = df_restaurant['tags'].apply(
-    lambda txt: ' '.join(ps.stem(w) for w in txt.split())
-)
-
-# Working DataFrame including new features
-new_df = df_restaurant[[
-    'restaurant_name',
-    'PriceRange',
-    'Rating',
-    'review_count',
-    'ranking',
-    'tags'
-]].copy()
-
-# TF–IDF vectorization
-tfidf = TfidfVectorizer(max_features=5000, stop_words='english')
-vectors = tfidf.fit_transform(new_df['tags']).toarray()
-
-# map price range to number
-price_num = new_df['PriceRange'].apply(lambda x: len(x)).values.reshape(-1, 1)
-rating_num = new_df['Rating'].astype(float).values.reshape(-1, 1)
-review_num = new_df['review_count'].astype(int).values.reshape(-1, 1)
-rank_num = new_df['ranking'].astype(int).values.reshape(-1, 1)
-
-# concatenate all numerical columns
-num_feats = np.hstack([price_num, rating_num, review_num, rank_num])
-
-# standardize
-scaler = StandardScaler()
-num_scaled = scaler.fit_transform(num_feats)
-
-# combine text and numerical features
-combined_feats = np.hstack([vectors, num_scaled])
-similarity = cosine_similarity(combined_feats)
-
-# Persist models and data
-os.makedirs('models', exist_ok=True)
-pickle.dump(similarity, open('models/restaurant_similarity.pkl', 'wb'))
-pickle.dump(new_df, open('models/restaurant_info.pkl', 'wb'))
-pickle.dump(tfidf, open('models/tfidf_vectorizer.pkl', 'wb'))
-pickle.dump(vectors, open('models/restaurant_vectors.pkl', 'wb'))
+# standardized numerical features: price range, rating, review count and ranking
+def numeric_features(new_df):
+    price_num = new_df['PriceRange'].apply(lambda x: len(x)).values.reshape(-1, 1)
+    rating_num = new_df['Rating'].astype(float).values.reshape(-1, 1)
+    review_num = new_df['review_count'].astype(int).values.reshape(-1, 1)
+    rank_num = new_df['ranking'].astype(int).values.reshape(-1, 1)
+
+    # concatenate all numerical columns
+    num_feats = np.hstack([price_num, rating_num, review_num, rank_num])
+
+    # standardize
+    scaler = StandardScaler()
+    return scaler.fit_transform(num_feats)
+
+
+def build_dense(df_restaurant):
+    # Read review file and aggregate English reviews
+    reviews = read_table(REVIEWS_PATH)
+    reviews['text'] = reviews['text'].apply(extract_english_text)
+    reviews = reviews[reviews['text'].astype(bool)].copy()
+
+    agg = (reviews
+           .groupby('business_id')['text']
+           .apply(lambda seg: ' '.join(seg))
+           .reset_index()
+           .rename(columns={'text': 'all_reviews'}))
+    df_restaurant = df_restaurant.merge(agg, on='business_id', how='left')
+    df_restaurant['all_reviews'] = df_restaurant['all_reviews'].fillna('')
+
+    # Build textual tags
+    df_restaurant['tags'] = (
+            df_restaurant['categories'] + ' '
+            + df_restaurant['location'] + ' '
+            + df_restaurant['all_reviews']
+    ).str.lower()
+
+    # Stemming
+    df_restaurant['tags'] = df_restaurant['tags'].apply(
+        lambda txt: ' '.join(ps.stem(w) for w in txt.split())
+    )
 
-print("Saved models:")
-print(" - models/restaurant_similarity.pkl")
-print(" - models/restaurant_info.pkl")
-print(" - models/tfidf_vectorizer.pkl")
-print(" - models/restaurant_vectors.pkl")
+    # Working DataFrame including new features
+    new_df = df_restaurant[[
+        'restaurant_name',
+        'PriceRange',
+        'Rating',
+        'review_count',
+        'ranking',
+        'tags'
+    ]].copy()
+
+    # TF–IDF vectorization
+    tfidf = TfidfVectorizer(max_features=MAX_FEATURES, stop_words='english')
+    vectors = tfidf.fit_transform(new_df['tags']).toarray()
+
+    # combine text and numerical features
+    combined_feats = np.hstack([vectors, numeric_features(new_df)])
+    similarity = cosine_similarity(combined_feats)
+
+    # Persist models and data
+    os.makedirs('models', exist_ok=True)
+    pickle.dump(similarity, open('models/restaurant_similarity.pkl', 'wb'))
+    pickle.dump(new_df, open('models/restaurant_info.pkl', 'wb'))
+    pickle.dump(tfidf, open('models/tfidf_vectorizer.pkl', 'wb'))
+    pickle.dump(vectors, open('models/restaurant_vectors.pkl', 'wb'))
+
+    print("Saved models:")
+    print(" - models/restaurant_similarity.pkl")
+    print(" - models/restaurant_info.pkl")
+    print(" - models/tfidf_vectorizer.pkl")
+    print(" - models/restaurant_vectors.pkl")
+
+    def most_similar(idx):
+        return sorted(
+            list(enumerate(similarity[idx])),
+            key=lambda x: x[1], reverse=True
+        )[1:11]
+    return new_df, most_similar
+
+
+def build_streaming(df_restaurant):
+    # the same word is stemmed over and over across millions of reviews
+    stem = lru_cache(maxsize=2 ** 20)(ps.stem)
+
+    def stem_text(txt):
+        return ' '.join(stem(w) for w in txt.lower().split())
+
+    df_restaurant = df_restaurant.reset_index(drop=True)
+    n = len(df_restaurant)
+    ids = df_restaurant['business_id']
+    row_of = pd.Series(np.arange(n), index=ids)
+    row_of = row_of[~row_of.index.duplicated()]
+
+    # categories and location first, then the hashed counts of every review chunk
+    hasher = hashing_vectorizer()
+    tags = [stem_text(f"{c} {loc}") for c, loc in zip(df_restaurant['categories'], df_restaurant['location'])]
+    counts = hasher.transform(tags).tocsr()
+    n_reviews = 0
+    for chunk in iter_table(REVIEWS_PATH, CHUNK_SIZE, columns=['business_id', 'text']):
+        texts = chunk['text'].apply(extract_english_text)
+        rows = chunk['business_id'].map(row_of)
+        keep = (texts.astype(bool) & rows.notna()).to_numpy()
+        texts = [stem_text(t) for t in texts[keep]]
+        rows = rows[keep].astype(int).to_numpy()
+        counts = counts + group_sum(rows, hasher.transform(texts), n)
+        n_reviews += len(texts)
+
+        # the tags keep the first TAG_MAX_CHARS characters of review text of every restaurant
+        for row, text in zip(rows, texts):
+            if len(tags[row]) < TAG_MAX_CHARS:
+                tags[row] = f"{tags[row]} {text}"[:TAG_MAX_CHARS]
+        print(f"Counted {n_reviews} English reviews, {counts.nnz} nonzero counts")
+
+    df_restaurant['tags'] = tags
+    new_df = df_restaurant[[
+        'restaurant_name',
+        'PriceRange',
+        'Rating',
+        'review_count',
+        'ranking',
+        'tags'
+    ]].copy()
+
+    tfidf, vectors = fit_tfidf(counts, MAX_FEATURES)
+    indices, scores = top_k_neighbors(vectors, numeric_features(new_df), TOP_K)
+
+    os.makedirs('models', exist_ok=True)
+    pickle.dump(new_df, open('models/restaurant_info.pkl', 'wb'))
+    pickle.dump(tfidf, open('models/tfidf_vectorizer.pkl', 'wb'))
+    pickle.dump(vectors, open('models/restaurant_vectors.pkl', 'wb'))
+    pickle.dump({"indices": indices, "scores": scores}, open(NEIGHBORS_PKL, 'wb'))
+    # a similarity matrix of an earlier dense build would not match the new rows
+    if os.path.exists('models/restaurant_similarity.pkl'):
+        os.remove('models/restaurant_similarity.pkl')
+        print("Removed the dense models/restaurant_similarity.pkl of an earlier build")
+
+    print("Saved models:")
+    print(" - models/restaurant_info.pkl")
+    print(" - models/tfidf_vectorizer.pkl")
+    print(" - models/restaurant_vectors.pkl (sparse)")
+    print(f" - {NEIGHBORS_PKL} (top {indices.shape[1]} neighbors)")
+
+    def most_similar(idx):
+        return list(zip(indices[idx][:10], scores[idx][:10]))
+    return new_df, most_similar
+
+
+if TFIDF_BUILD == "streaming":
+    new_df, most_similar = build_streaming(df_restaurant)
+else:
+    new_df, most_similar = build_dense(df_restaurant)
 
 
 # Example recommendation function
@@ -128,10 +229,7 @@ def recommend(restaurant_name):
         print("Restaurant not found. Please check the name.")
         return
     idx = new_df.index[new_df['restaurant_name'] == restaurant_name][0]
-    sims = sorted(
-        list(enumerate(similarity[idx])),
-        key=lambda x: x[1], reverse=True
-    )[1:11]
+    sims = most_similar(idx)
     print(f"Restaurants similar to '{restaurant_name}':")
     for i, score in sims:
         rec = new_df.iloc[i]
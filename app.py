@@ -1,9 +1,19 @@
-from flask import Flask, request, jsonify, render_template
-from recommender import recommend, recommend_by_name, load_models, new_df
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+import metrics
+import profiling
+import recommender
+from metrics import error_count, span, timed
+from recommender import recommend, recommend_by_name, load_models
+from name_index import NameIndex
+from prompt_context import build_prompt, build_prompt_context
+from single_flight import single_flight
+from scene_index import SCENES
 import pandas as pd
 import requests
 import json
 import datetime
+import gzip
+import hmac
 import os
 import pickle
 import sys
@@ -24,8 +34,20 @@ load_dotenv()
 app = Flask(__name__)
 
 # Gemini API configuration
-GEMINI_API_KEY = "your_here_api_key_here"
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "your_here_api_key_here")
+GEMINI_MODEL_URL = os.environ.get(
+    "GEMINI_MODEL_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash")
+GEMINI_API_URL = f"{GEMINI_MODEL_URL}:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_MODEL_URL}:streamGenerateContent?alt=sse"
+
+# weather and traffic API endpoints, can be pointed at local stand-ins
+WEATHER_API_URL = os.environ.get("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+HERE_ROUTER_URL = os.environ.get("HERE_ROUTER_URL", "https://router.hereapi.com/v8/routes")
+
+# token required by admin endpoints (disabled when not set)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+CATEGORIZED_PKL = "models/categorized_restaurants.pkl"
 
 # load restaurant location data
 try:
@@ -63,7 +85,8 @@ try:
                     location_map[name] = {
                         'latitude': lat,
                         'longitude': lng,
-                        'address': row.get('Address', '')
+                        'address': row.get('Address', ''),
+                        'neighborhood': row.get('Neighborhoods_0', '')
                     }
                     valid_coords += 1
                 else:
@@ -83,31 +106,84 @@ except Exception as e:
     location_map = {}
 
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # streamed responses are timed until the response starts, not until the stream ends
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_count.inc(endpoint, request.method, str(response.status_code))
+    if "request_start" in g:
+        metrics.request_latency.observe(time.perf_counter() - g.request_start, endpoint)
+    return response
+
+
+@app.before_request
+def start_request_profile():
+    requested = profiling.profile_flag(request.headers, request.args) and is_admin_request()
+    g.profile = profiling.start_profile(profiling.choose_reason(requested))
+
+
+@app.after_request
+def finish_request_profile(response):
+    profile = g.pop("profile", None)
+    profile_name = profiling.finish_profile(profile, request.method, request.path, response.status_code)
+    if profile_name and profile.reason == "requested":
+        response.headers["X-Profile-File"] = profile_name
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route("/")
 def index():
     # render UI with map and input box
     return render_template("index.html")
 
 
+# read a bounded integer query parameter
+def get_int_arg(name, default, minimum=0, maximum=None):
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    value = max(value, minimum)
+    return min(value, maximum) if maximum is not None else value
+
+
 @app.route("/api/restaurants")
 def get_restaurants():
-    # return all restaurants list for selection
-    restaurants = new_df['restaurant_name'].tolist()
-    return jsonify({"restaurants": restaurants})
+    # return one page of the restaurants list
+    offset = get_int_arg("offset", 0)
+    limit = get_int_arg("limit", 50, minimum=1, maximum=500)
+    return jsonify({
+        "restaurants": name_index.page(offset, limit),
+        "total": len(name_index),
+        "offset": offset,
+        "limit": limit
+    })
 
 
-@app.route("/api/recommend_by_name")
-def api_recommend_by_name():
-    # recommend by restaurant name
-    restaurant_name = request.args.get("name", "")
-    if not restaurant_name:
-        return jsonify({"error": "Please provide restaurant name", "data": []})
+@app.route("/api/restaurants/search")
+def search_restaurants():
+    # autocomplete restaurant names by prefix, tolerating small typos
+    q = request.args.get("q", "")
+    limit = get_int_arg("limit", 10, minimum=1, maximum=50)
+    return jsonify({"restaurants": name_index.search(q, limit)})
 
-    # call recommend by name function
-    results = recommend_by_name(restaurant_name)
 
-    # build return data
+# build /api/recommend_by_name response items from (name, score) pairs
+@timed("enrichment")
+def build_name_recommendations(results):
     response_data = []
+    new_df = recommender.models.new_df
     for name, score in results:
         restaurant_data = new_df[new_df['restaurant_name'] == name].iloc[0]
         data = {
@@ -120,14 +196,69 @@ def api_recommend_by_name():
         }
 
         # add location data (if available)
-        if name in location_map:
-            data['latitude'] = location_map[name]['latitude']
-            data['longitude'] = location_map[name]['longitude']
-            data['address'] = location_map[name]['address']
+        add_location_info(data)
 
         response_data.append(data)
+    return response_data
 
-    return jsonify({"data": response_data})
+
+# add location data and review counts to /api/recommend results
+@timed("enrichment")
+def enrich_recommendations(results):
+    new_df = recommender.models.new_df
+    for item in results:
+        add_location_info(item)
+
+        # ensure reviews field exists
+        if 'reviews' not in item:
+            # get review count from new_df
+            restaurant_data = new_df[new_df['restaurant_name'] == item['name']]
+            if not restaurant_data.empty:
+                review_count = restaurant_data.iloc[0].get('review_count', '0')
+                item['reviews'] = int(review_count) if str(review_count).isdigit() else 0
+    return results
+
+
+# version of the loaded models, "" if they could not be loaded
+def model_version():
+    return getattr(recommender.models, "version", "")
+
+
+# expose result cache hit/miss and the model version in response headers
+def set_cache_headers(response, cache_info):
+    if "status" in cache_info:
+        response.headers["X-Cache"] = cache_info["status"]
+    response.headers["X-Model-Version"] = model_version()
+    return response
+
+
+@app.route("/api/recommend_by_name")
+def api_recommend_by_name():
+    # recommend by restaurant name
+    restaurant_name = request.args.get("name", "")
+    if not restaurant_name:
+        return jsonify({"error": "Please provide restaurant name", "data": []})
+
+    # call recommend by name function
+    cache_info = {}
+    results = recommend_by_name(restaurant_name, cache_info)
+
+    # build return data
+    response = jsonify({"data": build_name_recommendations(results)})
+    return set_cache_headers(response, cache_info)
+
+
+# scene name from a request value, None if missing or unknown
+def parse_scene(value):
+    return value if value in SCENES else None
+
+
+SCENE_UNAVAILABLE = "Scene filtering is unavailable, the scene index has not been built (run restaurant_type.py)"
+
+
+# a known scene was asked for, but there is no scene index to filter by
+def scene_unavailable(scene):
+    return scene is not None and getattr(recommender.models, "scene_index", None) is None
 
 
 @app.route("/api/recommend")
@@ -136,179 +267,204 @@ def api_recommend():
     q = request.args.get("query", "")
     if not q:
         return jsonify({"error": "Please provide query content", "data": []})
+    scene = parse_scene(request.args.get("scene"))
+    if request.args.get("scene") and scene is None:
+        return jsonify({"error": f"Unknown scene, choose from {', '.join(SCENES)}", "data": []})
+    if scene_unavailable(scene):
+        return jsonify({"error": SCENE_UNAVAILABLE, "data": []}), 503
 
-    # call recommend function
-    keywords, results = recommend(q)
+    # call recommend function, only among the scene's restaurants if a scene is given
+    cache_info = {}
+    keywords, results = recommend(q, cache_info, scene)
 
-    # add location data
-    for item in results:
-        if item['name'] in location_map:
-            item['latitude'] = location_map[item['name']]['latitude']
-            item['longitude'] = location_map[item['name']]['longitude']
-            item['address'] = location_map[item['name']]['address']
+    # add location data, no longer return keywords
+    response = jsonify({"data": enrich_recommendations(results)})
+    return set_cache_headers(response, cache_info)
 
-        # ensure reviews field exists
-        if 'reviews' not in item:
-            # get review count from new_df
-            restaurant_data = new_df[new_df['restaurant_name'] == item['name']]
-            if not restaurant_data.empty:
-                review_count = restaurant_data.iloc[0].get('review_count', '0')
-                item['reviews'] = int(review_count) if str(review_count).isdigit() else 0
 
-    # no longer return keywords
-    return jsonify({"data": results})
+UNKNOWN_WEATHER = {"description": "Unknown", "temperature": 20}
+UNKNOWN_TRAFFIC = {"duration_min": None, "jam_factor": None}
+
+
+# build OpenWeatherMap request url and params, None if the API key is not set
+def build_weather_request(lat, lng):
+    # use OpenWeatherMap API key from environment variables
+    WEATHER_API_KEY = os.environ.get("WEATHER_API_KEY")
+
+    # If API key is not set or is the default value, log a warning
+    if not WEATHER_API_KEY or WEATHER_API_KEY == "your_openweathermap_api_key_here":
+        print("WARNING: WEATHER_API_KEY not properly set in environment variables")
+        return None
 
+    params = {"lat": lat, "lon": lng, "units": "metric", "appid": WEATHER_API_KEY}
+    return WEATHER_API_URL, params
 
-# get weather data function
+
+# parse OpenWeatherMap response data
+def parse_weather(data):
+    print(f"Weather data: {data['weather'][0]['description']}, temperature: {data['main']['temp']}°C")
+    return {
+        "description": data["weather"][0]["description"],
+        "temperature": data["main"]["temp"],
+        "feels_like": data["main"]["feels_like"],
+        "humidity": data["main"]["humidity"],
+        "wind_speed": data["wind"]["speed"],
+        "icon": data["weather"][0]["icon"]
+    }
+
+
+# get weather data function, concurrent requests for the same place share one API call
+@single_flight("weather", copy=dict)
+@timed("weather")
 def get_weather(lat, lng):
     try:
-        # use OpenWeatherMap API key from environment variables
-        WEATHER_API_KEY = os.environ.get("WEATHER_API_KEY")
-        
-        # If API key is not set or is the default value, log a warning
-        if not WEATHER_API_KEY or WEATHER_API_KEY == "your_openweathermap_api_key_here":
-            print("WARNING: WEATHER_API_KEY not properly set in environment variables")
-            return {"description": "Unknown", "temperature": 20}
-            
+        weather_request = build_weather_request(lat, lng)
+        if weather_request is None:
+            return dict(UNKNOWN_WEATHER)
+
         # use OpenWeatherMap API to get weather data
-        weather_api_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lng}&units=metric&appid={WEATHER_API_KEY}"
-        print(f"Requesting weather data: {weather_api_url}")
+        weather_api_url, params = weather_request
+        print(f"Requesting weather data: {weather_api_url} with lat={lat}, lon={lng}")
 
         # add timeout setting to avoid long waiting
-        response = requests.get(weather_api_url, timeout=5)
+        response = requests.get(weather_api_url, params=params, timeout=5)
         print(f"Weather API response status code: {response.status_code}")
 
         if response.status_code == 200:
-            data = response.json()
-            print(f"Weather data: {data['weather'][0]['description']}, temperature: {data['main']['temp']}°C")
-            return {
-                "description": data["weather"][0]["description"],
-                "temperature": data["main"]["temp"],
-                "feels_like": data["main"]["feels_like"],
-                "humidity": data["main"]["humidity"],
-                "wind_speed": data["wind"]["speed"],
-                "icon": data["weather"][0]["icon"]
-            }
+            return parse_weather(response.json())
         else:
             print(f"Weather API response error content: {response.text}")
-            return {"description": "Unknown", "temperature": 20}
+            error_count.inc("weather")
+            return dict(UNKNOWN_WEATHER)
     except requests.exceptions.Timeout:
         print("Weather API request timeout")
-        return {"description": "Unknown", "temperature": 20}
+        error_count.inc("weather")
+        return dict(UNKNOWN_WEATHER)
     except requests.exceptions.RequestException as e:
         print(f"Weather API request exception: {str(e)}")
-        return {"description": "Unknown", "temperature": 20}
+        error_count.inc("weather")
+        return dict(UNKNOWN_WEATHER)
     except Exception as e:
         print(f"Failed to get weather data: {str(e)}")
+        error_count.inc("weather")
         import traceback
         traceback.print_exc()
-        return {"description": "Unknown", "temperature": 20}
+        return dict(UNKNOWN_WEATHER)
+
+
+# build HERE Routing API v8 request url and params, None if the API key is not set
+def build_route_request(origin_lat, origin_lon, dest_lat, dest_lon):
+    # Use HERE API key from environment variables
+    HERE_KEY = os.environ.get("HERE_API_KEY")
+
+    # If API key is not set or is the default value, log a warning
+    if not HERE_KEY or HERE_KEY == "your_here_api_key_here":
+        print("WARNING: HERE_API_KEY not properly set in environment variables")
+        return None
+
+    params = {
+        "transportMode": "car",
+        "origin": f"{origin_lat},{origin_lon}",
+        "destination": f"{dest_lat},{dest_lon}",
+        "return": "summary,travelSummary",
+        "traffic": "true",
+        "apikey": HERE_KEY
+    }
+    return HERE_ROUTER_URL, params
 
 
-# get real-time traffic route information function
+# parse HERE Routing API response data
+def parse_route_traffic(data):
+    # Extract relevant information from response
+    route_summary = data['routes'][0]['sections'][0]['summary']
+
+    duration = route_summary.get('duration', 0)  # seconds
+    base_duration = route_summary.get('baseDuration', 0)  # seconds without traffic
+    jam_factor = route_summary.get('jamFactor', 0)  # 0-10 scale
+
+    # Convert duration to minutes
+    duration_min = round(duration / 60)
+
+    # Create traffic info
+    traffic_info = {
+        "duration": duration,
+        "duration_min": duration_min,
+        "base_duration": base_duration,
+        "jam_factor": jam_factor
+    }
+
+    print(f"Traffic data: jam factor {jam_factor}/10, estimated travel time {duration_min} minutes")
+    return traffic_info
+
+
+# get real-time traffic route information function, concurrent requests for the same route share one API call
+@single_flight("traffic", copy=dict)
+@timed("traffic")
 def get_route_traffic(origin_lat, origin_lon, dest_lat, dest_lon):
     try:
-        # Use HERE API key from environment variables
-        HERE_KEY = os.environ.get("HERE_API_KEY")
-        
-        # If API key is not set or is the default value, log a warning
-        if not HERE_KEY or HERE_KEY == "your_here_api_key_here":
-            print("WARNING: HERE_API_KEY not properly set in environment variables")
-            return {"duration_min": None, "jam_factor": None}
-        
+        route_request = build_route_request(origin_lat, origin_lon, dest_lat, dest_lon)
+        if route_request is None:
+            return dict(UNKNOWN_TRAFFIC)
+
         # Call HERE Routing API v8
-        url = "https://router.hereapi.com/v8/routes"
-        params = {
-            "transportMode": "car",
-            "origin": f"{origin_lat},{origin_lon}",
-            "destination": f"{dest_lat},{dest_lon}",
-            "return": "summary,travelSummary",
-            "traffic": "true",
-            "apikey": HERE_KEY
-        }
-        
+        url, params = route_request
         print(f"Requesting HERE route data: {url} with origin={origin_lat},{origin_lon}, dest={dest_lat},{dest_lon}")
-        
+
         # Add timeout to avoid long waiting
         response = requests.get(url, params=params, timeout=5)
         print(f"HERE API response status code: {response.status_code}")
-        
+
         if response.status_code == 200:
-            data = response.json()
-            
-            # Extract relevant information from response
-            route_summary = data['routes'][0]['sections'][0]['summary']
-            
-            duration = route_summary.get('duration', 0)  # seconds
-            base_duration = route_summary.get('baseDuration', 0)  # seconds without traffic
-            jam_factor = route_summary.get('jamFactor', 0)  # 0-10 scale
-            
-            # Convert duration to minutes
-            duration_min = round(duration / 60)
-            
-            # Create traffic info
-            traffic_info = {
-                "duration": duration,
-                "duration_min": duration_min,
-                "base_duration": base_duration,
-                "jam_factor": jam_factor
-            }
-            
-            print(f"Traffic data: jam factor {jam_factor}/10, estimated travel time {duration_min} minutes")
-            return traffic_info
+            return parse_route_traffic(response.json())
         else:
             print(f"HERE API response error content: {response.text}")
-            return {"duration_min": None, "jam_factor": None}
+            error_count.inc("traffic")
+            return dict(UNKNOWN_TRAFFIC)
     except requests.exceptions.Timeout:
         print("HERE API request timeout")
-        return {"duration_min": None, "jam_factor": None}
+        error_count.inc("traffic")
+        return dict(UNKNOWN_TRAFFIC)
     except requests.exceptions.RequestException as e:
         print(f"HERE API request exception: {str(e)}")
-        return {"duration_min": None, "jam_factor": None}
+        error_count.inc("traffic")
+        return dict(UNKNOWN_TRAFFIC)
     except Exception as e:
         print(f"Failed to get route traffic data: {str(e)}")
+        error_count.inc("traffic")
         import traceback
         traceback.print_exc()
-        return {"duration_min": None, "jam_factor": None}
+        return dict(UNKNOWN_TRAFFIC)
 
 
-@app.route("/api/chatbot", methods=["POST"])
-def chatbot():
-    data = request.json
-    user_message = data.get("message", "")
-    user_lat = data.get("latitude")
-    user_lng = data.get("longitude")
+# add location data to a recommended restaurant (if available)
+def add_location_info(item):
+    if item['name'] in location_map:
+        item['latitude'] = location_map[item['name']]['latitude']
+        item['longitude'] = location_map[item['name']]['longitude']
+        item['address'] = location_map[item['name']]['address']
 
-    # get categorized restaurant data
-    categorized_restaurants = data.get("categorized_restaurants", {})
-    if categorized_restaurants:
-        category_counts = {cat: len(rest) for cat, rest in categorized_restaurants.items()}
-        print(f"Received chat request, including categorized restaurant data: {category_counts}")
 
-    # call recommend function to get keywords and recommendations
-    keywords, recommendations = recommend(user_message)
+# add real-time traffic information from the user location to each recommendation
+def add_traffic_info(recommendations, user_lat, user_lng):
+    if not (user_lat and user_lng):
+        return
 
-    # add location data and traffic info
     for item in recommendations:
-        if item['name'] in location_map:
-            item['latitude'] = location_map[item['name']]['latitude']
-            item['longitude'] = location_map[item['name']]['longitude']
-            item['address'] = location_map[item['name']]['address']
-            
-            # Add real-time traffic information if user location is available
-            if user_lat and user_lng and item['latitude'] and item['longitude']:
-                try:
-                    traffic_info = get_route_traffic(
-                        user_lat, user_lng, 
-                        item['latitude'], item['longitude']
-                    )
-                    item['traffic'] = traffic_info
-                except Exception as e:
-                    print(f"Error getting traffic data for {item['name']}: {str(e)}")
-                    item['traffic'] = {"duration_min": None, "jam_factor": None}
-
-    # get weather data
-    weather = {"description": "Unknown", "temperature": 20}
+        if item.get('latitude') and item.get('longitude'):
+            try:
+                traffic_info = get_route_traffic(
+                    user_lat, user_lng,
+                    item['latitude'], item['longitude']
+                )
+                item['traffic'] = traffic_info
+            except Exception as e:
+                print(f"Error getting traffic data for {item['name']}: {str(e)}")
+                item['traffic'] = dict(UNKNOWN_TRAFFIC)
+
+
+# get weather data and its prompt description for the user location
+def get_weather_info(user_lat, user_lng):
+    weather = dict(UNKNOWN_WEATHER)
     weather_info = "Weather information is temporarily unavailable"
     if user_lat and user_lng:
         try:
@@ -317,119 +473,19 @@ def chatbot():
         except Exception as e:
             print(f"Error processing weather data: {str(e)}")
             weather_info = "Weather information is temporarily unavailable"
+    return weather, weather_info
 
-    # get current time
-    now = datetime.datetime.now()
-    time_of_day = "morning"
-    if 12 <= now.hour < 18:
-        time_of_day = "afternoon"
-    elif now.hour >= 18:
-        time_of_day = "evening"
-
-    # build prompt
-    prompt = f"""
-        You are a restaurant recommendation assistant. You need to help users choose the most suitable restaurant.
 
-        Current situation:
-        - User message: "{user_message}"
-        - Current time: {now.strftime('%Y-%m-%d %H:%M')}, {time_of_day}
-        - {weather_info}
+# build the Gemini prompt from the recommendations and the current conditions, the scene
+# summary comes from the prompt context cached for the current model version
+def build_chat_prompt(user_message, recommendations, weather, weather_info,
+                      scene, user_lat, user_lng):
+    return build_prompt(chat_context, user_message, recommendations, weather, weather_info,
+                        scene, user_lat, user_lng)
 
-        The system has recommended the following restaurants based on the user's question:
-        """
 
-    if not recommendations:
-        prompt += "No matching restaurants found.\n"
-    else:
-        for i, rest in enumerate(recommendations):
-            location_info = ""
-            traffic_info = ""
-            
-            if user_lat and user_lng and 'latitude' in rest and 'longitude' in rest:
-                # calculate simple linear distance, only for reference
-                distance = ((rest['latitude'] - user_lat) ** 2 + (rest['longitude'] - user_lng) ** 2) ** 0.5
-                # convert to approximately kilometers
-                distance_km = distance * 111
-                location_info = f", approximately {distance_km:.1f} kilometers away"
-                
-                # Add traffic information if available
-                if 'traffic' in rest and rest['traffic']['duration_min'] is not None:
-                    jam_factor = rest['traffic']['jam_factor']
-                    duration_min = rest['traffic']['duration_min']
-                    
-                    # Create traffic status description
-                    traffic_status = "smooth"
-                    if 2 < jam_factor <= 4:
-                        traffic_status = "light congestion"
-                    elif 4 < jam_factor <= 7:
-                        traffic_status = "moderate congestion"
-                    elif jam_factor > 7:
-                        traffic_status = "heavy congestion"
-                        
-                    traffic_info = f", current traffic: {traffic_status} (jam factor {jam_factor}/10), estimated travel time {duration_min} minutes"
-
-            prompt += f"{i + 1}. {rest['name']} - Rating: {rest.get('rating', 'N/A')} - Price: {rest.get('price', 'N/A')}{location_info}{traffic_info}\n"
-
-        # add categorized restaurant information
-        if categorized_restaurants:
-            prompt += "\nThe system also has the following special scene categories of restaurants, please also consider these information when making recommendations:\n"
-
-        # add total number of restaurants in each category
-        for category, restaurants in categorized_restaurants.items():
-            category_name = {
-                'dating': 'romantic date',
-                'family': 'family dinner',
-                'friend': 'friends gathering',
-                'professional': 'business social'
-            }.get(category, category)
-
-            # get the number of valid (with location information) restaurants
-            valid_restaurants = [r for r in restaurants if 'latitude' in r and 'longitude' in r]
-
-            if valid_restaurants:
-                prompt += f"- {category_name} scene suitable restaurants: {len(valid_restaurants)}家\n"
-
-                # add the first 3 restaurants as examples
-                if len(valid_restaurants) > 0:
-                    prompt += "  such as: "
-                    examples = valid_restaurants[:3]
-                    example_names = [r['name'] for r in examples]
-                    prompt += ", ".join(example_names)
-                    prompt += "\n"
-
-    prompt += """
-Please analyze the user's question carefully and recommend the most suitable restaurant based on the restaurant list and the current conditions (weather, time, etc.).
-If the user's question is not about restaurant recommendations, please politely reply and guide the user back to the restaurant recommendation topic.
-
-Provide recommendations based on the following factors:
-- User's specific needs
-- Current time (consider whether it is suitable for the current user's dining time)
-- Restaurant ratings and prices
-- Distance
-- Suitable social scenarios (dating, family, friends gathering, or business)
-- Traffic conditions (consider recommending closer options and ones with better traffic conditions, you should also tell user real-time traffic information from the user's location to the recommended restaurant)
-"""
-
-    # if there is weather information, add weather-related suggestions
-    if weather.get("description") != "Unknown":
-        prompt += "- Current weather (consider choosing a closer option if the weather is bad)\n"
-    else:
-        prompt += "Note: Current weather information is temporarily unavailable, please do not mention specific weather conditions in the reply.\n"
-
-    prompt += """
-Important format requirements:
-1. Insert **two consecutive newline characters (\n\n)** after the intro and after each restaurant paragraph so that every paragraph is separated by a completely blank line.
-2. Do not mention or list the extracted keywords in the reply
-3. Do not start with "I understand your needs are" or "I understand you want..."
-4. Directly recommend 2-3 most suitable restaurants
-5. Use a concise paragraph format, use a separate paragraph for each recommended restaurant
-6. Explain the recommendation reason briefly, do not elaborate
-7. If the user's question is about a specific scene (dating/family/friends/business), prioritize recommending restaurants from these categories
-
-Use a friendly and professional tone, use appropriate paragraph breaks, and answer directly in English.
-"""
-
-    # call Gemini API
+# build Gemini request payload and headers
+def build_gemini_request(prompt):
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
@@ -444,13 +500,76 @@ Use a friendly and professional tone, use appropriate paragraph breaks, and answ
         "Content-Type": "application/json",
         "x-goog-api-key": GEMINI_API_KEY
     }
+    return payload, headers
+
+
+# extract the text parts of one Gemini response chunk
+def get_gemini_text(result):
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+# parse one line of a streamGenerateContent response in SSE format
+def parse_gemini_stream_line(line):
+    if not line or not line.startswith("data:"):
+        return ""
+    return get_gemini_text(json.loads(line[len("data:"):].strip()))
+
+
+# yield text chunks from a streamGenerateContent response
+def iter_gemini_stream(response):
+    for line in response.iter_lines(decode_unicode=True):
+        text = parse_gemini_stream_line(line)
+        if text:
+            yield text
+
+
+# format one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/chatbot", methods=["POST"])
+def chatbot():
+    data = request.json
+    user_message = data.get("message", "")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+
+    # optional scene, the recommendations are then restricted to its restaurants
+    scene = parse_scene(data.get("scene"))
+    if scene_unavailable(scene):
+        return jsonify({"response": SCENE_UNAVAILABLE}), 503
+
+    # call recommend function to get keywords and recommendations
+    keywords, recommendations = recommend(user_message, scene=scene)
+
+    # add location data and traffic info
+    with span("enrichment"):
+        for item in recommendations:
+            add_location_info(item)
+    add_traffic_info(recommendations, user_lat, user_lng)
+
+    # get weather data
+    weather, weather_info = get_weather_info(user_lat, user_lng)
+
+    # build prompt
+    prompt = build_chat_prompt(user_message, recommendations, weather, weather_info,
+                               scene, user_lat, user_lng)
+
+    # call Gemini API
+    payload, headers = build_gemini_request(prompt)
 
     try:
-        response = requests.post(
-            GEMINI_API_URL,
-            headers=headers,
-            data=json.dumps(payload)
-        )
+        with span("gemini"):
+            response = requests.post(
+                GEMINI_API_URL,
+                headers=headers,
+                data=json.dumps(payload)
+            )
 
         if response.status_code == 200:
             result = response.json()
@@ -460,8 +579,10 @@ Use a friendly and professional tone, use appropriate paragraph breaks, and answ
             error_message = f"Sorry, I cannot process your request. Error: {response.status_code}"
             print(f"Gemini API error: {error_message}")
             print(f"Response content: {response.text}")
+            error_count.inc("gemini")
             return jsonify({"response": error_message})
     except Exception as e:
+        error_count.inc("gemini")
         error_message = f"Gemini API call failed: {str(e)}"
         print(error_message)
         import traceback
@@ -469,11 +590,74 @@ Use a friendly and professional tone, use appropriate paragraph breaks, and answ
         return jsonify({"response": "Sorry, I cannot respond at the moment. Please try again later."})
 
 
-@app.route("/api/categorized_restaurants")
-def get_categorized_restaurants():
+@app.route("/api/chatbot/stream", methods=["POST"])
+def chatbot_stream():
+    # same as /api/chatbot, but the recommendation list is sent as soon as it is ready
+    # and the Gemini reply is relayed token by token as Server-Sent Events
+    data = request.json
+    user_message = data.get("message", "")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    scene = parse_scene(data.get("scene"))
+    if scene_unavailable(scene):
+        return jsonify({"response": SCENE_UNAVAILABLE}), 503
+
+    def generate():
+        # call recommend function and send the recommendations first
+        keywords, recommendations = recommend(user_message, scene=scene)
+        with span("enrichment"):
+            for item in recommendations:
+                add_location_info(item)
+        yield sse_event("recommendations", {"data": recommendations})
+
+        # add traffic info and weather data for the prompt
+        add_traffic_info(recommendations, user_lat, user_lng)
+        weather, weather_info = get_weather_info(user_lat, user_lng)
+
+        prompt = build_chat_prompt(user_message, recommendations, weather, weather_info,
+                                   scene, user_lat, user_lng)
+        payload, headers = build_gemini_request(prompt)
+
+        # call Gemini streaming API and relay text chunks as they arrive
+        try:
+            with span("gemini_stream"), requests.post(
+                    GEMINI_STREAM_URL,
+                    headers=headers,
+                    data=json.dumps(payload),
+                    stream=True,
+                    timeout=(5, 60)
+            ) as response:
+                if response.status_code != 200:
+                    error_message = f"Sorry, I cannot process your request. Error: {response.status_code}"
+                    print(f"Gemini API error: {error_message}")
+                    print(f"Response content: {response.text}")
+                    error_count.inc("gemini")
+                    yield sse_event("error", {"response": error_message})
+                    return
+
+                for text in iter_gemini_stream(response):
+                    yield sse_event("token", {"text": text})
+
+            yield sse_event("done", {})
+        except Exception as e:
+            print(f"Gemini API streaming call failed: {str(e)}")
+            error_count.inc("gemini")
+            import traceback
+            traceback.print_exc()
+            yield sse_event("error", {"response": "Sorry, I cannot respond at the moment. Please try again later."})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# build the /api/categorized_restaurants response once, as serialized and gzip-compressed bytes
+def build_categorized_payload():
     try:
         # load categorized restaurant data
-        categorized_data = pickle.load(open('models/categorized_restaurants.pkl', 'rb'))
+        categorized_data = pickle.load(open(CATEGORIZED_PKL, 'rb'))
 
         # convert to serializable dictionary format
         categories = {
@@ -540,15 +724,116 @@ def get_categorized_restaurants():
         print(
             f"Categorized restaurant data: valid:{total_valid}, missing:{total_missing}, total markers:{sum(len(markers) for markers in response_data.values())}")
 
-        return jsonify(response_data)
+        body = json.dumps(response_data).encode("utf-8")
+        modified_at = max(os.path.getmtime(path) for path in (CATEGORIZED_PKL, "data/results.xlsx")
+                          if os.path.exists(path))
+        return {
+            "data": response_data,
+            "body": body,
+            "gzip_body": gzip.compress(body),
+            "etag": hashlib.sha1(body).hexdigest(),
+            "last_modified": datetime.datetime.fromtimestamp(int(modified_at), tz=datetime.timezone.utc)
+        }
     except FileNotFoundError:
-        print(f"File not found: models/categorized_restaurants.pkl")
-        return jsonify({"error": "Categorized restaurant data file not found", "data": {}})
+        print(f"File not found: {CATEGORIZED_PKL}")
+        return {"error": {"error": "Categorized restaurant data file not found", "data": {}}}
     except Exception as e:
         print(f"Failed to get categorized restaurant data: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": "Failed to get categorized restaurant data", "details": str(e), "data": {}})
+        return {"error": {"error": "Failed to get categorized restaurant data", "details": str(e), "data": {}}}
+
+
+# build the restaurant name autocomplete index, ranking ties by review count
+def build_name_index():
+    try:
+        info_df = recommender.models.new_df
+        popularity = pd.to_numeric(info_df['review_count'], errors='coerce').fillna(0).tolist()
+        return NameIndex(info_df['restaurant_name'].tolist(), popularity)
+    except Exception as e:
+        print(f"Failed to build restaurant name index: {e}")
+        return NameIndex([])
+
+
+# scene summary fragments of the chat prompt, built once per model version
+def build_chat_context():
+    state = recommender.models
+    version = getattr(state, "version", "")
+    try:
+        info_df = state.new_df
+        ratings = pd.to_numeric(info_df['Rating'], errors='coerce').fillna(0)
+        review_counts = pd.to_numeric(info_df['review_count'], errors='coerce').fillna(0)
+        restaurant_stats = dict(zip(info_df['restaurant_name'], zip(ratings, review_counts)))
+    except Exception as e:
+        print(f"Failed to read restaurant ratings for the chat prompt: {e}")
+        restaurant_stats = {}
+    neighborhoods = {name: location.get('neighborhood') for name, location in location_map.items()
+                     if isinstance(location.get('neighborhood'), str)}
+    return build_prompt_context(version, categorized_payload.get("data", {}), restaurant_stats, neighborhoods)
+
+
+# rebuild serving data derived from the models
+def load_serving_data():
+    global categorized_payload, name_index, chat_context
+    categorized_payload = build_categorized_payload()
+    name_index = build_name_index()
+    chat_context = build_chat_context()
+
+
+load_serving_data()
+recommender.on_reload(load_serving_data)
+
+
+@app.route("/api/categorized_restaurants")
+def get_categorized_restaurants():
+    payload = categorized_payload
+    if "error" in payload:
+        return jsonify(payload["error"])
+
+    # gzip and identity bodies are different representations, so they get different ETags
+    use_gzip = request.accept_encodings["gzip"] > 0
+    etag = payload["etag"] + ("-gz" if use_gzip else "")
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (request.if_modified_since is not None
+                        and request.if_modified_since >= payload["last_modified"])
+
+    response = Response(status=304) if not_modified else Response(
+        payload["gzip_body"] if use_gzip else payload["body"],
+        mimetype="application/json"
+    )
+    if use_gzip and not not_modified:
+        response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.last_modified = payload["last_modified"]
+    # let browsers cache it but revalidate every time, so model reloads are picked up
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# check the admin token sent in the X-Admin-Token header
+def is_admin_request():
+    token = request.headers.get("X-Admin-Token", "")
+    # compared as bytes: compare_digest raises TypeError on non-ASCII str
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+@app.route("/api/admin/reload_models", methods=["POST"])
+def admin_reload_models():
+    if not is_admin_request():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        version = recommender.reload_models()
+        return jsonify({"model_version": version})
+    except Exception as e:
+        print(f"Failed to reload models: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Failed to reload models", "details": str(e)}), 500
 
 
 @app.route("/api/here_traffic_key")
@@ -566,43 +851,49 @@ def get_here_traffic_key():
     })
 
 
+# add origin, destination and a traffic status based on jam factor
+def build_traffic_response(traffic_info, o_lat, o_lon, d_lat, d_lon):
+    # add origin and destination coordinates
+    traffic_info['origin'] = {'lat': o_lat, 'lon': o_lon}
+    traffic_info['destination'] = {'lat': d_lat, 'lon': d_lon}
+
+    # add traffic status based on jam factor
+    jam_factor = traffic_info.get('jam_factor', 0)
+    if jam_factor < 2:
+        traffic_info['status'] = "smooth"
+        traffic_info['status_color'] = "#4CAF50"
+    elif jam_factor <= 4:
+        traffic_info['status'] = "light congestion"
+        traffic_info['status_color'] = "#FFC107"
+    elif jam_factor <= 7:
+        traffic_info['status'] = "moderate congestion"
+        traffic_info['status_color'] = "#FF9800"
+    else:
+        traffic_info['status'] = "heavy congestion"
+        traffic_info['status_color'] = "#F44336"
+    return traffic_info
+
+
+# read origin/destination query parameters, None if any is missing
+def get_traffic_args():
+    args = [request.args.get(name) for name in ("origin_lat", "origin_lon", "dest_lat", "dest_lon")]
+    if not all(args):
+        return None
+    return [float(arg) for arg in args]
+
+
 @app.route("/api/traffic_info")
 def get_traffic_info():
-    # get query parameters
-    o_lat = request.args.get("origin_lat")
-    o_lon = request.args.get("origin_lon")
-    d_lat = request.args.get("dest_lat")
-    d_lon = request.args.get("dest_lon")
-    
-    # check if all required parameters are provided
-    if not all([o_lat, o_lon, d_lat, d_lon]):
-        return jsonify({"error": "Missing parameters. Required: origin_lat, origin_lon, dest_lat, dest_lon"})
-        
     try:
+        # check if all required parameters are provided
+        coords = get_traffic_args()
+        if coords is None:
+            return jsonify({"error": "Missing parameters. Required: origin_lat, origin_lon, dest_lat, dest_lon"})
+
         # get traffic information
-        traffic_info = get_route_traffic(float(o_lat), float(o_lon), float(d_lat), float(d_lon))
-        
-        # add origin and destination coordinates
-        traffic_info['origin'] = {'lat': float(o_lat), 'lon': float(o_lon)}
-        traffic_info['destination'] = {'lat': float(d_lat), 'lon': float(d_lon)}
-        
-        # add traffic status based on jam factor
-        jam_factor = traffic_info.get('jam_factor', 0)
-        if jam_factor < 2:
-            traffic_info['status'] = "smooth"
-            traffic_info['status_color'] = "#4CAF50"
-        elif jam_factor <= 4:
-            traffic_info['status'] = "light congestion"
-            traffic_info['status_color'] = "#FFC107"
-        elif jam_factor <= 7:
-            traffic_info['status'] = "moderate congestion"
-            traffic_info['status_color'] = "#FF9800"
-        else:
-            traffic_info['status'] = "heavy congestion"
-            traffic_info['status_color'] = "#F44336"
-        
-        return jsonify(traffic_info)
-        
+        traffic_info = get_route_traffic(*coords)
+        return jsonify(build_traffic_response(traffic_info, *coords))
+
     except Exception as e:
         print(f"Failed to get traffic info: {str(e)}")
         import traceback
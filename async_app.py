@@ -0,0 +1,406 @@
+"""
+Async (ASGI) serving mode.
+
+The I/O-bound endpoints (chatbot, traffic info, recommendations) are served by async Quart views
+that call Gemini, HERE and OpenWeatherMap with a shared httpx.AsyncClient, so a worker is not
+blocked while waiting on them. CPU-bound ranking runs in a thread pool executor. All other paths
+are passed through to the Flask app in app.py.
+
+Run with:
+    hypercorn async_app:asgi_app --workers 1 --bind 127.0.0.1:5000
+"""
+import asyncio
+import functools
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, g, has_app_context, jsonify, make_response, request
+
+import metrics
+import profiling
+from metrics import error_count, span, timed
+
+from app import (
+    app as flask_app,
+    ADMIN_TOKEN,
+    GEMINI_API_URL,
+    GEMINI_STREAM_URL,
+    SCENE_UNAVAILABLE,
+    UNKNOWN_TRAFFIC,
+    UNKNOWN_WEATHER,
+    add_location_info,
+    build_chat_prompt,
+    build_gemini_request,
+    build_name_recommendations,
+    build_route_request,
+    build_traffic_response,
+    build_weather_request,
+    enrich_recommendations,
+    parse_scene,
+    parse_gemini_stream_line,
+    parse_route_traffic,
+    parse_weather,
+    scene_unavailable,
+    set_cache_headers,
+    sse_event,
+)
+from recommender import recommend, recommend_by_name
+from scene_index import SCENES
+from single_flight import single_flight
+
+# threads for CPU-bound ranking, and the connection pool size for upstream APIs
+RANKING_WORKERS = int(os.environ.get("RANKING_WORKERS", os.cpu_count() or 4))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 200))
+
+# paths served by the async views, everything else goes to the Flask app
+ASYNC_PATHS = {
+    "/api/chatbot",
+    "/api/chatbot/stream",
+    "/api/traffic_info",
+    "/api/recommend",
+    "/api/recommend_by_name",
+}
+
+quart_app = Quart(__name__)
+ranking_executor = ThreadPoolExecutor(max_workers=RANKING_WORKERS, thread_name_prefix="ranking")
+http_client = None
+
+
+@quart_app.before_serving
+async def start_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(5.0, read=60.0),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS)
+    )
+
+
+@quart_app.after_serving
+async def close_http_client():
+    await http_client.aclose()
+
+
+@quart_app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@quart_app.after_request
+async def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_count.inc(endpoint, request.method, str(response.status_code))
+    if "request_start" in g:
+        metrics.request_latency.observe(time.perf_counter() - g.request_start, endpoint)
+    return response
+
+
+# async version of app.is_admin_request
+def is_admin_request():
+    token = request.headers.get("X-Admin-Token", "")
+    # compared as bytes: compare_digest raises TypeError on non-ASCII str
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+# the event loop thread is shared by all requests, so only the executor threads working
+# for a request are sampled
+@quart_app.before_request
+async def start_request_profile():
+    requested = profiling.profile_flag(request.headers, request.args) and is_admin_request()
+    reason = profiling.choose_reason(requested)
+    g.profile = profiling.RequestProfile(reason) if reason else None
+
+
+@quart_app.after_request
+async def finish_request_profile(response):
+    profile = g.pop("profile", None)
+    profile_name = profiling.finish_profile(profile, request.method, request.path, response.status_code)
+    if profile_name and profile.reason == "requested":
+        response.headers["X-Profile-File"] = profile_name
+    return response
+
+
+def run_profiled(profile, func, *args):
+    with profiling.profile_thread(profile):
+        return func(*args)
+
+
+# run a blocking function in the ranking executor, sampled if the request is profiled
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    profile = g.get("profile") if has_app_context() else None
+    if profile is not None:
+        func = functools.partial(run_profiled, profile, func)
+    return await loop.run_in_executor(ranking_executor, func, *args)
+
+
+# async version of app.get_weather
+@single_flight("weather", copy=dict)
+@timed("weather")
+async def get_weather_async(lat, lng):
+    try:
+        weather_request = build_weather_request(lat, lng)
+        if weather_request is None:
+            return dict(UNKNOWN_WEATHER)
+
+        url, params = weather_request
+        response = await http_client.get(url, params=params, timeout=5)
+        if response.status_code == 200:
+            return parse_weather(response.json())
+        else:
+            print(f"Weather API response error content: {response.text}")
+            error_count.inc("weather")
+            return dict(UNKNOWN_WEATHER)
+    except httpx.TimeoutException:
+        print("Weather API request timeout")
+        error_count.inc("weather")
+        return dict(UNKNOWN_WEATHER)
+    except httpx.HTTPError as e:
+        print(f"Weather API request exception: {str(e)}")
+        error_count.inc("weather")
+        return dict(UNKNOWN_WEATHER)
+    except Exception as e:
+        print(f"Failed to get weather data: {str(e)}")
+        error_count.inc("weather")
+        import traceback
+        traceback.print_exc()
+        return dict(UNKNOWN_WEATHER)
+
+
+# async version of app.get_route_traffic
+@single_flight("traffic", copy=dict)
+@timed("traffic")
+async def get_route_traffic_async(origin_lat, origin_lon, dest_lat, dest_lon):
+    try:
+        route_request = build_route_request(origin_lat, origin_lon, dest_lat, dest_lon)
+        if route_request is None:
+            return dict(UNKNOWN_TRAFFIC)
+
+        url, params = route_request
+        response = await http_client.get(url, params=params, timeout=5)
+        if response.status_code == 200:
+            return parse_route_traffic(response.json())
+        else:
+            print(f"HERE API response error content: {response.text}")
+            error_count.inc("traffic")
+            return dict(UNKNOWN_TRAFFIC)
+    except httpx.TimeoutException:
+        print("HERE API request timeout")
+        error_count.inc("traffic")
+        return dict(UNKNOWN_TRAFFIC)
+    except httpx.HTTPError as e:
+        print(f"HERE API request exception: {str(e)}")
+        error_count.inc("traffic")
+        return dict(UNKNOWN_TRAFFIC)
+    except Exception as e:
+        print(f"Failed to get route traffic data: {str(e)}")
+        error_count.inc("traffic")
+        import traceback
+        traceback.print_exc()
+        return dict(UNKNOWN_TRAFFIC)
+
+
+# add traffic information to all recommendations concurrently
+async def add_traffic_info_async(recommendations, user_lat, user_lng):
+    if not (user_lat and user_lng):
+        return
+
+    items = [item for item in recommendations if item.get('latitude') and item.get('longitude')]
+    traffic = await asyncio.gather(*(
+        get_route_traffic_async(user_lat, user_lng, item['latitude'], item['longitude'])
+        for item in items
+    ))
+    for item, traffic_info in zip(items, traffic):
+        item['traffic'] = traffic_info
+
+
+# async version of app.get_weather_info
+async def get_weather_info_async(user_lat, user_lng):
+    weather = dict(UNKNOWN_WEATHER)
+    weather_info = "Weather information is temporarily unavailable"
+    if user_lat and user_lng:
+        weather = await get_weather_async(user_lat, user_lng)
+        weather_info = f"Current weather: {weather['description']}, temperature: {weather['temperature']}°C"
+    return weather, weather_info
+
+
+# recommend, add location data, then fetch traffic and weather at the same time
+async def prepare_chat(user_message, user_lat, user_lng, scene=None):
+    keywords, recommendations = await run_blocking(recommend, user_message, None, scene)
+    with span("enrichment"):
+        for item in recommendations:
+            add_location_info(item)
+
+    (weather, weather_info), _ = await asyncio.gather(
+        get_weather_info_async(user_lat, user_lng),
+        add_traffic_info_async(recommendations, user_lat, user_lng)
+    )
+    return recommendations, weather, weather_info
+
+
+@quart_app.route("/api/recommend_by_name")
+async def api_recommend_by_name():
+    restaurant_name = request.args.get("name", "")
+    if not restaurant_name:
+        return jsonify({"error": "Please provide restaurant name", "data": []})
+
+    cache_info = {}
+    results = await run_blocking(recommend_by_name, restaurant_name, cache_info)
+    data = await run_blocking(build_name_recommendations, results)
+    return set_cache_headers(jsonify({"data": data}), cache_info)
+
+
+@quart_app.route("/api/recommend")
+async def api_recommend():
+    q = request.args.get("query", "")
+    if not q:
+        return jsonify({"error": "Please provide query content", "data": []})
+    scene = parse_scene(request.args.get("scene"))
+    if request.args.get("scene") and scene is None:
+        return jsonify({"error": f"Unknown scene, choose from {', '.join(SCENES)}", "data": []})
+    if scene_unavailable(scene):
+        return jsonify({"error": SCENE_UNAVAILABLE, "data": []}), 503
+
+    cache_info = {}
+    keywords, results = await run_blocking(recommend, q, cache_info, scene)
+    data = await run_blocking(enrich_recommendations, results)
+    return set_cache_headers(jsonify({"data": data}), cache_info)
+
+
+@quart_app.route("/api/traffic_info")
+async def get_traffic_info():
+    try:
+        args = [request.args.get(name) for name in ("origin_lat", "origin_lon", "dest_lat", "dest_lon")]
+        if not all(args):
+            return jsonify({"error": "Missing parameters. Required: origin_lat, origin_lon, dest_lat, dest_lon"})
+
+        coords = [float(arg) for arg in args]
+        traffic_info = await get_route_traffic_async(*coords)
+        return jsonify(build_traffic_response(traffic_info, *coords))
+    except Exception as e:
+        print(f"Failed to get traffic info: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)})
+
+
+@quart_app.route("/api/chatbot", methods=["POST"])
+async def chatbot():
+    data = await request.get_json()
+    user_message = data.get("message", "")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    scene = parse_scene(data.get("scene"))
+    if scene_unavailable(scene):
+        return jsonify({"response": SCENE_UNAVAILABLE}), 503
+
+    recommendations, weather, weather_info = await prepare_chat(user_message, user_lat, user_lng, scene)
+    prompt = build_chat_prompt(user_message, recommendations, weather, weather_info,
+                               scene, user_lat, user_lng)
+    payload, headers = build_gemini_request(prompt)
+
+    try:
+        with span("gemini"):
+            response = await http_client.post(GEMINI_API_URL, headers=headers, content=json.dumps(payload))
+
+        if response.status_code == 200:
+            result = response.json()
+            bot_response = result["candidates"][0]["content"]["parts"][0]["text"]
+            return jsonify({"response": bot_response, "data": recommendations})
+        else:
+            error_message = f"Sorry, I cannot process your request. Error: {response.status_code}"
+            print(f"Gemini API error: {error_message}")
+            print(f"Response content: {response.text}")
+            error_count.inc("gemini")
+            return jsonify({"response": error_message})
+    except Exception as e:
+        print(f"Gemini API call failed: {str(e)}")
+        error_count.inc("gemini")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"response": "Sorry, I cannot respond at the moment. Please try again later."})
+
+
+@quart_app.route("/api/chatbot/stream", methods=["POST"])
+async def chatbot_stream():
+    data = await request.get_json()
+    user_message = data.get("message", "")
+    user_lat = data.get("latitude")
+    user_lng = data.get("longitude")
+    scene = parse_scene(data.get("scene"))
+    if scene_unavailable(scene):
+        return jsonify({"response": SCENE_UNAVAILABLE}), 503
+
+    async def generate():
+        keywords, recommendations = await run_blocking(recommend, user_message, None, scene)
+        with span("enrichment"):
+            for item in recommendations:
+                add_location_info(item)
+        yield sse_event("recommendations", {"data": recommendations}).encode()
+
+        (weather, weather_info), _ = await asyncio.gather(
+            get_weather_info_async(user_lat, user_lng),
+            add_traffic_info_async(recommendations, user_lat, user_lng)
+        )
+        prompt = build_chat_prompt(user_message, recommendations, weather, weather_info,
+                                   scene, user_lat, user_lng)
+        payload, headers = build_gemini_request(prompt)
+
+        try:
+            with span("gemini_stream"):
+                async with http_client.stream(
+                        "POST", GEMINI_STREAM_URL, headers=headers, content=json.dumps(payload)
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        error_message = f"Sorry, I cannot process your request. Error: {response.status_code}"
+                        print(f"Gemini API error: {error_message}")
+                        print(f"Response content: {response.text}")
+                        error_count.inc("gemini")
+                        yield sse_event("error", {"response": error_message}).encode()
+                        return
+
+                    async for line in response.aiter_lines():
+                        text = parse_gemini_stream_line(line)
+                        if text:
+                            yield sse_event("token", {"text": text}).encode()
+
+            yield sse_event("done", {}).encode()
+        except Exception as e:
+            print(f"Gemini API streaming call failed: {str(e)}")
+            error_count.inc("gemini")
+            import traceback
+            traceback.print_exc()
+            yield sse_event("error", {"response": "Sorry, I cannot respond at the moment. Please try again later."}).encode()
+
+    response = await make_response(generate(), {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    response.timeout = None
+    return response
+
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def asgi_app(scope, receive, send):
+    # lifespan events and the async paths go to Quart, everything else to the Flask app
+    if scope["type"] == "lifespan" or scope.get("path") in ASYNC_PATHS:
+        await quart_app(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
+
+
+if __name__ == "__main__":
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.environ.get("BIND", "127.0.0.1:5000")]
+    asyncio.run(serve(asgi_app, config))
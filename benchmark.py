@@ -0,0 +1,399 @@
+"""
+Benchmarks for the recommender hot paths on synthetic catalogs.
+
+For every catalog size a synthetic set of model files (same format as models/) is written to a
+temporary directory, and a fresh worker process loads it and times recommend_by_name,
+recommend_by_keyword, recommend, KeywordExtractor.extract_keywords, model loading and the Flask
+endpoints. Each case reports p50/p95/p99 latency, throughput and the peak RSS of the worker.
+
+The dense restaurant x restaurant similarity matrix grows quadratically (100k restaurants need
+80 GB), so it is only built up to --max-similarity-mb; above that size the catalog gets the
+top-K neighbors of a streaming TF-IDF build instead (sparse_tfidf.py), up to
+--max-neighbors-size restaurants since they still take quadratic time. Cases that need either
+are reported as skipped above that size. Cases whose dependencies are missing (e.g. the spaCy
+model) are skipped the same way, with the reason in the results.
+
+Usage:
+    python benchmark.py --sizes 1000 10000 100000 --output benchmarks/$(git rev-parse --short HEAD).json
+    python benchmark.py --compare benchmarks/old.json benchmarks/new.json
+"""
+import argparse
+import datetime
+import json
+import os
+import pickle
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CUISINES = [
+    "American", "Italian", "Mexican", "Chinese", "Japanese", "Sushi", "Thai", "Indian", "French",
+    "Korean", "Vietnamese", "Mediterranean", "Greek", "Spanish", "Pizza", "Burgers", "Seafood",
+    "Steakhouses", "Vegan", "Bakeries", "Cafes", "Cocktail Bars", "Wine Bars", "Ramen", "Tapas",
+]
+NEIGHBORHOODS = [
+    "Midtown West", "East Village", "West Village", "Greenwich Village", "SoHo", "Tribeca",
+    "Chelsea", "Hell's Kitchen", "Lower East Side", "Upper West Side", "Upper East Side",
+    "Financial District", "South Street Seaport", "Flatiron", "Williamsburg", "Astoria",
+]
+FOOD_WORDS = [
+    "pizza", "pasta", "burger", "taco", "sushi", "ramen", "steak", "salad", "cocktail", "wine",
+    "beer", "coffee", "dessert", "brunch", "noodle", "dumpling", "curry", "oyster", "lobster",
+    "chicken", "fries", "sandwich", "bagel", "spicy", "fresh", "cozy", "romantic", "service",
+    "delicious", "friendly", "view", "rooftop", "margherita", "tasting", "menu", "chef", "date",
+    "family", "kids", "group", "quiet", "lively", "cheap", "expensive", "authentic", "bar",
+]
+NAME_WORDS = [
+    "Golden", "Little", "Blue", "Red", "Old", "Corner", "Garden", "Harbor", "Union", "Royal",
+    "Dragon", "Olive", "Lotus", "Smoke", "Salt", "Oak", "Kitchen", "House", "Table", "Bistro",
+]
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "sol", "ve", "du", "pan", "ori", "zu", "bel", "ta", "no"]
+
+QUERY_TEMPLATES = [
+    "I want to eat some {0} food, like {1}. I am near {2}, can you give me some suggestion?",
+    "Looking for a {1} place with good {0} dishes around {2}",
+    "Any {0} restaurant in {2} that serves {1} and has a nice bar?",
+]
+
+
+# vocabulary for the review part of the tags: food words first, then made-up words
+def build_vocabulary(size, rng):
+    words = [w.lower() for w in FOOD_WORDS]
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words)
+
+
+# write a synthetic catalog in the format of the models/ and data/ files read by the app
+def build_catalog(size, workdir, seed=0, tag_words=120, vocabulary_size=20000,
+                  max_similarity_mb=1024, max_dense_vectors_mb=1024, max_neighbors_size=20000):
+    from nltk.stem.porter import PorterStemmer
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sparse_tfidf import NEIGHBORS_PKL, top_k_neighbors
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    ps = PorterStemmer()
+
+    names = [f"{NAME_WORDS[a]} {NAME_WORDS[b]} {i}" for i, (a, b) in
+             enumerate(rng.integers(0, len(NAME_WORDS), size=(size, 2)))]
+    cuisines = rng.choice(CUISINES, size=size)
+    neighborhoods = rng.choice(NEIGHBORHOODS, size=size)
+
+    # review words follow a Zipf-like distribution, like real review text
+    vocabulary = build_vocabulary(vocabulary_size, rng)
+    stemmed = np.array([ps.stem(w) for w in vocabulary])
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** 1.1
+    word_ids = rng.choice(len(vocabulary), size=(size, tag_words), p=weights / weights.sum())
+    tags = [
+        f"{cuisine} {neighborhood} {' '.join(stemmed[row])}".lower()
+        for cuisine, neighborhood, row in zip(cuisines, neighborhoods, word_ids)
+    ]
+
+    review_counts = rng.integers(5, 5000, size=size)
+    new_df = pd.DataFrame({
+        "restaurant_name": names,
+        "PriceRange": rng.choice(["$", "$$", "$$$", "$$$$"], size=size, p=[0.3, 0.45, 0.2, 0.05]),
+        "Rating": rng.choice(np.arange(1.0, 5.5, 0.5), size=size).astype(str),
+        "review_count": review_counts.astype(str),
+        "ranking": (np.argsort(np.argsort(-review_counts)) + 1).astype(str),
+        "tags": tags,
+    })
+
+    cv = CountVectorizer(max_features=5000, stop_words='english')
+    vectors = cv.fit_transform(new_df['tags'])
+    info = {"size": size, "seed": seed, "features": vectors.shape[1]}
+
+    # the build scripts store dense vectors, keep them sparse when that would not fit
+    dense_mb = vectors.shape[0] * vectors.shape[1] * 8 / 2 ** 20
+    info["vectors"] = "dense" if dense_mb <= max_dense_vectors_mb else "sparse"
+    if info["vectors"] == "dense":
+        vectors = vectors.toarray()
+
+    similarity_mb = size * size * 8 / 2 ** 20
+    neighbors = None
+    if similarity_mb <= max_similarity_mb:
+        similarity = cosine_similarity(vectors)
+        info["similarity"] = "dense"
+    elif size > max_neighbors_size:
+        similarity = None
+        info["similarity"] = (f"skipped: would need {similarity_mb:,.0f} MB (limit {max_similarity_mb} MB), "
+                              f"neighbors limited to {max_neighbors_size} restaurants")
+    else:
+        similarity = None
+        neighbors_start = time.perf_counter()
+        indices, scores = top_k_neighbors(vectors)
+        neighbors = {"indices": indices, "scores": scores}
+        info["similarity"] = (f"top-{indices.shape[1]} neighbors in {time.perf_counter() - neighbors_start:.1f}s: "
+                              f"dense would need {similarity_mb:,.0f} MB (limit {max_similarity_mb} MB)")
+
+    # scene categories and coordinates for the categorized restaurants and enrichment paths
+    categories = {}
+    for scene in ("dating", "family", "friend", "professional"):
+        chosen = rng.choice(names, size=max(1, size // 10), replace=False).tolist()
+        categories[scene] = chosen
+    max_len = max(len(v) for v in categories.values())
+    categorized = pd.DataFrame({k: v + [pd.NA] * (max_len - len(v)) for k, v in categories.items()})
+    locations = pd.DataFrame({
+        "Name": names,
+        "Latitude": rng.uniform(40.70, 40.80, size=size),
+        "Longitude": rng.uniform(-74.02, -73.93, size=size),
+        "Address": [f"{n} Broadway, New York, NY" for n in rng.integers(1, 2000, size=size)],
+    })
+
+    os.makedirs(os.path.join(workdir, "models"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    for name, obj in (("restaurant_info", new_df), ("restaurant_similarity", similarity),
+                      ("count_vectorizer", cv), ("restaurant_vectors", vectors),
+                      ("categorized_restaurants", categorized)):
+        with open(os.path.join(workdir, "models", f"{name}.pkl"), "wb") as f:
+            pickle.dump(obj, f)
+    if neighbors is not None:
+        with open(os.path.join(workdir, NEIGHBORS_PKL), "wb") as f:
+            pickle.dump(neighbors, f)
+    locations.to_excel(os.path.join(workdir, "data", "results.xlsx"), index=False)
+
+    info["build_seconds"] = time.perf_counter() - start
+    return info
+
+
+# peak resident set size of this process so far, in MB
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies, elapsed):
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "iterations": len(latencies),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "throughput_ops": len(latencies) / elapsed if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# time func over every argument tuple, after a few untimed warmup calls
+def measure(func, inputs, warmup=3):
+    for args in inputs[:warmup]:
+        func(*args)
+    latencies = []
+    start = time.perf_counter()
+    for args in inputs:
+        call_start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_case(results, name, func, inputs, skip_reason=None):
+    if skip_reason:
+        results[name] = {"skipped": skip_reason}
+        print(f"  {name:32} skipped: {skip_reason}", file=sys.stderr)
+        return
+    try:
+        results[name] = measure(func, inputs)
+    except Exception as e:
+        results[name] = {"skipped": f"failed: {type(e).__name__}: {e}"}
+        print(f"  {name:32} failed: {e}", file=sys.stderr)
+        return
+    r = results[name]
+    print(f"  {name:32} p50={r['p50_ms']:9.3f} ms  p95={r['p95_ms']:9.3f} ms  "
+          f"p99={r['p99_ms']:9.3f} ms  {r['throughput_ops']:9.1f} ops/s  rss={r['peak_rss_mb']:8.1f} MB",
+          file=sys.stderr)
+
+
+# runs inside the worker process, with the catalog directory as working directory
+def run_worker(iterations, load_iterations, seed):
+    sys.path.insert(0, REPO_DIR)
+    results = {}
+    rng = np.random.default_rng(seed)
+
+    start = time.perf_counter()
+    import recommender
+    results["import_recommender"] = summarize([time.perf_counter() - start], time.perf_counter() - start)
+
+    load_inputs = [()] * load_iterations
+    run_case(results, "load_models", recommender.load_models, load_inputs)
+
+    names = recommender.models.new_df['restaurant_name'].tolist()
+    sample_names = [(names[i],) for i in rng.integers(0, len(names), size=iterations)]
+    words = [w.lower() for w in FOOD_WORDS + CUISINES + NEIGHBORHOODS]
+    keyword_lists = [(rng.choice(words, size=rng.integers(1, 5), replace=False).tolist(),)
+                     for _ in range(iterations)]
+    queries = [(QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(
+        rng.choice(CUISINES), rng.choice(FOOD_WORDS), rng.choice(NEIGHBORHOODS)),)
+        for i in range(iterations)]
+
+    no_similarity = None
+    if recommender.models.similarity is None and recommender.models.neighbors is None:
+        no_similarity = "no similarity matrix or neighbors at this size"
+    no_extractor = None if hasattr(recommender, "extractor") else "keyword extractor (spaCy model) not available"
+
+    run_case(results, "recommend_by_name", recommender.recommend_by_name, sample_names, no_similarity)
+    run_case(results, "recommend_by_keyword", recommender.recommend_by_keyword, keyword_lists)
+    run_case(results, "recommend", recommender.recommend, queries, no_extractor)
+    extract = recommender.extractor.extract_keywords if not no_extractor else None
+    run_case(results, "extract_keywords", extract, queries, no_extractor)
+
+    try:
+        import app
+        client = app.app.test_client()
+        no_app = None
+    except Exception as e:
+        client = None
+        no_app = f"app import failed: {type(e).__name__}: {e}"
+
+    def get(path, params=None):
+        response = client.get(path, query_string=params)
+        response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+
+    offsets = [("/api/restaurants", {"offset": int(i), "limit": 50})
+               for i in rng.integers(0, max(1, len(names) - 50), size=iterations)]
+    prefixes = [("/api/restaurants/search", {"q": name[:rng.integers(2, 8)]}) for (name,) in sample_names]
+    run_case(results, "GET /api/recommend_by_name", get,
+             [("/api/recommend_by_name", {"name": name}) for (name,) in sample_names], no_app or no_similarity)
+    run_case(results, "GET /api/recommend", get,
+             [("/api/recommend", {"query": query}) for (query,) in queries], no_app or no_extractor)
+    run_case(results, "GET /api/restaurants", get, offsets, no_app)
+    run_case(results, "GET /api/restaurants/search", get, prefixes, no_app)
+    run_case(results, "GET /api/categorized_restaurants", get,
+             [("/api/categorized_restaurants",)] * iterations, no_app)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def git_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run_size(size, args):
+    workdir = tempfile.mkdtemp(prefix=f"benchmark-{size}-")
+    try:
+        print(f"\nBuilding synthetic catalog with {size:,} restaurants in {workdir}...", file=sys.stderr)
+        catalog = build_catalog(size, workdir, seed=args.seed, max_similarity_mb=args.max_similarity_mb,
+                                max_dense_vectors_mb=args.max_dense_vectors_mb,
+                                max_neighbors_size=args.max_neighbors_size)
+        print(f"  built in {catalog['build_seconds']:.1f}s, similarity: {catalog['similarity']}", file=sys.stderr)
+
+        # a fresh process per size, so model loading and peak RSS are measured from scratch
+        result_path = os.path.join(workdir, "result.json")
+        env = dict(os.environ)
+        if not args.cache:
+            env["RESULT_CACHE_SIZE"] = "0"
+        command = [sys.executable, os.path.abspath(__file__), "--worker", result_path,
+                   "--iterations", str(args.iterations), "--load-iterations", str(args.load_iterations),
+                   "--seed", str(args.seed)]
+        subprocess.run(command, cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL if args.quiet else None)
+        with open(result_path) as f:
+            cases = json.load(f)
+        return {"size": size, "catalog": catalog, "cases": cases}
+    finally:
+        if args.keep:
+            print(f"  kept catalog in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+# print p50/p95 of every case present in both result files
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old.get('commit')}  new: {new.get('commit')}")
+    old_sizes = {r["size"]: r["cases"] for r in old["results"]}
+    for result in new["results"]:
+        old_cases = old_sizes.get(result["size"])
+        if old_cases is None:
+            continue
+        print(f"\n{result['size']:,} restaurants")
+        for name, case in result["cases"].items():
+            before = old_cases.get(name)
+            if not isinstance(case, dict) or not isinstance(before, dict) or "p50_ms" not in case \
+                    or "p50_ms" not in before:
+                continue
+            print(f"  {name:32} p50 {before['p50_ms']:9.3f} -> {case['p50_ms']:9.3f} ms "
+                  f"({case['p50_ms'] / before['p50_ms']:5.2f}x)  "
+                  f"p95 {before['p95_ms']:9.3f} -> {case['p95_ms']:9.3f} ms "
+                  f"({case['p95_ms'] / before['p95_ms']:5.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommender on synthetic catalogs")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--load-iterations", type=int, default=3, help="timed model loads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-similarity-mb", type=float, default=1024,
+                        help="largest dense similarity matrix to build")
+    parser.add_argument("--max-neighbors-size", type=int, default=20000,
+                        help="largest catalog to build top-K neighbors for when the dense matrix is skipped")
+    parser.add_argument("--max-dense-vectors-mb", type=float, default=1024,
+                        help="largest dense vector matrix to build, above this vectors stay sparse")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on")
+    parser.add_argument("--keep", action="store_true", help="keep the generated catalogs")
+    parser.add_argument("--quiet", action="store_true", help="hide the output of the app under test")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--worker", metavar="RESULT_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.worker:
+        results = run_worker(args.iterations, args.load_iterations, args.seed)
+        with open(args.worker, "w") as f:
+            json.dump(results, f)
+        return
+
+    report = {
+        **git_info(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "worker")},
+        "results": [run_size(size, args) for size in args.sizes],
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Throughput and accuracy of the inference backends (see inference.py) on data/labeled.xlsx.
+
+Every backend encodes the labeled reviews with SBERT (and, with --mnli, classifies them with
+BART-MNLI), bypassing the embedding cache. The report gives texts/s, the speedup over the fp32
+torch backend, macro F1 and accuracy against the labels, and how often each backend agrees with
+the torch predictions.
+
+Usage:
+    python benchmark_inference.py --backends torch int8 --threads 4 --output inference.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score
+
+import inference
+from seed_classifier import classify, encode_seeds
+
+LABELED_XLSX = "data/labeled.xlsx"
+SBERT_MODEL = "all-MiniLM-L6-v2"
+MNLI_MODEL = "facebook/bart-large-mnli"
+CANDIDATES = ["friend", "family", "dating", "professional", "other"]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run_sbert(backend, texts, batch_size):
+    sbert = inference.load_sbert(SBERT_MODEL, backend)
+    embs, elapsed = timed(lambda: sbert.encode(texts, batch_size=batch_size, convert_to_numpy=True))
+    labels, seed_matrix, starts = encode_seeds(sbert)
+    y_pred, _, _ = classify(embs, labels, seed_matrix, starts)
+    return list(y_pred), elapsed
+
+
+def run_mnli(backend, texts, batch_size):
+    zs = inference.load_zero_shot(MNLI_MODEL, backend)
+    return timed(lambda: inference.zero_shot_labels(zs, texts, CANDIDATES, batch_size=batch_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends on the labeled reviews")
+    parser.add_argument("--backends", nargs="+", default=list(inference.BACKENDS), choices=inference.BACKENDS)
+    parser.add_argument("--threads", type=int, default=inference.THREADS, help="intra-op threads (0: default)")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N labeled reviews")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--mnli", action="store_true", help="also benchmark BART-MNLI (slow)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    inference.configure_threads(args.threads)
+    df = pd.read_excel(LABELED_XLSX)
+    if args.limit:
+        df = df.head(args.limit)
+    texts = df["text"].astype(str).tolist()
+    y_true = df["label"].astype(str).tolist()
+
+    runners = {"sbert": run_sbert}
+    if args.mnli:
+        runners["mnli"] = run_mnli
+
+    results = []
+    for model, run in runners.items():
+        baseline = None
+        # torch first, as the baseline of the other backends
+        for backend in sorted(args.backends, key=lambda b: b != "torch"):
+            print(f"Running {model} on the {backend} backend…")
+            y_pred, elapsed = run(backend, texts, args.batch_size)
+            row = {
+                "model": model,
+                "backend": backend,
+                "texts_per_s": len(texts) / elapsed,
+                "accuracy": accuracy_score(y_true, y_pred),
+                "macro_f1": f1_score(y_true, y_pred, labels=CANDIDATES, average="macro", zero_division=0),
+            }
+            if backend == "torch":
+                baseline = (row, y_pred)
+            if baseline is not None:
+                base_row, base_pred = baseline
+                row["speedup"] = row["texts_per_s"] / base_row["texts_per_s"]
+                row["accuracy_delta"] = row["accuracy"] - base_row["accuracy"]
+                row["macro_f1_delta"] = row["macro_f1"] - base_row["macro_f1"]
+                row["agreement"] = float(np.mean(np.array(y_pred) == np.array(base_pred)))
+            results.append(row)
+
+    print(f"\n{len(texts)} labeled reviews, {args.threads or 'default'} threads")
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"texts": len(texts), "threads": args.threads, "results": results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
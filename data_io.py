@@ -0,0 +1,123 @@
+"""
+Reading and writing the restaurant and review tables as xlsx, csv, parquet or jsonl,
+chosen by file extension.
+
+xlsx is limited to about a million rows per sheet, use csv or parquet for larger datasets
+(parquet needs pyarrow).
+"""
+import os
+
+import pandas as pd
+
+XLSX_MAX_ROWS = 1048575
+
+
+def table_format(path):
+    # a parquet table can be a directory of part files, e.g. "reviews.parquet/"
+    ext = os.path.splitext(path.rstrip("/\\"))[1].lower().lstrip(".")
+    if ext in ("xlsx", "xls"):
+        return "xlsx"
+    if ext in ("csv", "parquet", "jsonl"):
+        return ext
+    raise ValueError(f"Unsupported table format: {path} (use .xlsx, .csv, .parquet or .jsonl)")
+
+
+def read_table(path, **kwargs):
+    fmt = table_format(path)
+    if fmt == "xlsx":
+        return pd.read_excel(path, **kwargs)
+    if fmt == "csv":
+        return pd.read_csv(path, **kwargs)
+    if fmt == "parquet":
+        return pd.read_parquet(path, **kwargs)
+    return pd.read_json(path, lines=True, **kwargs)
+
+
+def iter_table(path, chunksize=100000, columns=None):
+    """
+    Yields the table in DataFrame chunks of at most chunksize rows, so it never has to be held in
+    memory at once (except xlsx, which can only be read in one go).
+    """
+    fmt = table_format(path)
+    if fmt == "xlsx":
+        df = pd.read_excel(path, usecols=columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    elif fmt == "csv":
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    elif fmt == "parquet":
+        if os.path.isdir(path):
+            # a directory of part files, e.g. written by get_reviews.py
+            import pyarrow.dataset as ds
+            batches = ds.dataset(path, format="parquet").to_batches(batch_size=chunksize, columns=columns)
+        else:
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns)
+        for batch in batches:
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+            yield chunk[columns] if columns is not None else chunk
+
+
+class TableWriter:
+    """
+    Writes a table chunk by chunk, so large tables never have to be held in memory
+    (except xlsx, which can only be written in one go). With append=True, csv and jsonl
+    chunks are added to an existing file instead of replacing it. columns are the header of
+    an xlsx table that gets no chunks at all.
+    """
+
+    def __init__(self, path, append=False, columns=None):
+        self.path = path
+        self.columns = columns
+        self.format = table_format(path)
+        if append and self.format not in ("csv", "jsonl"):
+            raise ValueError(f"{path}: only csv and jsonl files can be appended to")
+        self.append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.rows = 0
+        self.xlsx_chunks = []
+        self.parquet_writer = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write(self, chunk: pd.DataFrame):
+        if self.format == "xlsx":
+            if self.rows + len(chunk) > XLSX_MAX_ROWS:
+                raise ValueError(f"{self.path}: xlsx holds at most {XLSX_MAX_ROWS} rows, use csv or parquet")
+            self.xlsx_chunks.append(chunk)
+        elif self.format == "csv":
+            first = self.rows == 0 and not self.append
+            chunk.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+        elif self.format == "jsonl":
+            with open(self.path, "w" if self.rows == 0 and not self.append else "a", encoding="utf-8") as f:
+                chunk.to_json(f, orient="records", lines=True, force_ascii=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self.format == "xlsx":
+            if self.xlsx_chunks:
+                table = pd.concat(self.xlsx_chunks, ignore_index=True)
+            else:
+                table = pd.DataFrame(columns=self.columns)
+            table.to_excel(self.path, index=False)
+            self.xlsx_chunks = []
+        elif self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self.parquet_writer is not None:
+            self.parquet_writer.close()
+        return False
@@ -0,0 +1,149 @@
+"""
+On-disk cache of text embeddings, keyed by a hash of the text and the model name.
+
+Each model (and variant, e.g. a quantized backend) has its own directory of shards. A shard is
+a pair of .npy files: the float32 vectors and the 16-byte text hashes of its rows. Every add()
+writes one shard, and shards are memory-mapped when read, so a cache much larger than RAM is
+fine. Lookups go through one sorted array of all hashes, and compact() merges the shards into
+one, e.g. at the end of a build that added a shard per chunk.
+
+    cache = EmbeddingCache("all-MiniLM-L6-v2")
+    embs = cache.encode(texts, lambda batch: sbert.encode(batch, batch_size=64))
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+
+CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "cache/embeddings")
+KEY_DTYPE = "S16"
+
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, directory=None, variant=""):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name + (f"-{variant}" if variant else ""))
+        self.directory = os.path.join(directory or CACHE_DIR, slug)
+        os.makedirs(self.directory, exist_ok=True)
+        # texts found in the cache and distinct texts encoded by the last encode() call
+        self.hits = 0
+        self.encoded = 0
+        self.load_index()
+
+    # read the hashes of every complete shard (written last, so partial shards are skipped)
+    def load_index(self):
+        self.shards, self.shard_names = [], []
+        keys, shard_ids, rows = [], [], []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".keys.npy"):
+                continue
+            shard = name[:-len(".keys.npy")]
+            vectors_path = os.path.join(self.directory, f"{shard}.vectors.npy")
+            if not os.path.exists(vectors_path):
+                continue
+            shard_keys = np.load(os.path.join(self.directory, name))
+            keys.append(shard_keys)
+            shard_ids.append(np.full(len(shard_keys), len(self.shards), dtype=np.int32))
+            rows.append(np.arange(len(shard_keys), dtype=np.int64))
+            self.shards.append(np.load(vectors_path, mmap_mode="r"))
+            self.shard_names.append(shard)
+
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=KEY_DTYPE)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.shard_ids = np.concatenate(shard_ids)[order] if shard_ids else np.empty(0, dtype=np.int32)
+        self.rows = np.concatenate(rows)[order] if rows else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # position of each key in the sorted index, -1 if not cached
+    def find(self, keys):
+        if not len(self.keys):
+            return np.full(len(keys), -1)
+        pos = np.searchsorted(self.keys, keys)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def add(self, keys, vectors):
+        if not len(keys):
+            return
+        keys = np.asarray(keys, dtype=KEY_DTYPE)
+        shard = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        for suffix, data in (("vectors", np.asarray(vectors, dtype=np.float32)), ("keys", keys)):
+            path = os.path.join(self.directory, f"{shard}.{suffix}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, data)
+            os.replace(path + ".tmp", path)
+        self.shards.append(np.load(os.path.join(self.directory, f"{shard}.vectors.npy"), mmap_mode="r"))
+        self.shard_names.append(shard)
+
+        # merge the new keys into the sorted index instead of re-reading every shard
+        order = np.argsort(keys, kind="stable")
+        pos = np.searchsorted(self.keys, keys[order])
+        self.keys = np.insert(self.keys, pos, keys[order])
+        self.shard_ids = np.insert(self.shard_ids, pos, np.int32(len(self.shards) - 1))
+        self.rows = np.insert(self.rows, pos, order.astype(np.int64))
+
+    def compact(self):
+        """
+        Merges all shards into one, in key order. The vectors are copied shard by shard into a
+        memory-mapped file, so this needs no more RAM than a lookup.
+        """
+        # include the shards other processes added since the index was read
+        self.load_index()
+        if len(self.shards) < 2:
+            return
+        shard = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        vectors_path = os.path.join(self.directory, f"{shard}.vectors.npy")
+        out = np.lib.format.open_memmap(vectors_path + ".tmp", mode="w+", dtype=np.float32,
+                                        shape=(len(self.keys), self.shards[0].shape[1]))
+        for shard_id in range(len(self.shards)):
+            selected = np.flatnonzero(self.shard_ids == shard_id)
+            out[selected] = self.shards[shard_id][self.rows[selected]]
+        out.flush()
+        del out
+        os.replace(vectors_path + ".tmp", vectors_path)
+        keys_path = os.path.join(self.directory, f"{shard}.keys.npy")
+        with open(keys_path + ".tmp", "wb") as f:
+            np.save(f, self.keys)
+        os.replace(keys_path + ".tmp", keys_path)
+
+        # the keys first, so an interrupted compaction leaves no half-removed shard to be read
+        for name in self.shard_names:
+            os.remove(os.path.join(self.directory, f"{name}.keys.npy"))
+            os.remove(os.path.join(self.directory, f"{name}.vectors.npy"))
+        print(f"Compacted {len(self.shards)} embedding cache shards into one ({len(self.keys)} texts)")
+        self.load_index()
+
+    def encode(self, texts, encode_fn):
+        """
+        Embeddings of texts, in order. Texts not in the cache are encoded with
+        encode_fn(list of texts) -> array, once per distinct text, and added to the cache.
+        """
+        keys = np.array([text_key(text) for text in texts], dtype=KEY_DTYPE)
+        pos = self.find(keys)
+
+        missing = np.flatnonzero(pos < 0)
+        new_keys, first = np.unique(keys[missing], return_index=True)
+        self.hits, self.encoded = len(texts) - len(missing), len(new_keys)
+        if len(new_keys):
+            vectors = encode_fn([texts[i] for i in missing[first]])
+            self.add(new_keys, vectors)
+            pos = self.find(keys)
+
+        if not len(texts):
+            return np.empty((0, 0), dtype=np.float32)
+        dim = self.shards[0].shape[1]
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        shard_ids, rows = self.shard_ids[pos], self.rows[pos]
+        for shard_id in np.unique(shard_ids):
+            selected = np.flatnonzero(shard_ids == shard_id)
+            out[selected] = self.shards[shard_id][rows[selected]]
+        return out
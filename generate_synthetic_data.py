@@ -0,0 +1,257 @@
+"""
+Synthetic restaurant and review datasets for scale testing the build pipeline.
+
+Writes tables with the schema of data/results.xlsx and data/yelp_reviews.xlsx (review text
+stored as a "{'text': ..., 'language': ...}" dict string), plus a classified review table with
+a scene category column as read by restaurant_type.py. Review counts per restaurant are heavy
+tailed, ratings follow the restaurant rating, a small share of reviews is not in English, and
+reviews of a scene mention it, so the build scripts see realistic-shaped input.
+
+Reviews are generated and written in fixed-size chunks with one random generator per chunk,
+so millions of reviews can be generated in bounded memory and the output only depends on
+the seed and the sizes.
+
+Usage:
+    python generate_synthetic_data.py --restaurants 20000 --reviews 2000000 --format parquet --output-dir data/synthetic
+
+The build scripts read RESULTS_PATH, REVIEWS_PATH and CLASSIFIED_REVIEWS_PATH, and write models/
+under the working directory, so run them from a scratch directory to keep the real models:
+    cd /tmp/scale && RESULTS_PATH=$REPO/data/synthetic/results.parquet \\
+        REVIEWS_PATH=$REPO/data/synthetic/yelp_reviews.parquet python $REPO/Restaurant_Recommend_TF-IDF.py
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_io import TableWriter
+
+CHUNK_SIZE = 100000
+
+CATEGORIES = [
+    "New American", "Italian", "Mexican", "Chinese", "Japanese", "Sushi Bars", "Thai", "Indian",
+    "French", "Korean", "Vietnamese", "Mediterranean", "Greek", "Spanish", "Pizza", "Burgers",
+    "Seafood", "Steakhouses", "Vegan", "Bakeries", "Cafes", "Cocktail Bars", "Wine Bars",
+    "Ramen", "Tapas Bars", "Breakfast & Brunch", "Desserts", "Delis", "Bars", "Noodles",
+]
+# neighborhoods with their approximate centre
+NEIGHBORHOODS = {
+    "Midtown West": (40.7600, -73.9900), "East Village": (40.7265, -73.9815),
+    "West Village": (40.7358, -74.0036), "Greenwich Village": (40.7336, -73.9991),
+    "SoHo": (40.7233, -74.0030), "Tribeca": (40.7163, -74.0086), "Chelsea": (40.7465, -74.0014),
+    "Hell's Kitchen": (40.7638, -73.9918), "Lower East Side": (40.7150, -73.9843),
+    "Upper West Side": (40.7870, -73.9754), "Upper East Side": (40.7736, -73.9566),
+    "Financial District": (40.7075, -74.0113), "Flatiron": (40.7410, -73.9897),
+    "Williamsburg": (40.7081, -73.9571), "Astoria": (40.7644, -73.9235),
+}
+NAME_FIRST = ["Golden", "Little", "Blue", "Red", "Old", "Corner", "Garden", "Harbor", "Union",
+              "Royal", "Silver", "Green", "Lucky", "Bella", "Casa", "Le", "Mama's", "Uncle's"]
+NAME_SECOND = ["Dragon", "Olive", "Lotus", "Smoke", "Salt", "Oak", "Kitchen", "House", "Table",
+               "Bistro", "Trattoria", "Taqueria", "Noodle Bar", "Tavern", "Grill", "Cantina", "Cafe"]
+STREETS = ["Broadway", "W 13th St", "E 4th St", "Bleecker St", "Houston St", "Canal St", "8th Ave",
+           "Lexington Ave", "Bedford Ave", "Mulberry St", "Spring St", "W 45th St"]
+FIRST_NAMES = ["Leona", "Miranda", "Mark", "Gloria", "James", "Priya", "Chen", "Sofia", "Omar",
+               "Emily", "Daniel", "Aisha", "Lucas", "Hannah", "Kenji", "Maria", "Noah", "Zoe"]
+
+DISHES = ["pizza", "pasta", "burger", "tacos", "sushi", "ramen", "steak", "salad", "dumplings",
+          "curry", "oysters", "lobster roll", "fried chicken", "fries", "sandwich", "bagel",
+          "burrata", "tiramisu", "pho", "bibimbap", "paella", "carbonara", "cheesecake", "omakase"]
+DRINKS = ["cocktail", "glass of red wine", "margarita", "espresso", "craft beer", "negroni", "mocktail"]
+ADJECTIVES = ["amazing", "delicious", "fresh", "bland", "overpriced", "authentic", "cozy",
+              "spicy", "perfect", "decent", "incredible", "salty", "generous", "tiny"]
+SENTENCES = [
+    "The {dish} was {adj} and the {drink} was even better.",
+    "We ordered the {dish} to share and it was {adj}.",
+    "Service was {adj}, our server checked on us often.",
+    "The ambience is {adj} but it gets loud on weekends.",
+    "I would come back just for the {dish}.",
+    "Prices are a bit high for a {adj} {dish}.",
+    "Had to wait 30 minutes for a table but the {dish} made up for it.",
+    "Great spot near the subway, the {drink} list is {adj}.",
+]
+# sentences that make a review belong to a scene, used by zero-shot classification
+SCENE_SENTENCES = {
+    "dating": ["Perfect place for a date night, very romantic lighting.",
+               "Took my girlfriend here for our anniversary and it was so intimate."],
+    "family": ["Came with my kids and parents, they have high chairs and a kids menu.",
+               "Great for a family dinner, the staff was lovely with our children."],
+    "friend": ["Went with a group of friends for birthday drinks, super fun vibe.",
+               "Good place to hang out with friends and share plates."],
+    "professional": ["Had a business lunch with clients here, quiet enough to talk.",
+                     "Brought coworkers for a team dinner after a work meeting."],
+}
+SCENES = ["other", "family", "friend", "professional", "dating"]
+# share of reviews per scene in data/yelp_reviews_classified_output8000.xlsx
+SCENE_SHARES = np.array([0.52, 0.37, 0.04, 0.035, 0.035])
+NON_ENGLISH = [
+    ("Comida deliciosa y servicio excelente, volveremos pronto.", "es"),
+    ("Très bon restaurant, le service était rapide et sympathique.", "fr"),
+    ("Sehr leckeres Essen, aber etwas zu teuer.", "de"),
+    ("料理はとても美味しかったです。また来たいです。", "ja"),
+]
+
+START_TIME = np.datetime64("2015-01-01T00:00:00")
+END_TIME = np.datetime64("2025-06-01T00:00:00")
+
+
+def random_ids(rng, n, length=22):
+    alphabet = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"))
+    return ["".join(row) for row in rng.choice(alphabet, size=(n, length))]
+
+
+# restaurant table with the columns of data/results.xlsx read by the build scripts and the app
+def generate_restaurants(n, n_reviews, seed):
+    rng = np.random.default_rng([seed, 0])
+
+    names, seen = [], {}
+    neighborhoods = rng.choice(list(NEIGHBORHOODS), size=n)
+    for first, second, neighborhood in zip(rng.choice(NAME_FIRST, size=n), rng.choice(NAME_SECOND, size=n),
+                                           neighborhoods):
+        name = f"{first} {second}"
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        # repeated names get the neighborhood (and then a branch number), like chains on Yelp
+        if count:
+            name = f"{name} - {neighborhood}" + (f" {count + 1}" if count > 1 else "")
+        names.append(name)
+
+    n_categories = rng.integers(1, 4, size=n)
+    categories = [",".join(rng.choice(CATEGORIES, size=k, replace=False)) for k in n_categories]
+
+    # heavy tailed number of fetched reviews per restaurant, summing to n_reviews
+    weights = rng.lognormal(mean=0.0, sigma=1.0, size=n)
+    review_counts = rng.multinomial(n_reviews, weights / weights.sum()) if n_reviews else np.zeros(n, int)
+    rating = np.clip(np.round(rng.normal(4.1, 0.4, size=n), 1), 1.0, 5.0)
+    # total count on Yelp is larger than the number of fetched reviews
+    yelp_count = np.maximum(review_counts, 1) * rng.integers(1, 40, size=n)
+
+    centres = np.array([NEIGHBORHOODS[h] for h in neighborhoods])
+    coords = centres + rng.normal(0, 0.004, size=(n, 2))
+    restaurants = pd.DataFrame({
+        "Name": names,
+        "Address": [f"{number} {street}, New York, NY" for number, street in
+                    zip(rng.integers(1, 999, size=n), rng.choice(STREETS, size=n))],
+        "Rating": rating,
+        "ReviewCount": yelp_count,
+        "PriceRange": rng.choice(["$", "$$", "$$$", "$$$$"], size=n, p=[0.25, 0.5, 0.2, 0.05]),
+        "Longitude": coords[:, 1],
+        "Latitude": coords[:, 0],
+        "Categories": categories,
+        "BizId": random_ids(rng, n),
+        "Neighborhoods_0": neighborhoods,
+    })
+    # Ranking is the position in the search results, best rated with most reviews first
+    order = np.lexsort((-yelp_count, -rating))
+    ranking = np.empty(n, dtype=int)
+    ranking[order] = np.arange(1, n + 1)
+    restaurants["Ranking"] = ranking
+    return restaurants, review_counts
+
+
+# review texts for the given scenes, with all random draws done for the whole chunk at once
+def review_texts(rng, scene_ids, non_english):
+    n = len(scene_ids)
+    n_sentences = rng.integers(1, 6, size=n)
+    total = int(n_sentences.sum())
+    sentences = [
+        SENTENCES[t].format(dish=dish, drink=drink, adj=adj) for t, dish, drink, adj in zip(
+            rng.integers(0, len(SENTENCES), size=total), rng.choice(DISHES, size=total),
+            rng.choice(DRINKS, size=total), rng.choice(ADJECTIVES, size=total))
+    ]
+    offsets = np.concatenate([[0], np.cumsum(n_sentences)])
+    scene_positions = rng.integers(0, n_sentences + 1)
+    scene_options = rng.integers(0, 2, size=n)
+    foreign = rng.random(n) < non_english
+    foreign_choice = rng.integers(0, len(NON_ENGLISH), size=n)
+
+    texts = []
+    for i in range(n):
+        if foreign[i]:
+            text, language = NON_ENGLISH[foreign_choice[i]]
+        else:
+            parts = sentences[offsets[i]:offsets[i + 1]]
+            scene = SCENES[scene_ids[i]]
+            if scene != "other":
+                parts.insert(scene_positions[i], SCENE_SENTENCES[scene][scene_options[i]])
+            text, language = " ".join(parts), "en"
+        texts.append(str({"text": text, "language": language}))
+    return texts
+
+
+# one chunk of reviews for the restaurants in [first, last), with their review counts
+def generate_review_chunk(restaurants, review_counts, scene_mix, first, last, seed, chunk_index,
+                          non_english):
+    rng = np.random.default_rng([seed, 1, chunk_index])
+    idx = np.repeat(np.arange(first, last), review_counts[first:last])
+    n = len(idx)
+
+    # draw each review's scene from its restaurant's scene mix
+    scene_ids = (rng.random(n)[:, None] > np.cumsum(scene_mix[idx], axis=1)[:, :-1]).sum(axis=1)
+    texts = review_texts(rng, scene_ids, non_english)
+
+    seconds = rng.integers(0, int((END_TIME - START_TIME) / np.timedelta64(1, "s")), size=n)
+    times = np.datetime_as_string(START_TIME + seconds.astype("timedelta64[s]"), unit="s")
+    base_rating = restaurants["Rating"].to_numpy()[idx]
+    chunk = pd.DataFrame({
+        "business_id": restaurants["BizId"].to_numpy()[idx],
+        "business_name": restaurants["Name"].to_numpy()[idx],
+        "username": [f"{first_name} {initial}." for first_name, initial in
+                     zip(rng.choice(FIRST_NAMES, size=n), rng.choice(list("ABCDEFGHIJKLMNOPRSTW"), size=n))],
+        "rating": np.clip(np.round(rng.normal(base_rating, 1.0)), 1, 5).astype(int),
+        "time_created": [t + "Z" for t in times],
+        "text": texts,
+    })
+    return chunk, [SCENES[s] for s in scene_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic restaurant and review data")
+    parser.add_argument("--restaurants", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=400000, help="total number of reviews")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", default="csv", choices=["xlsx", "csv", "parquet", "jsonl"])
+    parser.add_argument("--output-dir", default="data/synthetic")
+    parser.add_argument("--non-english", type=float, default=0.03, help="share of reviews not in English")
+    parser.add_argument("--no-classified", action="store_true",
+                        help="skip the classified review table read by restaurant_type.py")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    os.makedirs(args.output_dir, exist_ok=True)
+    restaurants_path = os.path.join(args.output_dir, f"results.{args.format}")
+    reviews_path = os.path.join(args.output_dir, f"yelp_reviews.{args.format}")
+    classified_path = os.path.join(args.output_dir, f"yelp_reviews_classified.{args.format}")
+
+    restaurants, review_counts = generate_restaurants(args.restaurants, args.reviews, args.seed)
+    with TableWriter(restaurants_path) as writer:
+        writer.write(restaurants)
+    print(f"Saved {len(restaurants):,} restaurants to '{restaurants_path}'")
+
+    # each restaurant leans towards some scenes, so restaurant_type.py has something to find
+    mix_rng = np.random.default_rng([args.seed, 2])
+    scene_mix = SCENE_SHARES * mix_rng.gamma(0.5, 2.0, size=(args.restaurants, len(SCENES)))
+    scene_mix /= scene_mix.sum(axis=1, keepdims=True)
+
+    reviews_writer = TableWriter(reviews_path)
+    classified_writer = None if args.no_classified else TableWriter(classified_path)
+    # chunk boundaries fall on restaurants, so a restaurant's reviews stay together
+    boundaries = np.searchsorted(np.cumsum(review_counts), np.arange(CHUNK_SIZE, args.reviews, CHUNK_SIZE))
+    edges = [0] + sorted(set(int(b) + 1 for b in boundaries if b + 1 < args.restaurants)) + [args.restaurants]
+    for chunk_index, (first, last) in enumerate(zip(edges[:-1], edges[1:])):
+        chunk, scenes = generate_review_chunk(restaurants, review_counts, scene_mix, first, last,
+                                              args.seed, chunk_index, args.non_english)
+        reviews_writer.write(chunk)
+        if classified_writer is not None:
+            classified_writer.write(chunk.assign(category=scenes))
+        print(f"  {reviews_writer.rows:,} / {args.reviews:,} reviews ({time.perf_counter() - start:.1f}s)")
+    reviews_writer.close()
+    print(f"Saved {reviews_writer.rows:,} reviews to '{reviews_path}'")
+    if classified_writer is not None:
+        classified_writer.close()
+        print(f"Saved classified reviews to '{classified_path}'")
+
+
+if __name__ == "__main__":
+    main()
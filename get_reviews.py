@@ -1,86 +1,356 @@
-import pandas as pd
-from serpapi import GoogleSearch
+"""
+Fetches the Yelp reviews of every business in the scraped restaurant tables through SerpApi.
+
+Up to --concurrency businesses are fetched at the same time, with all requests going through one
+token bucket (--rate requests per second, bursts of --burst), and failed requests are retried with
+exponential backoff. Reviews are appended to --output (.jsonl or .csv; a .parquet output is a
+directory that gets one part file per flush), and every business is recorded in a checkpoint file
+once its reviews are written, so an interrupted run continues with the businesses it had not
+finished yet. Businesses that failed are retried on the next run.
+
+After the businesses of every flush the checkpoint gets a commit line with the size of the output
+(or the parquet part written). Reviews written after the last commit belong to businesses that
+will be fetched again, so a resumed run cuts them off first instead of appending duplicates.
+
+Usage:
+    SERPAPI_API_KEY=... python get_reviews.py --output yelp_reviews.jsonl --concurrency 8 --rate 5
+
+Against the fake review endpoint of stub_upstreams.py:
+    python get_reviews.py --transport http --base-url http://127.0.0.1:8099
+"""
+import argparse
+import json
+import os
+import threading
 import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
-api_key = "5c639bb14921e4a79215e9b83eb0dcda670ea5adc1ad93376a47c6001a241530"
-
-# Read local files
-csv_df   = pd.read_csv('results.csv')
-xlsx_df  = pd.read_excel('results.xlsx')
-
-# Extract and merge all id columns, remove duplicates
-ids = pd.concat([csv_df['BizId'], xlsx_df['BizId']]) \
-        .dropna() \
-        .astype(str) \
-        .unique() \
-        .tolist()
-
-# Create mapping from business ID to name
-business_names = {}
-for df in [csv_df, xlsx_df]:
-    for _, row in df.iterrows():
-        if pd.notna(row['BizId']) and pd.notna(row['Name']):
-            business_names[str(row['BizId'])] = row['Name']
-
-# Loop through each business_id and call SerpApi's Yelp engine
-all_reviews = []
-# Process only first 20 businesses
-for i, business_id in enumerate(ids[:20], 1):
-    print(f"\n[{i}/20] Fetching reviews for business {business_id} ({business_names.get(business_id, 'Unknown Business')})...")
-    
-    search = GoogleSearch({
-        "api_key": api_key,
-        "engine": "yelp_reviews",
-        "place_id": business_id,
-    })
-    
-    try:
-        result = search.get_dict()
-        
-        if "error" in result:
-            print(f"Warning: Error returned for business {business_id}: {result['error']}")
+import pandas as pd
+import requests
+
+from data_io import TableWriter, read_table, table_format
+
+UNKNOWN_BUSINESS = "Unknown Business"
+
+
+class TokenBucket:
+    """
+    Allows rate acquire() calls per second on average, and up to burst at once after being idle
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class SerpApiTransport:
+    def __init__(self, api_key):
+        if not api_key:
+            raise ValueError("Set SERPAPI_API_KEY to fetch reviews from SerpApi")
+        self.api_key = api_key
+
+    def fetch(self, business_id):
+        from serpapi import GoogleSearch
+        return GoogleSearch({
+            "api_key": self.api_key,
+            "engine": "yelp_reviews",
+            "place_id": business_id,
+        }).get_dict()
+
+
+class HttpTransport:
+    """
+    GETs {base_url}/reviews?place_id=..., any server answering with SerpApi-shaped JSON
+    (e.g. stub_upstreams.py)
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # one session (and connection pool) per fetching thread
+        self.local = threading.local()
+
+    def fetch(self, business_id):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        response = session.get(f"{self.base_url}/reviews", timeout=self.timeout,
+                               params={"engine": "yelp_reviews", "place_id": business_id})
+        response.raise_for_status()
+        return response.json()
+
+
+# business ids in file order, and the name of each id (the last file naming it wins)
+def load_businesses(paths):
+    frames = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Skipping missing input {path}")
+            continue
+        frames.append(read_table(path, usecols=["BizId", "Name"]))
+    if not frames:
+        raise FileNotFoundError(f"None of the inputs exist: {', '.join(paths)}")
+    df = pd.concat(frames, ignore_index=True).dropna(subset=["BizId"])
+    df["BizId"] = df["BizId"].astype(str)
+    ids = df["BizId"].unique().tolist()
+    names = df.dropna(subset=["Name"]).drop_duplicates("BizId", keep="last").set_index("BizId")["Name"]
+    return ids, names.to_dict()
+
+
+# business ids already fetched and the commit lines, from the checkpoint of earlier runs.
+# Businesses of a flush whose commit line is missing were not fully written.
+def load_checkpoint(path):
+    status, pending, commits = {}, {}, []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of a run killed while writing it
+                    continue
+                if "commit" in entry:
+                    commits.append(entry)
+                    status.update(pending.pop(entry["commit"], {}))
+                elif "flush" in entry:
+                    pending.setdefault(entry["flush"], {})[entry["business_id"]] = entry["status"]
+                else:
+                    # written before checkpoints had commit lines
+                    status[entry["business_id"]] = entry["status"]
+    return {business_id for business_id, s in status.items() if s == "ok"}, commits
+
+
+def review_rows(business_id, business_name, result):
+    rows = []
+    for rev in result.get("reviews", []):
+        comment = rev.get("comment")
+        rows.append({
+            "business_id": business_id,
+            "business_name": business_name,
+            "username": (rev.get("user") or {}).get("name"),
+            "rating": rev.get("rating"),
+            "time_created": rev.get("date"),
+            # kept as the dict's repr, the way the Excel exports stored it, for the build scripts
+            "text": str(comment) if isinstance(comment, dict) else comment,
+        })
+    return rows
+
+
+# (status, error, result) of one business, retrying failed requests with exponential backoff
+def fetch_business(transport, bucket, business_id, retries, backoff):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            result = transport.fetch(business_id)
+        except Exception as e:
+            if attempt == retries:
+                return "error", f"{type(e).__name__}: {e}", None
+            time.sleep(backoff * 2 ** attempt)
             continue
-            
-        reviews = result.get("reviews", [])
-        print(f"Retrieved {len(reviews)} reviews")
-        
-        for rev in reviews:
-            review_data = {
-                "business_id": business_id,
-                "business_name": business_names.get(business_id, "Unknown Business"),
-                "username": rev.get("user", {}).get("name"),
-                "rating": rev.get("rating"),
-                "time_created": rev.get("date"),
-                "text": rev.get("comment"),
-            }
-            all_reviews.append(review_data)
-            
-        # Save backup every 10 businesses to prevent data loss
-        if i % 10 == 0:
-            temp_df = pd.DataFrame(all_reviews)
-            temp_df.to_excel(f'yelp_reviews_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx', 
-                           index=False)
-            
-        # Add delay to avoid too many requests
-        time.sleep(1)
-        
-    except Exception as e:
-        print(f"Error: Exception occurred while processing business {business_id}: {str(e)}")
-        continue
-
-print(f"\nTotal reviews collected: {len(all_reviews)}")
-
-# Save final results
-reviews_df = pd.DataFrame(all_reviews)
-output_filename = f'yelp_reviews_final_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-reviews_df.to_excel(output_filename, index=False)
-print(f"Review data saved to file: {output_filename}")
-
-# Display statistics
-print("\nStatistics:")
-print(f"Total businesses: {len(ids)}")
-print(f"Successfully processed businesses: {len(reviews_df['business_id'].unique())}")
-print(f"Average reviews per business: {len(reviews_df) / len(reviews_df['business_id'].unique()):.1f}")
-print("\nRating distribution:")
-print(reviews_df['rating'].value_counts().sort_index())
\ No newline at end of file
+        # errors reported by the API itself (e.g. an unknown place_id) are not retried
+        if "error" in result:
+            return "error", str(result["error"]), None
+        return "ok", None, result
+
+
+class ReviewOutput:
+    """
+    Appends buffered reviews to the output, then records their businesses in the checkpoint,
+    so a business is only marked done once its reviews are on disk. done holds the businesses
+    fetched by earlier runs.
+    """
+
+    def __init__(self, path, checkpoint_path):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.format = table_format(path)
+        if self.format == "xlsx":
+            raise ValueError("xlsx cannot be appended to, use a .jsonl, .csv or .parquet output")
+        if self.format == "parquet":
+            os.makedirs(path, exist_ok=True)
+        self.rows = []
+        self.entries = []
+        self.parts = 0
+        self.run = uuid.uuid4().hex[:8]
+        self.done, commits = load_checkpoint(checkpoint_path)
+        # a line cut off by a killed run must not run into the next one
+        if os.path.exists(checkpoint_path) and os.path.getsize(checkpoint_path):
+            with open(checkpoint_path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        self.recover(commits)
+        # commits the output as it is now, so a crash in the first flush is cut off as well
+        self.commit("open", self.committed_state())
+
+    # remove what was written to the output after the last commit of an earlier run
+    def recover(self, commits):
+        if not commits:
+            return
+        if self.format == "parquet":
+            committed = set()
+            for entry in commits:
+                committed.update(entry.get("parts", []))
+            removed = [name for name in os.listdir(self.path) if name.endswith(".parquet") and name not in committed]
+            for name in removed:
+                os.remove(os.path.join(self.path, name))
+            if removed:
+                print(f"Removed {len(removed)} uncommitted part files of an interrupted run from {self.path}")
+        elif os.path.exists(self.path) and os.path.getsize(self.path) > commits[-1].get("output_bytes", float("inf")):
+            with open(self.path, "r+b") as f:
+                f.truncate(commits[-1]["output_bytes"])
+            print(f"Cut {self.path} back to its last commit, the reviews after it are fetched again")
+
+    # commit line fields for the whole output: its part files or its size
+    def committed_state(self):
+        if self.format == "parquet":
+            return {"parts": sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))}
+        return {"output_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+    def commit(self, token, state, entries=()):
+        # the businesses and their commit line in one write, the commit line last
+        lines = [json.dumps({**entry, "flush": token}) + "\n" for entry in entries]
+        lines.append(json.dumps({"commit": token, **state}) + "\n")
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    def add(self, rows, entry):
+        self.rows.extend(rows)
+        self.entries.append(entry)
+
+    def flush(self):
+        if not self.entries:
+            return
+        self.parts += 1
+        name = None
+        if self.rows:
+            df = pd.DataFrame(self.rows)
+            if self.format == "parquet":
+                name = f"part-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{self.parts:05d}.parquet"
+                df.to_parquet(os.path.join(self.path, name), index=False)
+            else:
+                writer = TableWriter(self.path, append=True)
+                writer.write(df)
+                writer.close()
+        state = {"parts": [name] if name else []} if self.format == "parquet" else self.committed_state()
+        self.commit(f"{self.run}-{self.parts}", state, self.entries)
+        self.rows = []
+        self.entries = []
+
+
+def fetch_all(ids, names, transport, output, concurrency, bucket, retries, backoff, flush_every):
+    stats = {"ok": 0, "error": 0, "reviews": 0, "ratings": Counter()}
+    start = time.perf_counter()
+    todo = iter(ids)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="reviews") as executor:
+        while True:
+            # keep a bounded window of businesses in flight
+            while len(pending) < concurrency * 2:
+                business_id = next(todo, None)
+                if business_id is None:
+                    break
+                future = executor.submit(fetch_business, transport, bucket, business_id, retries, backoff)
+                pending[future] = business_id
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                business_id = pending.pop(future)
+                name = names.get(business_id, UNKNOWN_BUSINESS)
+                status, error, result = future.result()
+                rows = review_rows(business_id, name, result) if status == "ok" else []
+                entry = {"business_id": business_id, "status": status, "reviews": len(rows)}
+                if error:
+                    entry["error"] = error
+                    print(f"Warning: failed to fetch business {business_id} ({name}): {error}")
+                output.add(rows, entry)
+                stats[status] += 1
+                stats["reviews"] += len(rows)
+                stats["ratings"].update(row["rating"] for row in rows)
+
+                finished = stats["ok"] + stats["error"]
+                if finished % 50 == 0:
+                    rate = finished / (time.perf_counter() - start)
+                    print(f"[{finished}/{len(ids)}] {stats['reviews']} reviews, {rate:.1f} businesses/s")
+            if len(output.entries) >= flush_every:
+                output.flush()
+    output.flush()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch Yelp reviews of the scraped restaurants")
+    parser.add_argument("--inputs", nargs="+", default=["results.csv", "results.xlsx"],
+                        help="restaurant tables with BizId and Name columns")
+    parser.add_argument("--output", default="yelp_reviews.jsonl", help=".jsonl, .csv or .parquet (directory)")
+    parser.add_argument("--checkpoint", help="default: <output>.checkpoint.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8, help="businesses fetched at the same time")
+    parser.add_argument("--rate", type=float, default=5, help="requests per second")
+    parser.add_argument("--burst", type=int, default=5, help="requests allowed at once after being idle")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=1.0, help="seconds before the first retry")
+    parser.add_argument("--flush-every", type=int, default=20, help="businesses buffered between writes")
+    parser.add_argument("--limit", type=int, help="fetch at most this many businesses in this run")
+    parser.add_argument("--transport", choices=["serpapi", "http"], default="serpapi")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8099", help="server of the http transport")
+    args = parser.parse_args()
+
+    # "reviews.parquet/" names the same directory as "reviews.parquet"
+    args.output = args.output.rstrip("/\\") or args.output
+    checkpoint = args.checkpoint or args.output + ".checkpoint.jsonl"
+    ids, names = load_businesses(args.inputs)
+    output = ReviewOutput(args.output, checkpoint)
+    done = output.done
+    todo = [business_id for business_id in ids if business_id not in done]
+    if args.limit is not None:
+        todo = todo[:args.limit]
+    print(f"{len(ids)} businesses, {len(done)} already fetched, fetching {len(todo)}")
+
+    if args.transport == "serpapi":
+        transport = SerpApiTransport(os.environ.get("SERPAPI_API_KEY"))
+    else:
+        transport = HttpTransport(args.base_url)
+    bucket = TokenBucket(args.rate, args.burst)
+    try:
+        stats = fetch_all(todo, names, transport, output, args.concurrency, bucket, args.retries,
+                          args.backoff, args.flush_every)
+    except KeyboardInterrupt:
+        # businesses still in flight are fetched again on the next run
+        output.flush()
+        print("\nInterrupted, run again to continue")
+        return
+
+    print(f"\nReview data appended to: {args.output}")
+    print("\nStatistics:")
+    print(f"Businesses fetched: {stats['ok']}, failed: {stats['error']} in {stats['seconds']:.1f}s "
+          f"({len(todo) / max(stats['seconds'], 1e-9):.1f} businesses/s)")
+    print(f"Reviews collected: {stats['reviews']}")
+    if stats["ok"]:
+        print(f"Average reviews per business: {stats['reviews'] / stats['ok']:.1f}")
+    print("\nRating distribution:")
+    for rating, count in sorted(stats["ratings"].items(), key=lambda item: str(item[0])):
+        print(f"{rating}: {count}")
+
+
+if __name__ == "__main__":
+    main()
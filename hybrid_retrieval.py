@@ -0,0 +1,183 @@
+"""
+Hybrid keyword retrieval: BM25 over the stemmed restaurant tags plus SBERT embeddings.
+
+Both retrievers run at the same time and each returns only its top candidates (one sparse
+column sum for BM25, one matrix-vector product for the embeddings). The union of the two
+candidate lists is then scored exactly by both and reranked with reciprocal rank fusion
+(HYBRID_FUSION=rrf, default) or a weighted sum of min-max normalized scores
+(HYBRID_FUSION=weighted, weight HYBRID_DENSE_WEIGHT on the embeddings).
+
+When the SBERT embeddings or the model are not available, only BM25 is used.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from query_encoder import QueryEncoder
+
+SBERT_MODEL = "all-MiniLM-L6-v2"
+SBERT_EMBEDDINGS_PKL = "models_sbert/restaurant_embeddings_sbert.pkl"
+# the restaurant rows of the embeddings, which need not be those of the TF-IDF build
+SBERT_INFO_PKL = "models_sbert/restaurant_info_sbert.pkl"
+CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 100))
+FUSION = os.environ.get("HYBRID_FUSION", "rrf")
+DENSE_WEIGHT = float(os.environ.get("HYBRID_DENSE_WEIGHT", 0.5))
+RRF_K = 60
+
+# the two retrievers of a query run side by side
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+
+
+# indices of the n highest scores, best first
+def top_n(scores, n):
+    if n >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, n - 1)[:n]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over already stemmed documents. The per-document weight of every term is
+    precomputed, so scoring a query is a sum of a few sparse columns.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.vectorizer = CountVectorizer()
+        tf = self.vectorizer.fit_transform(documents).tocsr().astype(np.float32)
+        n_docs = tf.shape[0]
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if n_docs else 0.0
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len)) * idf, on the stored entries only
+        norm = k1 * (1 - b + b * doc_len / avg_len) if avg_len else np.full(n_docs, k1)
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        tf.data = tf.data * (k1 + 1) / (tf.data + norm[rows]) * idf[tf.indices]
+        self.weights = tf.tocsc()
+        self.analyze = self.vectorizer.build_analyzer()
+
+    def score(self, query, rows=None):
+        vocabulary = self.vectorizer.vocabulary_
+        terms = [vocabulary[t] for t in set(self.analyze(query)) if t in vocabulary]
+        if not terms:
+            n = self.weights.shape[0] if rows is None else len(rows)
+            return np.zeros(n, dtype=np.float32)
+        scores = np.asarray(self.weights[:, terms].sum(axis=1)).ravel()
+        return scores if rows is None else scores[rows]
+
+
+class DenseIndex:
+    def __init__(self, embeddings, encode):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.embeddings = embeddings / np.maximum(norms, 1e-12)
+        # encode(text) -> embedding of the query
+        self.encode = encode
+
+    def score(self, text, rows=None):
+        q = np.asarray(self.encode(text), dtype=np.float32).ravel()
+        q = q / max(np.linalg.norm(q), 1e-12)
+        embeddings = self.embeddings if rows is None else self.embeddings[rows]
+        return embeddings @ q
+
+
+class HybridRetriever:
+    def __init__(self, bm25, dense=None, candidates=CANDIDATES, fusion=FUSION, dense_weight=DENSE_WEIGHT):
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion '{fusion}', use rrf or weighted")
+        self.bm25 = bm25
+        self.dense = dense
+        self.candidates = candidates
+        self.fusion = fusion
+        self.dense_weight = dense_weight
+
+    def search(self, stemmed_query, text_query, k=10, rows=None):
+        """
+        Top k rows for a query as (row ids, fused scores). The fused scores (RRF, weighted or
+        raw BM25) are only comparable within one query. stemmed_query is matched against the
+        stemmed tags, text_query is embedded. rows restricts the search to those row ids.
+        """
+        rows = None if rows is None else np.asarray(rows)
+        if rows is not None and not len(rows):
+            return rows, np.empty(0)
+        if self.dense is None:
+            scores = self.bm25.score(stemmed_query, rows)
+            order = top_n(scores, k)
+            return (order if rows is None else rows[order]), scores[order]
+
+        # each retriever scores its candidates on its own, the dense one in the executor thread
+        dense_future = executor.submit(self.dense.score, text_query, rows)
+        bm25_scores = self.bm25.score(stemmed_query, rows)
+        dense_scores = dense_future.result()
+        union = np.union1d(top_n(bm25_scores, self.candidates), top_n(dense_scores, self.candidates))
+
+        # rerank only the union with both scores
+        bm25_union, dense_union = bm25_scores[union], dense_scores[union]
+        if self.fusion == "rrf":
+            fused = np.zeros(len(union))
+            for scores in (bm25_union, dense_union):
+                ranks = np.empty(len(union))
+                ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(union) + 1)
+                fused += 1.0 / (RRF_K + ranks)
+        else:
+            fused = (self.dense_weight * min_max(dense_union)
+                     + (1 - self.dense_weight) * min_max(bm25_union))
+        order = top_n(fused, k)
+        chosen = union[order]
+        return (chosen if rows is None else rows[chosen]), fused[order]
+
+
+def min_max(scores):
+    low, high = scores.min(), scores.max()
+    return (scores - low) / (high - low) if high > low else np.zeros_like(scores, dtype=float)
+
+
+# SBERT query encoder (micro-batched and cached, see query_encoder.py), None if the model cannot be loaded
+def load_query_encoder(model_name=SBERT_MODEL):
+    try:
+        import inference
+        model = inference.load_sbert(model_name)
+    except Exception as e:
+        print(f"SBERT query encoder unavailable, hybrid retrieval uses BM25 only: {e}")
+        return None
+    encoder = QueryEncoder(lambda texts: model.encode(texts, batch_size=len(texts), convert_to_numpy=True),
+                           name=model_name)
+    return encoder.encode
+
+
+# the embeddings in the order of names, reindexed by restaurant name if the SBERT build has
+# its rows in another order, None if they cannot be matched up
+def align_embeddings(embeddings, embedding_names, names):
+    embedding_names, names = list(embedding_names), list(names)
+    if len(embeddings) != len(embedding_names):
+        return None
+    if embedding_names == names:
+        return embeddings
+    position = {name: i for i, name in enumerate(embedding_names)}
+    if len(position) != len(embedding_names) or len(set(names)) != len(names) \
+            or any(name not in position for name in names):
+        return None
+    return np.asarray(embeddings)[[position[name] for name in names]]
+
+
+def build_hybrid_retriever(info_df, embeddings=None, encode=None, embedding_names=None):
+    """
+    embedding_names are the restaurant names of the embedding rows, the embeddings are only
+    used if they can be matched up with the rows of info_df by name
+    """
+    bm25 = BM25Index(info_df['tags'].fillna('').tolist())
+    dense = None
+    if embeddings is not None and encode is not None:
+        aligned = None
+        if embedding_names is not None:
+            aligned = align_embeddings(embeddings, embedding_names, info_df['restaurant_name'])
+        if aligned is None:
+            print(f"SBERT embeddings ({len(embeddings)} rows) do not match the {len(info_df)} restaurants "
+                  f"by name, hybrid retrieval uses BM25 only")
+        else:
+            dense = DenseIndex(aligned, encode)
+    return HybridRetriever(bm25, dense)
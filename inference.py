@@ -0,0 +1,75 @@
+"""
+CPU inference settings for the SBERT and BART-MNLI models.
+
+INFERENCE_BACKEND selects how the models run:
+  - torch (default): fp32 PyTorch, as before
+  - int8: the Linear layers are dynamically quantized to int8, usually 2-3x faster on CPU
+    for a small accuracy change (see benchmark_inference.py)
+INFERENCE_THREADS sets the number of intra-op threads (default: PyTorch's choice).
+
+SentenceTransformer.encode already sorts sentences by length before batching. The zero-shot
+pipeline does not, so zero_shot_labels() sorts texts by length to cut padding.
+"""
+import os
+
+import numpy as np
+from tqdm.auto import tqdm
+
+BACKENDS = ("torch", "int8")
+BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+THREADS = int(os.environ.get("INFERENCE_THREADS", 0))
+
+
+def configure_threads(threads=THREADS):
+    import torch
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+
+def quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', choose from {', '.join(BACKENDS)}")
+
+
+# SentenceTransformer running on the given backend
+def load_sbert(model_name, backend=BACKEND):
+    from sentence_transformers import SentenceTransformer
+    check_backend(backend)
+    configure_threads()
+    # quantized models only run on CPU
+    model = SentenceTransformer(model_name, device="cpu" if backend == "int8" else None)
+    if backend == "int8":
+        model = quantize(model)
+    return model
+
+
+# zero-shot classification pipeline running on the given backend
+def load_zero_shot(model_name, backend=BACKEND, device=-1):
+    from transformers import pipeline
+    check_backend(backend)
+    configure_threads()
+    classifier = pipeline("zero-shot-classification", model=model_name,
+                          device=-1 if backend == "int8" else device)
+    if backend == "int8":
+        classifier.model = quantize(classifier.model)
+    return classifier
+
+
+# top label of each text, with texts batched by length
+def zero_shot_labels(classifier, texts, candidate_labels, batch_size=32):
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    labels = [None] * len(texts)
+    for start in tqdm(range(0, len(texts), batch_size), desc="MNLI batches"):
+        batch = order[start:start + batch_size]
+        out = classifier([texts[i] for i in batch], candidate_labels=candidate_labels,
+                         truncation=True, batch_size=batch_size)
+        if isinstance(out, dict):
+            out = [out]
+        for i, result in zip(batch, out):
+            labels[i] = result["labels"][0]
+    return labels
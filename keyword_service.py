@@ -0,0 +1,152 @@
+"""
+Keyword extraction in a separate pool of processes, so web workers do not load spaCy.
+
+Start the service with N extraction processes, each loading the spaCy model once:
+
+    python keyword_service.py --address 127.0.0.1:6010 --workers 4
+
+and point the web app at it with KEYWORD_SERVICE_ADDR=127.0.0.1:6010 (a path instead of
+host:port uses a Unix socket). Connections are authenticated with KEYWORD_SERVICE_AUTHKEY,
+a secret that both sides must share and that has no default: the connection unpickles what it
+receives, so anyone knowing the key can run code in the service. Every web request gets its keywords from the pool, waiting at most
+KEYWORD_SERVICE_TIMEOUT seconds.
+"""
+import argparse
+import os
+import threading
+import time
+from multiprocessing import Pool, TimeoutError as PoolTimeoutError
+from multiprocessing.connection import Client, Listener
+
+AUTHKEY = os.environ.get("KEYWORD_SERVICE_AUTHKEY", "").encode()
+TIMEOUT = float(os.environ.get("KEYWORD_SERVICE_TIMEOUT", 5))
+
+# the extractor of each pool process, or the error that kept it from loading
+worker_extractor = None
+worker_error = None
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def require_authkey():
+    if not AUTHKEY:
+        raise ValueError("Set KEYWORD_SERVICE_AUTHKEY to a secret shared by the keyword service and its clients")
+
+
+# a failing initializer would make the pool restart its processes forever, so keep the error
+def init_worker():
+    global worker_extractor, worker_error
+    try:
+        from extract_keywords import KeywordExtractor
+        worker_extractor = KeywordExtractor()
+    except Exception as e:
+        print(f"Keyword extractor failed to load in process {os.getpid()}: {e}")
+        worker_error = e
+
+
+def extract_in_worker(text):
+    if worker_extractor is None:
+        raise RuntimeError(f"keyword extractor not loaded: {worker_error}")
+    return worker_extractor.extract_keywords(text)
+
+
+# answer the requests of one client connection until it closes
+def serve_connection(conn, pool):
+    with conn:
+        while True:
+            try:
+                text = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", pool.apply_async(extract_in_worker, (text,)).get(TIMEOUT))
+            except PoolTimeoutError:
+                # the worker keeps going, but this connection is free for the next request
+                reply = ("error", f"keyword extraction did not finish within {TIMEOUT}s")
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {e}")
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+def serve(address, workers):
+    require_authkey()
+    pool = Pool(workers, initializer=init_worker)
+    address = parse_address(address)
+    # a Unix socket left behind by a killed service
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+    with Listener(address, authkey=AUTHKEY) as listener:
+        print(f"Keyword service listening on {address} with {workers} worker processes")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # e.g. a client with the wrong authkey
+                print(f"Rejected keyword service connection: {e}")
+                continue
+            threading.Thread(target=serve_connection, args=(conn, pool), daemon=True).start()
+
+
+class KeywordServiceClient:
+    """
+    Drop-in replacement for KeywordExtractor that calls the keyword service.
+    Connections are reused; one that timed out is closed, since its late reply would be
+    read by the next request.
+    """
+
+    def __init__(self, address, timeout=TIMEOUT):
+        require_authkey()
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return Client(self.address, authkey=AUTHKEY)
+
+    def extract_keywords(self, prompt: str):
+        conn = self.connect()
+        try:
+            conn.send(prompt)
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Keyword service did not answer within {self.timeout}s")
+            status, result = conn.recv()
+        except BaseException:
+            conn.close()
+            raise
+        with self.lock:
+            self.idle.append(conn)
+        if status != "ok":
+            raise RuntimeError(f"Keyword service error: {result}")
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword extraction service")
+    parser.add_argument("--address", default=os.environ.get("KEYWORD_SERVICE_ADDR", "127.0.0.1:6010"),
+                        help="host:port or Unix socket path to listen on")
+    parser.add_argument("--workers", type=int, default=2, help="extraction processes")
+    parser.add_argument("--check", metavar="TEXT", help="send TEXT to a running service and print the keywords")
+    args = parser.parse_args()
+
+    if args.check:
+        start = time.perf_counter()
+        keywords = KeywordServiceClient(args.address).extract_keywords(args.check)
+        print(f"{keywords} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return
+    serve(args.address, args.workers)
+
+
+if __name__ == "__main__":
+    main()
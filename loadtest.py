@@ -0,0 +1,287 @@
+"""
+Load test for the sync (gunicorn + Flask) and async (hypercorn + Quart) serving modes.
+
+Both servers run with a single worker process against the local stub upstreams in
+stub_upstreams.py, so the chatbot path can be tested offline.
+
+By default each concurrency level drives /api/traffic_info with a closed loop of clients, each
+request for a random route: identical concurrent traffic requests share one upstream call
+(single flight), which would hide the upstream latency. With upstream latency L and T sync threads, the sync server tops out near T / L requests per
+second, while the async server keeps scaling with the number of concurrent clients.
+
+With --rps, each rate instead sends requests open loop at that target rate, spread over a mix of
+/api/chatbot, /api/chatbot/stream, /api/recommend and /api/traffic_info, and reports the latency
+distribution and error rate per endpoint. Latency is measured from the time a request was due,
+so a server falling behind shows up as growing latency rather than as a lower send rate.
+
+Usage:
+    python loadtest.py --modes sync async --concurrency 4 16 64 256 --duration 10
+    python loadtest.py --modes async --rps 10 50 100 --mix chatbot=1 recommend=2 traffic=2 --error-rate 0.01
+    python loadtest.py --url http://127.0.0.1:5000 --rps 20   # an already running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from stub_upstreams import start_stub_server, stub_environment
+
+CHAT_MESSAGES = [
+    "I want to eat some american food, like burger. I also want to have some cocktail after dinner.",
+    "I want to try some Italian food, like pizza Margherita, with a glass of red wine.",
+    "I'm in the mood for some Mexican cuisine, such as tacos and enchiladas.",
+    "Where can I get good sushi for a date night?",
+    "Somewhere cheap for ramen with friends?",
+]
+QUERIES = [
+    "italian pizza", "spicy ramen", "sushi omakase", "burger and cocktails", "vegan brunch",
+    "tacos margarita", "french wine bar", "korean bbq", "seafood oysters", "dim sum",
+]
+ENDPOINTS = ["chatbot", "chatbot_stream", "recommend", "traffic"]
+
+
+# a random request for one endpoint of the mix, as (method, path, keyword arguments)
+def build_request(endpoint, rng):
+    lat, lng = rng.uniform(40.70, 40.80), rng.uniform(-74.02, -73.93)
+    if endpoint in ("chatbot", "chatbot_stream"):
+        path = "/api/chatbot" if endpoint == "chatbot" else "/api/chatbot/stream"
+        body = {"message": rng.choice(CHAT_MESSAGES), "latitude": lat, "longitude": lng}
+        return "POST", path, {"json": body}
+    if endpoint == "recommend":
+        return "GET", "/api/recommend", {"params": {"query": rng.choice(QUERIES)}}
+    params = {"origin_lat": lat, "origin_lon": lng,
+              "dest_lat": rng.uniform(40.70, 40.80), "dest_lon": rng.uniform(-74.02, -73.93)}
+    return "GET", "/api/traffic_info", {"params": params}
+
+
+# error label of a response, or None if it is a success
+def response_error(endpoint, response, body):
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    if endpoint == "chatbot_stream":
+        return "stream_error" if "event: error" in body else None
+    data = json.loads(body)
+    # the chatbot answers 200 with only a "response" message when Gemini failed
+    if endpoint == "chatbot":
+        return None if "data" in data else "upstream_error"
+    return "error_field" if "error" in data else None
+
+
+# command line for each serving mode, always a single worker process
+def server_command(mode, port, threads):
+    if mode == "sync":
+        return [sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", str(threads),
+                "--bind", f"127.0.0.1:{port}", "app:app"]
+    return [sys.executable, "-m", "hypercorn", "--workers", "1",
+            "--bind", f"127.0.0.1:{port}", "async_app:asgi_app"]
+
+
+# wait until the server answers on the given port
+def wait_for_server(port, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server on port {port} did not start within {timeout}s")
+
+
+# one client repeatedly sending requests until the deadline, to path or else to a random route
+async def client_loop(client, base_url, path, rng, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        method, request_path, kwargs = ("GET", path, {}) if path else build_request("traffic", rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, base_url + request_path, **kwargs)
+            if response.status_code != 200 or "error" in response.json():
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(base_url, path, concurrency, duration, seed):
+    rng = random.Random(seed)
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            client_loop(client, base_url, path, rng, deadline, latencies, errors) for _ in range(concurrency)
+        ))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / duration,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        "p95_ms": float(np.percentile(latencies_ms, 95)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) else None,
+    }
+
+
+async def send_request(client, base_url, endpoint, request, due, results):
+    method, path, kwargs = request
+    error = None
+    try:
+        response = await client.request(method, base_url + path, **kwargs)
+        error = response_error(endpoint, response, response.text)
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    results.append((endpoint, time.perf_counter() - due, error))
+
+
+def summarize_endpoint(latencies, errors, duration):
+    latencies_ms = np.array(latencies) * 1000
+    error_kinds = {}
+    for error in errors:
+        if error:
+            error_kinds[error] = error_kinds.get(error, 0) + 1
+    failed = sum(error_kinds.values())
+    return {
+        "requests": len(latencies),
+        "errors": failed,
+        "error_rate": failed / len(latencies) if len(latencies) else None,
+        "error_kinds": error_kinds,
+        "throughput_rps": len(latencies) / duration,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        "p90_ms": float(np.percentile(latencies_ms, 90)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) else None,
+        "max_ms": float(latencies_ms.max()) if len(latencies) else None,
+    }
+
+
+# send requests open loop at the target rate for `duration` seconds, then wait for all of them
+async def run_rate(base_url, rps, duration, mix, arrivals, seed, timeout):
+    rng = random.Random(seed)
+    endpoints, weights = zip(*mix.items())
+    results, tasks = [], []
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=None)) as client:
+        start = time.perf_counter()
+        offset = 0.0
+        while offset < duration:
+            endpoint = rng.choices(endpoints, weights)[0]
+            request = build_request(endpoint, rng)
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_request(client, base_url, endpoint, request, due, results)))
+            offset += rng.expovariate(rps) if arrivals == "poisson" else 1 / rps
+        await asyncio.gather(*tasks)
+
+    per_endpoint = {}
+    for endpoint in endpoints:
+        rows = [(latency, error) for name, latency, error in results if name == endpoint]
+        per_endpoint[endpoint] = summarize_endpoint([r[0] for r in rows], [r[1] for r in rows], duration)
+    level = summarize_endpoint([r[1] for r in results], [r[2] for r in results], duration)
+    level.update({"target_rps": rps, "endpoints": per_endpoint})
+    return level
+
+
+def parse_mix(items):
+    mix = {}
+    for item in items:
+        endpoint, _, weight = item.partition("=")
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint '{endpoint}', choose from {', '.join(ENDPOINTS)}")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def run_levels(args, mode, base_url):
+    results = []
+    if args.rps:
+        mix = parse_mix(args.mix)
+        for rps in args.rps:
+            level = asyncio.run(run_rate(base_url, rps, args.duration, mix, args.arrivals, args.seed, args.timeout))
+            level["mode"] = mode
+            results.append(level)
+            print(f"  {mode:5} target={rps:6.1f} req/s  achieved={level['throughput_rps']:7.1f} req/s  "
+                  f"p50={level['p50_ms'] or 0:7.1f} ms  p99={level['p99_ms'] or 0:7.1f} ms  "
+                  f"errors={level['errors']} ({(level['error_rate'] or 0):.1%})")
+            for endpoint, stats in level["endpoints"].items():
+                print(f"      {endpoint:15} {stats['requests']:6} req  p50={stats['p50_ms'] or 0:7.1f} ms  "
+                      f"p90={stats['p90_ms'] or 0:7.1f} ms  p99={stats['p99_ms'] or 0:7.1f} ms  "
+                      f"errors={stats['errors']} {stats['error_kinds'] or ''}")
+        return results
+
+    for concurrency in args.concurrency:
+        level = asyncio.run(run_level(base_url, args.path, concurrency, args.duration, args.seed))
+        level["mode"] = mode
+        results.append(level)
+        print(f"  {mode:5} concurrency={concurrency:4}  {level['throughput_rps']:8.1f} req/s  "
+              f"p50={level['p50_ms'] or 0:7.1f} ms  p99={level['p99_ms'] or 0:7.1f} ms  "
+              f"errors={level['errors']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the sync and async serving modes")
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[4, 16, 64, 256])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per concurrency level")
+    parser.add_argument("--threads", type=int, default=8, help="threads of the sync worker")
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="extra random stub latency, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that are errors")
+    parser.add_argument("--stream-delay-ms", type=float, default=0, help="delay between streamed Gemini chunks")
+    parser.add_argument("--path", help="fixed path to drive in the concurrency sweep, "
+                                       "default: /api/traffic_info with a random route per request")
+    parser.add_argument("--rps", nargs="+", type=float, help="target request rates, runs open loop")
+    parser.add_argument("--mix", nargs="+", default=["chatbot=1", "recommend=2", "traffic=2"],
+                        help=f"endpoint weights for --rps, from {', '.join(ENDPOINTS)}")
+    parser.add_argument("--arrivals", default="poisson", choices=["poisson", "uniform"],
+                        help="spacing of requests for --rps")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="test this running server instead of starting one per mode")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--stub-port", type=int, default=8099)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    if args.rps:
+        try:
+            parse_mix(args.mix)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.url:
+        results = run_levels(args, "external", args.url.rstrip("/"))
+    else:
+        stub = start_stub_server(port=args.stub_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 error_rate=args.error_rate, stream_delay_ms=args.stream_delay_ms)
+        env = {**os.environ, **stub_environment(port=args.stub_port)}
+
+        results = []
+        for mode in args.modes:
+            print(f"\nStarting {mode} server (1 worker)...")
+            server = subprocess.Popen(server_command(mode, args.port, args.threads), env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_server(args.port)
+                results.extend(run_levels(args, mode, f"http://127.0.0.1:{args.port}"))
+            finally:
+                server.terminate()
+                server.wait()
+        stub.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Timing spans, histograms and counters are kept per process (one registry per web worker).
+Set METRICS_ENABLED=0 to turn every span and counter into a no-op.
+"""
+import asyncio
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels):
+        """
+        Context manager observing the duration of its block
+        """
+        if not ENABLED:
+            return nullcontext()
+        return Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    label_text = format_labels(self.labelnames, labels, [("le", format_value(float(bound)))])
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                label_text = format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+# metrics shared by the app and the recommender
+request_count = Counter("http_requests_total", "HTTP requests handled", ["endpoint", "method", "status"])
+request_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ["endpoint"])
+stage_latency = Histogram("stage_duration_seconds", "Time spent in each request stage", ["stage"])
+error_count = Counter("errors_total", "Errors by stage", ["stage"])
+cache_lookups = Counter("result_cache_lookups_total", "Result cache lookups", ["kind", "result"])
+single_flight_calls = Counter("single_flight_calls_total",
+                              "Calls that ran (leader) or waited on an identical in-flight call (collapsed)",
+                              ["name", "role"])
+prompt_chars = Histogram("chat_prompt_chars", "Size of the chat prompts sent to Gemini in characters",
+                         buckets=(500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000))
+prompt_fragments_dropped = Counter("chat_prompt_fragments_dropped_total",
+                                   "Optional prompt fragments left out to stay within the prompt budget")
+
+
+# time one stage of a request, e.g. `with span("vectorization"):`
+def span(stage):
+    return stage_latency.time(stage)
+
+
+# decorator timing every call of a function (or coroutine function) as one stage
+def timed(stage):
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+import bisect
+import re
+import unicodedata
+
+
+# normalize a name for matching: lowercase, no accents, apostrophes or punctuation
+def normalize_name(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"['’`]", "", text.lower())
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+# all variants of a token with one character deleted
+def single_deletes(token: str):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class NameIndex:
+    """
+    Autocomplete index over restaurant names.
+    - Every name token is stored in a sorted array, so a token prefix is two binary searches
+    - Typo tolerance uses a single-deletion dictionary (edit distance 1) over whole tokens
+    - Matches are ranked: whole-name prefix, then token prefix, then fuzzy; ties by popularity
+    """
+
+    MIN_FUZZY_LEN = 4
+
+    def __init__(self, names, popularity=None):
+        self.names = list(names)
+        self.popularity = list(popularity) if popularity is not None else [0] * len(self.names)
+        self.normalized = [normalize_name(name) for name in self.names]
+        self.name_tokens = [set(norm.split()) for norm in self.normalized]
+
+        # sorted (token, id) pairs kept as two parallel arrays for bisect
+        entries = sorted(
+            (token, idx)
+            for idx, tokens in enumerate(self.name_tokens)
+            for token in tokens
+        )
+        self.tokens = [token for token, _ in entries]
+        self.token_ids = [idx for _, idx in entries]
+
+        # deletion variant -> tokens, for fuzzy matching
+        self.deletes = {}
+        for token in set(self.tokens):
+            if len(token) < self.MIN_FUZZY_LEN:
+                continue
+            for variant in single_deletes(token) | {token}:
+                self.deletes.setdefault(variant, set()).add(token)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_range(self, prefix):
+        lo = bisect.bisect_left(self.tokens, prefix)
+        hi = bisect.bisect_left(self.tokens, prefix + "\uffff")
+        return lo, hi
+
+    def _fuzzy_tokens(self, token):
+        if len(token) < self.MIN_FUZZY_LEN:
+            return set()
+        matches = set()
+        for variant in single_deletes(token) | {token}:
+            matches |= self.deletes.get(variant, set())
+        return matches
+
+    def _token_matches(self, idx, token):
+        return any(name_token.startswith(token) for name_token in self.name_tokens[idx])
+
+    def _prefix_candidates(self, query_tokens):
+        # start from the most selective token, then check the others on the candidates only
+        ranges = [self._prefix_range(token) for token in query_tokens]
+        lo, hi = min(ranges, key=lambda r: r[1] - r[0])
+        candidates = set(self.token_ids[lo:hi])
+        return {
+            idx for idx in candidates
+            if all(self._token_matches(idx, token) for token in query_tokens)
+        }
+
+    def _fuzzy_candidates(self, query_tokens):
+        fuzzy = [self._fuzzy_tokens(token) for token in query_tokens]
+        candidates = None
+        for token, fuzzy_tokens in zip(query_tokens, fuzzy):
+            lo, hi = self._prefix_range(token)
+            ids = set(self.token_ids[lo:hi])
+            for fuzzy_token in fuzzy_tokens:
+                flo, fhi = self._prefix_range(fuzzy_token)
+                ids.update(
+                    self.token_ids[i] for i in range(flo, fhi)
+                    if self.tokens[i] == fuzzy_token
+                )
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        return candidates or set()
+
+    def search(self, query: str, limit: int = 10):
+        """
+        Return up to `limit` restaurant names matching the query
+        """
+        norm_query = normalize_name(query)
+        query_tokens = norm_query.split()
+        if not query_tokens or limit <= 0:
+            return []
+
+        ranked = {}
+        for idx in self._prefix_candidates(query_tokens):
+            ranked[idx] = 0 if self.normalized[idx].startswith(norm_query) else 1
+
+        # only look for typos when exact prefixes do not fill the page
+        if len(ranked) < limit:
+            for idx in self._fuzzy_candidates(query_tokens):
+                ranked.setdefault(idx, 2)
+
+        best = sorted(
+            ranked,
+            key=lambda idx: (ranked[idx], -self.popularity[idx], len(self.names[idx]), self.names[idx])
+        )[:limit]
+        return [self.names[idx] for idx in best]
+
+    def page(self, offset: int = 0, limit: int = 50):
+        """
+        Return one page of restaurant names in catalog order
+        """
+        offset = max(offset, 0)
+        return self.names[offset:offset + max(limit, 0)]
@@ -0,0 +1,162 @@
+"""
+SBERT encoding of large text lists, sharded over a pool of processes and checkpointed per chunk.
+
+The texts are split into chunks of SBERT_CHUNK_SIZE. Each chunk is named by a hash of the model,
+the backend and its texts, and written to SBERT_CHECKPOINT_DIR as soon as it is encoded, so an
+interrupted build only encodes the chunks that are missing when it is run again (and a rebuild
+after a data change only the chunks whose texts changed). SBERT_WORKERS processes (default: one
+per core) each load the model once and split the cores between them.
+
+    vectors = encode_parallel(texts, "all-MiniLM-L6-v2")
+"""
+import hashlib
+import os
+import time
+from collections import defaultdict
+from multiprocessing import get_all_start_methods, get_context
+
+import numpy as np
+
+import inference
+
+CHECKPOINT_DIR = os.environ.get("SBERT_CHECKPOINT_DIR", "cache/sbert_chunks")
+WORKERS = int(os.environ.get("SBERT_WORKERS", 0)) or os.cpu_count() or 1
+CHUNK_SIZE = int(os.environ.get("SBERT_CHUNK_SIZE", 1024))
+BATCH_SIZE = 64
+
+# the model of each pool process, and the (model name, backend) it was loaded for
+worker_model = None
+worker_key = None
+
+
+def chunk_digest(texts, model_name, backend):
+    digest = hashlib.blake2b(f"{model_name}\0{backend}\0".encode("utf-8"), digest_size=16)
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def init_worker(model_name, backend, threads):
+    global worker_model, worker_key
+    worker_model = inference.load_sbert(model_name, backend)
+    worker_key = (model_name, backend)
+    # share the cores between the workers instead of every one using all of them
+    inference.configure_threads(inference.THREADS or threads)
+
+
+# encode one chunk, returning (index, worker pid, texts, seconds, vectors), the vectors only
+# if there is no path to write them to
+def encode_chunk(index, path, texts, batch_size=BATCH_SIZE):
+    start = time.perf_counter()
+    vectors = np.asarray(worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    if path is not None:
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(path + ".tmp", path)
+        vectors = None
+    return index, os.getpid(), len(texts), time.perf_counter() - start, vectors
+
+
+def encode_chunk_task(task):
+    return encode_chunk(*task)
+
+
+class ParallelEncoder:
+    """
+    Keeps the worker pool (and the models loaded in it) between encode() calls. Without a
+    checkpoint_dir nothing is written to disk, e.g. when the caller caches the embeddings itself.
+    """
+
+    def __init__(self, model_name, backend=None, workers=WORKERS, chunk_size=CHUNK_SIZE,
+                 checkpoint_dir=CHECKPOINT_DIR, batch_size=BATCH_SIZE):
+        self.model_name = model_name
+        self.backend = backend or inference.BACKEND
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.checkpoint_dir = checkpoint_dir
+        self.batch_size = batch_size
+        self.pool = None
+        # texts and encoding seconds of every worker, over all encode() calls
+        self.per_worker = defaultdict(lambda: [0, 0.0])
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def start(self):
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        if self.workers == 1:
+            # no pool to start for a single worker
+            if worker_key != (self.model_name, self.backend):
+                init_worker(self.model_name, self.backend, threads)
+        elif self.pool is None:
+            # fork where available: spawned workers would re-run the build scripts, which have no
+            # __main__ guard. The parent never loads the model, so there is no torch state to fork.
+            method = "fork" if "fork" in get_all_start_methods() else None
+            self.pool = get_context(method).Pool(self.workers, initializer=init_worker,
+                                                 initargs=(self.model_name, self.backend, threads))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def encode(self, texts):
+        """
+        Embeddings of texts, in order, as a float32 array. Chunks already in the checkpoint
+        directory are loaded instead of encoded.
+        """
+        texts = list(texts)
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        paths = [None] * len(chunks)
+        if self.checkpoint_dir:
+            paths = [os.path.join(self.checkpoint_dir, f"{chunk_digest(chunk, self.model_name, self.backend)}.npy")
+                     for chunk in chunks]
+        # identical checkpointed chunks are encoded once
+        todo = {}
+        for index, (path, chunk) in enumerate(zip(paths, chunks)):
+            if path is None or (not os.path.exists(path) and path not in todo):
+                todo[path if path is not None else index] = (index, path, chunk, self.batch_size)
+        todo = list(todo.values())
+        total = sum(len(task[2]) for task in todo)
+        print(f"SBERT encoding: {len(chunks)} chunks of up to {self.chunk_size} texts, "
+              f"{len(chunks) - len(todo)} already done, {len(todo)} to encode with {self.workers} workers")
+
+        vectors = [None] * len(chunks)
+        if todo:
+            self.start()
+            start = time.perf_counter()
+            done = 0
+            results = self.pool.imap_unordered(encode_chunk_task, todo) if self.pool else map(encode_chunk_task, todo)
+            for index, pid, n_texts, seconds, chunk_vectors in results:
+                vectors[index] = chunk_vectors
+                self.per_worker[pid][0] += n_texts
+                self.per_worker[pid][1] += seconds
+                done += n_texts
+                print(f"  {done}/{total} texts, {done / (time.perf_counter() - start):.1f} texts/s")
+            elapsed = time.perf_counter() - start
+            print(f"Encoded {done} texts in {elapsed:.1f}s ({done / elapsed:.1f} texts/s)")
+
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate([v if v is not None else np.load(path) for v, path in zip(vectors, paths)])
+
+    def report(self):
+        for pid, (n_texts, seconds) in sorted(self.per_worker.items()):
+            print(f"  worker {pid}: {n_texts} texts, {n_texts / max(seconds, 1e-9):.1f} texts/s")
+
+
+def encode_parallel(texts, model_name, **kwargs):
+    """
+    Embeddings of texts with a ParallelEncoder that is closed afterwards, see ParallelEncoder
+    for the keyword arguments
+    """
+    # no more workers than chunks
+    chunks = -(-len(texts) // kwargs.get("chunk_size", CHUNK_SIZE))
+    kwargs["workers"] = max(1, min(kwargs.get("workers", WORKERS), chunks))
+    encoder = ParallelEncoder(model_name, **kwargs)
+    try:
+        vectors = encoder.encode(texts)
+    finally:
+        encoder.close()
+    encoder.report()
+    return vectors
@@ -0,0 +1,176 @@
+"""
+Opt-in per-request sampling profiler.
+
+A request is profiled when
+  - it sets the X-Profile: 1 header or ?profile=1 and carries the admin token,
+  - it is picked at random with probability PROFILE_SAMPLE_RATE, or
+  - PROFILE_SLOW_MS is set: every request is sampled, and the profile is kept only when the
+    request took longer than that.
+
+One background thread samples the stacks of the threads serving profiled requests every
+PROFILE_INTERVAL_MS and counts them. Profiles are written to PROFILE_DIR in the folded stack
+format ("frame;frame;frame count" per line) read by flamegraph.pl, speedscope and inferno,
+and listed in PROFILE_DIR/index.jsonl.
+"""
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0))
+INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000
+
+# frames of the profiler itself, left out of the stacks
+IGNORED_FILES = {os.path.abspath(__file__)}
+
+
+class RequestProfile:
+    def __init__(self, reason):
+        self.reason = reason
+        self.start = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.threads = set()
+
+
+# folded representation of a stack, outermost frame first
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename not in IGNORED_FILES:
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """
+    Background thread sampling the stacks of every thread attached to a profile.
+    It sleeps while no request is being profiled.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def attach(self, thread_id, profile):
+        with self.condition:
+            self.active[thread_id] = profile
+            profile.threads.add(thread_id)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="profile-sampler", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    # stop sampling a thread, if it is still attached to this profile
+    def detach(self, thread_id, profile):
+        with self.condition:
+            if self.active.get(thread_id) is profile:
+                del self.active[thread_id]
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.active:
+                    self.condition.wait()
+            time.sleep(self.interval)
+            # sample under the lock, so a detached profile is never updated afterwards
+            with self.condition:
+                frames = sys._current_frames()
+                for thread_id, profile in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.stacks[fold_stack(frame)] += 1
+                        profile.samples += 1
+                del frames
+
+
+sampler = Sampler(INTERVAL)
+
+
+# whether the request asks to be profiled (the caller checks the admin token)
+def profile_flag(headers, args):
+    return headers.get("X-Profile") == "1" or args.get("profile") == "1"
+
+
+# why this request should be profiled, or None
+def choose_reason(requested):
+    if requested:
+        return "requested"
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        return "sampled"
+    if SLOW_MS:
+        return "slow"
+    return None
+
+
+# start profiling the current thread for a request, returns None if reason is None
+def start_profile(reason):
+    if reason is None:
+        return None
+    profile = RequestProfile(reason)
+    sampler.attach(threading.get_ident(), profile)
+    return profile
+
+
+# also sample the current thread (e.g. an executor thread) while it works for the request
+@contextmanager
+def profile_thread(profile):
+    if profile is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    sampler.attach(thread_id, profile)
+    try:
+        yield
+    finally:
+        sampler.detach(thread_id, profile)
+
+
+# stop sampling and save the profile, returns the file name or None if it was not kept
+def finish_profile(profile, method, path, status):
+    if profile is None:
+        return None
+    for thread_id in list(profile.threads):
+        sampler.detach(thread_id, profile)
+    duration_ms = (time.perf_counter() - profile.start) * 1000
+    if profile.reason == "slow" and duration_ms < SLOW_MS:
+        return None
+    if not profile.samples:
+        return None
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        created = datetime.datetime.now()
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+        name = f"{created:%Y%m%d-%H%M%S-%f}-{slug}-{duration_ms:.0f}ms-{profile.reason}.folded"
+        with open(os.path.join(PROFILE_DIR, name), "w") as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(PROFILE_DIR, "index.jsonl"), "a") as f:
+            f.write(json.dumps({
+                "file": name,
+                "created": created.isoformat(timespec="milliseconds"),
+                "method": method,
+                "path": path,
+                "status": status,
+                "duration_ms": round(duration_ms, 1),
+                "reason": profile.reason,
+                "samples": profile.samples,
+                "interval_ms": INTERVAL * 1000,
+            }) + "\n")
+        return name
+    except OSError as e:
+        print(f"Failed to save profile: {e}")
+        return None
@@ -0,0 +1,197 @@
+"""
+Chat prompt assembled from cached fragments, within a size budget.
+
+The scene summary (restaurant count, best-rated examples and main neighborhoods of each scene)
+only changes with the models, so it is built once per model version by build_prompt_context()
+and reused by every chat request. build_prompt() adds the per-request parts (message, time,
+weather, recommendations) and keeps the prompt under PROMPT_MAX_CHARS characters by leaving
+out the least important fragments first:
+
+  neighborhoods < summaries of other scenes < summary of the requested scene < scene note
+
+The header, the recommendations and the instructions are always kept; a long user message is
+cut to PROMPT_MAX_MESSAGE_CHARS.
+"""
+import datetime
+import os
+from collections import Counter
+
+from metrics import prompt_chars, prompt_fragments_dropped
+
+PROMPT_MAX_CHARS = int(os.environ.get("PROMPT_MAX_CHARS", 6000))
+PROMPT_MAX_MESSAGE_CHARS = int(os.environ.get("PROMPT_MAX_MESSAGE_CHARS", 1000))
+SCENE_EXAMPLES = 3
+SCENE_NEIGHBORHOODS = 3
+
+# description of each scene in the chat prompt
+SCENE_NAMES = {
+    'dating': 'romantic date',
+    'family': 'family dinner',
+    'friend': 'friends gathering',
+    'professional': 'business social'
+}
+
+SCENE_SUMMARY_HEADER = "\nThe system also has the following special scene categories of restaurants, please also consider these information when making recommendations:\n"
+
+GUIDANCE = """
+Please analyze the user's question carefully and recommend the most suitable restaurant based on the restaurant list and the current conditions (weather, time, etc.).
+If the user's question is not about restaurant recommendations, please politely reply and guide the user back to the restaurant recommendation topic.
+
+Provide recommendations based on the following factors:
+- User's specific needs
+- Current time (consider whether it is suitable for the current user's dining time)
+- Restaurant ratings and prices
+- Distance
+- Suitable social scenarios (dating, family, friends gathering, or business)
+- Traffic conditions (consider recommending closer options and ones with better traffic conditions, you should also tell user real-time traffic information from the user's location to the recommended restaurant)
+"""
+
+WEATHER_GUIDANCE = "- Current weather (consider choosing a closer option if the weather is bad)\n"
+NO_WEATHER_GUIDANCE = "Note: Current weather information is temporarily unavailable, please do not mention specific weather conditions in the reply.\n"
+
+FORMAT_REQUIREMENTS = """
+Important format requirements:
+1. Insert **two consecutive newline characters (\n\n)** after the intro and after each restaurant paragraph so that every paragraph is separated by a completely blank line.
+2. Do not mention or list the extracted keywords in the reply
+3. Do not start with "I understand your needs are" or "I understand you want..."
+4. Directly recommend 2-3 most suitable restaurants
+5. Use a concise paragraph format, use a separate paragraph for each recommended restaurant
+6. Explain the recommendation reason briefly, do not elaborate
+7. If the user's question is about a specific scene (dating/family/friends/business), prioritize recommending restaurants from these categories
+
+Use a friendly and professional tone, use appropriate paragraph breaks, and answer directly in English.
+"""
+
+
+class PromptContext:
+    def __init__(self, model_version, scene_lines, neighborhood_lines):
+        self.model_version = model_version
+        # scene -> summary line(s), scene -> main neighborhoods line
+        self.scene_lines = scene_lines
+        self.neighborhood_lines = neighborhood_lines
+
+
+def build_prompt_context(model_version, categorized, restaurant_stats, neighborhoods,
+                         examples=SCENE_EXAMPLES, top_neighborhoods=SCENE_NEIGHBORHOODS):
+    """
+    categorized: scene -> list of restaurant dicts with a name and coordinates (the
+    /api/categorized_restaurants data), restaurant_stats: name -> (rating, review count),
+    used to pick the best-rated examples, neighborhoods: name -> neighborhood.
+    """
+    scene_lines, neighborhood_lines = {}, {}
+    for scene, restaurants in categorized.items():
+        # only restaurants with location information count
+        valid = [r for r in restaurants if 'latitude' in r and 'longitude' in r]
+        if not valid:
+            continue
+        best = sorted(valid, key=lambda r: restaurant_stats.get(r['name'], (0, 0)), reverse=True)
+        scene_lines[scene] = (f"- {SCENE_NAMES.get(scene, scene)} scene suitable restaurants: {len(valid)}家\n"
+                              f"  such as: {', '.join(r['name'] for r in best[:examples])}\n")
+        counts = Counter(neighborhoods[r['name']] for r in valid if neighborhoods.get(r['name']))
+        if counts and top_neighborhoods:
+            neighborhood_lines[scene] = "  mostly in: " + ", ".join(
+                f"{name} ({count})" for name, count in counts.most_common(top_neighborhoods)) + "\n"
+    return PromptContext(model_version, scene_lines, neighborhood_lines)
+
+
+# one line per recommended restaurant, with distance and traffic when known
+def recommendation_line(i, rest, user_lat, user_lng):
+    location_info = ""
+    traffic_info = ""
+
+    if user_lat and user_lng and 'latitude' in rest and 'longitude' in rest:
+        # calculate simple linear distance, only for reference
+        distance = ((rest['latitude'] - user_lat) ** 2 + (rest['longitude'] - user_lng) ** 2) ** 0.5
+        # convert to approximately kilometers
+        distance_km = distance * 111
+        location_info = f", approximately {distance_km:.1f} kilometers away"
+
+        # Add traffic information if available
+        if 'traffic' in rest and rest['traffic']['duration_min'] is not None:
+            jam_factor = rest['traffic']['jam_factor']
+            duration_min = rest['traffic']['duration_min']
+
+            # Create traffic status description
+            traffic_status = "smooth"
+            if 2 < jam_factor <= 4:
+                traffic_status = "light congestion"
+            elif 4 < jam_factor <= 7:
+                traffic_status = "moderate congestion"
+            elif jam_factor > 7:
+                traffic_status = "heavy congestion"
+
+            traffic_info = f", current traffic: {traffic_status} (jam factor {jam_factor}/10), estimated travel time {duration_min} minutes"
+
+    return f"{i + 1}. {rest['name']} - Rating: {rest.get('rating', 'N/A')} - Price: {rest.get('price', 'N/A')}{location_info}{traffic_info}\n"
+
+
+def build_prompt(context, user_message, recommendations, weather, weather_info, scene,
+                 user_lat, user_lng, max_chars=PROMPT_MAX_CHARS, now=None):
+    # get current time
+    now = now or datetime.datetime.now()
+    time_of_day = "morning"
+    if 12 <= now.hour < 18:
+        time_of_day = "afternoon"
+    elif now.hour >= 18:
+        time_of_day = "evening"
+
+    if len(user_message) > PROMPT_MAX_MESSAGE_CHARS:
+        user_message = user_message[:PROMPT_MAX_MESSAGE_CHARS] + "…"
+    header = f"""
+        You are a restaurant recommendation assistant. You need to help users choose the most suitable restaurant.
+
+        Current situation:
+        - User message: "{user_message}"
+        - Current time: {now.strftime('%Y-%m-%d %H:%M')}, {time_of_day}
+        - {weather_info}
+
+        The system has recommended the following restaurants based on the user's question:
+        """
+    footer = GUIDANCE + (WEATHER_GUIDANCE if weather.get("description") != "Unknown" else NO_WEATHER_GUIDANCE) \
+        + FORMAT_REQUIREMENTS
+
+    # the recommendations are always kept, the optional fragments are (priority, position, text)
+    # with lower priority dropped first
+    kept = {}
+    fragments = []
+    if not recommendations:
+        kept[0] = "No matching restaurants found.\n"
+    else:
+        for i, rest in enumerate(recommendations):
+            kept[i] = recommendation_line(i, rest, user_lat, user_lng)
+        position = len(recommendations)
+        for name, line in context.scene_lines.items():
+            fragments.append((3 if name == scene else 2, position, line))
+            if name in context.neighborhood_lines:
+                fragments.append((1, position + 1, context.neighborhood_lines[name]))
+            position += 2
+        if scene:
+            fragments.append((5, position, f"\nThe user asked for a {SCENE_NAMES[scene]} restaurant, all recommended restaurants above are suitable for this scene.\n"))
+
+    # keep the most important fragments that fit, the scene summary header comes with the first
+    # summary and a neighborhoods line only with its scene's summary
+    budget = max_chars - len(header) - len(footer) - sum(len(text) for text in kept.values())
+    dropped = 0
+    has_summary = False
+    for priority, position, text in sorted(fragments, key=lambda f: (-f[0], f[1])):
+        cost = len(text)
+        if priority in (2, 3) and not has_summary:
+            cost += len(SCENE_SUMMARY_HEADER)
+        if cost > budget or (priority == 1 and position - 1 not in kept):
+            dropped += 1
+            continue
+        budget -= cost
+        has_summary = has_summary or priority in (2, 3)
+        kept[position] = text
+
+    body = ""
+    for position in sorted(kept):
+        if has_summary and position >= len(recommendations) and SCENE_SUMMARY_HEADER not in body:
+            body += SCENE_SUMMARY_HEADER
+        body += kept[position]
+    prompt = header + body + footer
+
+    prompt_chars.observe(len(prompt))
+    if dropped:
+        prompt_fragments_dropped.inc(amount=dropped)
+    return prompt
@@ -0,0 +1,87 @@
+"""
+Query embeddings for request-time semantic search, micro-batched and cached.
+
+Concurrent encode() calls are queued and a single worker thread encodes them together: it takes
+the first waiting query, then collects more for at most QUERY_BATCH_WAIT_MS (or until
+QUERY_BATCH_SIZE queries) and runs one forward pass for the whole batch. Embeddings are kept in
+an LRU cache keyed by the normalized query text (QUERY_CACHE_SIZE entries), so repeated queries
+skip the model entirely.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram, cache_lookups, span
+from result_cache import ResultCache
+
+QUERY_BATCH_SIZE = int(os.environ.get("QUERY_BATCH_SIZE", 32))
+QUERY_BATCH_WAIT_MS = float(os.environ.get("QUERY_BATCH_WAIT_MS", 5))
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 4096))
+
+batch_sizes = Histogram("query_encoder_batch_size", "Queries encoded per forward pass",
+                        buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+def normalize_query(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEncoder:
+    def __init__(self, encode_batch, name="", max_batch=QUERY_BATCH_SIZE, max_wait_ms=QUERY_BATCH_WAIT_MS,
+                 cache_size=QUERY_CACHE_SIZE):
+        # encode_batch(list of texts) -> array with one embedding per text
+        self.encode_batch = encode_batch
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache = ResultCache(cache_size)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="query-encoder", daemon=True)
+        self.thread.start()
+
+    def encode(self, text):
+        key = normalize_query(text)
+        found, embedding = self.cache.get(self.name, "query", key)
+        cache_lookups.inc("query_embedding", "hit" if found else "miss")
+        if found:
+            return embedding
+        future = Future()
+        self.pending.put((key, future))
+        return future.result()
+
+    # take the first waiting query, then whatever arrives within max_wait, up to max_batch
+    def next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            # identical queries in a batch are encoded once
+            texts = list(dict.fromkeys(key for key, _ in batch))
+            try:
+                with span("query_encoding"):
+                    embeddings = self.encode_batch(texts)
+            except Exception as e:
+                print(f"Query encoding failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            batch_sizes.observe(len(texts))
+            by_text = dict(zip(texts, embeddings))
+            for text, embedding in by_text.items():
+                self.cache.put(self.name, "query", text, embedding)
+            for key, future in batch:
+                future.set_result(by_text[key])
@@ -1,84 +1,310 @@
 import os
 import pickle
+import hashlib
 from sklearn.metrics.pairwise import cosine_similarity
-from extract_keywords import KeywordExtractor
 from nltk.stem.porter import PorterStemmer
+from result_cache import ResultCache
+from metrics import cache_lookups, error_count, span
+from scene_index import SCENE_INDEX_PKL, SCENES, load_scene_index
+from single_flight import SingleFlight
+from hybrid_retrieval import SBERT_EMBEDDINGS_PKL, SBERT_INFO_PKL, build_hybrid_retriever, load_query_encoder
+from sparse_tfidf import NEIGHBORS_PKL
+from query_encoder import normalize_query
 
 # init stemmer
 ps = PorterStemmer()
 
+# keyword retrieval: "count" (CountVectorizer cosine) or "hybrid" (BM25 + SBERT, see hybrid_retrieval.py)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "count")
 
-# load pre-trained models
+
+MODEL_FILES = [
+    'models/restaurant_info.pkl',
+    'models/restaurant_similarity.pkl',
+    'models/count_vectorizer.pkl',
+    'models/tfidf_vectorizer.pkl',
+    'models/restaurant_vectors.pkl',
+    'models/categorized_restaurants.pkl',
+    SCENE_INDEX_PKL,
+    SBERT_EMBEDDINGS_PKL,
+    SBERT_INFO_PKL,
+    NEIGHBORS_PKL,
+]
+
+# callbacks run after the models are reloaded, used to rebuild derived serving data
+reload_callbacks = []
+
+# cache of recommendation results, namespaced by model version
+result_cache = ResultCache(int(os.environ.get("RESULT_CACHE_SIZE", 2048)))
+
+# identical concurrent queries are computed once
+name_flight = SingleFlight("recommend_by_name")
+query_flight = SingleFlight("recommend")
+
+
+# a streaming TF-IDF build writes neighbors instead of the similarity matrix, and its vectors
+# have hashed columns that only its own vectorizer produces
+def is_streaming_build():
+    return not os.path.exists('models/restaurant_similarity.pkl') and os.path.exists(NEIGHBORS_PKL)
+
+
+# load pre-trained models, similarity is None when the build kept only top-K neighbors
 def load_models():
     info_df = pickle.load(open('models/restaurant_info.pkl', 'rb'))
-    similarity = pickle.load(open('models/restaurant_similarity.pkl', 'rb'))
-    cv = pickle.load(open('models/count_vectorizer.pkl', 'rb'))
+    similarity = None
+    if os.path.exists('models/restaurant_similarity.pkl'):
+        similarity = pickle.load(open('models/restaurant_similarity.pkl', 'rb'))
+    if is_streaming_build():
+        cv = pickle.load(open('models/tfidf_vectorizer.pkl', 'rb'))
+    else:
+        cv = pickle.load(open('models/count_vectorizer.pkl', 'rb'))
     vectors = pickle.load(open('models/restaurant_vectors.pkl', 'rb'))
     return info_df, similarity, cv, vectors
 
 
+# top-K neighbors of a streaming TF-IDF build, used for recommend_by_name without a similarity matrix
+def load_neighbors(similarity):
+    if similarity is not None:
+        return None
+    if not os.path.exists(NEIGHBORS_PKL):
+        print(f"No similarity matrix or neighbors at {NEIGHBORS_PKL}, recommend by name is unavailable")
+        return None
+    return pickle.load(open(NEIGHBORS_PKL, 'rb'))
+
+
+# scene index aligned with the restaurant rows, None until restaurant_type.py has been run
+def load_scenes(info_df):
+    if not os.path.exists(SCENE_INDEX_PKL):
+        print(f"No scene index at {SCENE_INDEX_PKL}, scene filtering is unavailable")
+        return None
+    return load_scene_index(SCENE_INDEX_PKL, info_df['restaurant_name'].tolist())
+
+
+# keyword extractor: the keyword service if KEYWORD_SERVICE_ADDR is set, spaCy in this process otherwise
+def create_extractor():
+    address = os.environ.get("KEYWORD_SERVICE_ADDR")
+    if address:
+        from keyword_service import KeywordServiceClient
+        print(f"Using the keyword service at {address}")
+        return KeywordServiceClient(address)
+    from extract_keywords import KeywordExtractor
+    return KeywordExtractor()
+
+
+# hybrid retriever over the restaurant rows, None unless RETRIEVAL_MODE is hybrid
+def load_retriever(info_df):
+    if RETRIEVAL_MODE != "hybrid":
+        return None
+    embeddings, encode, names = None, None, None
+    if os.path.exists(SBERT_EMBEDDINGS_PKL) and os.path.exists(SBERT_INFO_PKL):
+        embeddings = pickle.load(open(SBERT_EMBEDDINGS_PKL, 'rb'))
+        names = pickle.load(open(SBERT_INFO_PKL, 'rb'))['restaurant_name'].tolist()
+        encode = load_query_encoder()
+    else:
+        print(f"No SBERT embeddings at {SBERT_EMBEDDINGS_PKL} and {SBERT_INFO_PKL}, hybrid retrieval uses BM25 only")
+    return build_hybrid_retriever(info_df, embeddings, encode, names)
+
+
+# version string of the model files on disk, changes whenever a model file is rebuilt
+def compute_model_version() -> str:
+    digest = hashlib.sha1()
+    for path in MODEL_FILES:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+
+class ModelState:
+    """
+    Everything loaded from the model files. reload_models() builds a new one and publishes it with
+    a single assignment, so a request that reads `models` once never mixes two builds.
+    """
+
+    def __init__(self):
+        self.new_df, self.similarity, self.cv, self.vectors = load_models()
+        self.neighbors = load_neighbors(self.similarity)
+        self.scene_index = load_scenes(self.new_df)
+        self.retriever = load_retriever(self.new_df)
+        self.version = compute_model_version()
+
+
+# register a function to call after reload_models()
+def on_reload(callback):
+    reload_callbacks.append(callback)
+    return callback
+
+
+# reload models from disk and rebuild everything derived from them
+def reload_models() -> str:
+    global models
+    state = ModelState()
+    models = state
+    # after the swap, so no result of the old models is cached again under the new version
+    result_cache.clear()
+    print(f"Reloaded models, version {state.version}")
+    for callback in reload_callbacks:
+        callback()
+    return state.version
+
+
 # stem text
 def stem_text(text: str) -> str:
     return " ".join(ps.stem(w) for w in text.split())
 
 
-# load models
+# load models, None if they could not be loaded
+models = None
 try:
-    new_df, similarity, cv, vectors = load_models()
-    extractor = KeywordExtractor()
+    models = ModelState()
+    extractor = create_extractor()
 except Exception as e:
     print(f"Error loading models: {e}")
 
 
-# recommend by name
-def recommend_by_name(restaurant_name: str):
+# count a cache lookup and report it to the caller, if it asked for it
+def record_cache_lookup(kind, hit, cache_info=None):
+    cache_lookups.inc(kind, "hit" if hit else "miss")
+    if cache_info is not None:
+        cache_info["status"] = "HIT" if hit else "MISS"
+
+
+# cache key for a keyword list: the sorted stemmed tokens, which fully determine the
+# (unigram, bag-of-words) query vector. Hybrid retrieval also embeds the raw keyword text in its
+# original order, so then that text (normalized like the query encoder does) is part of the key.
+def keyword_cache_key(keywords: list[str], state: ModelState) -> str:
+    key = " ".join(sorted(stem_text(" ".join(keywords).lower()).split()))
+    if state.retriever is not None and state.retriever.dense is not None:
+        key = f"{key}|{normalize_query(' '.join(keywords))}"
+    return key
+
+
+# recommend by name, results are cached per name and model version
+def recommend_by_name(restaurant_name: str, cache_info: dict = None):
+    state = models
+    results, hit = name_flight.do((state.version, restaurant_name), lambda: result_cache.get_or_compute(
+        state.version, "name", restaurant_name,
+        lambda: compute_recommend_by_name(restaurant_name, state)
+    ))
+    record_cache_lookup("name", hit, cache_info)
+    return list(results)
+
+
+def compute_recommend_by_name(restaurant_name: str, state: ModelState):
+    new_df, similarity, neighbors = state.new_df, state.similarity, state.neighbors
     if restaurant_name not in new_df['restaurant_name'].values:
         print('Restaurant not found, please check your input.')
         return []
-    idx = new_df.index[new_df['restaurant_name'] == restaurant_name][0]
-    sims = sorted(
-        list(enumerate(similarity[idx])),
-        key=lambda x: x[1], reverse=True
-    )[1:11]
-    return [(new_df.iloc[i]['restaurant_name'], score) for i, score in sims]
-
-
-# recommend by keyword
-def recommend_by_keyword(keywords: list[str]):
-    query = " ".join(keywords).lower()
-    query = stem_text(query)
-    q_vec = cv.transform([query]).toarray()
-    sim_q = cosine_similarity(q_vec, vectors).flatten()
-    top_idxs = sim_q.argsort()[::-1][:10]
+    with span("scoring_by_name"):
+        idx = new_df.index[new_df['restaurant_name'] == restaurant_name][0]
+        if similarity is None:
+            if neighbors is None:
+                return []
+            sims = zip(neighbors['indices'][idx][:10], neighbors['scores'][idx][:10])
+        else:
+            sims = sorted(
+                list(enumerate(similarity[idx])),
+                key=lambda x: x[1], reverse=True
+            )[1:11]
+        return [(new_df.iloc[i]['restaurant_name'], score) for i, score in sims]
+
+
+# restaurant rows of a scene, raises ValueError if the scene is unknown or there is no scene index
+def scene_rows(scene: str, state: ModelState):
+    if scene not in SCENES:
+        raise ValueError(f"Unknown scene '{scene}', choose from {', '.join(SCENES)}")
+    if state.scene_index is None:
+        raise ValueError("Scene index is not available, run restaurant_type.py")
+    return state.scene_index.rows(scene)
+
+
+# recommend by keyword, only among the restaurants of a scene if one is given
+def recommend_by_keyword(keywords: list[str], scene: str = None, state: ModelState = None):
+    state = state or models
+    new_df, cv, vectors, retriever = state.new_df, state.cv, state.vectors, state.retriever
+    with span("stemming"):
+        query = " ".join(keywords).lower()
+        query = stem_text(query)
+    if retriever is not None:
+        with span("hybrid_retrieval"):
+            rows = scene_rows(scene, state) if scene else None
+            top_idxs, _ = retriever.search(query, " ".join(keywords), 10, rows)
+        # the fused scores only rank the rows, the similarity shown is the cosine of the query and
+        # restaurant vectors like without hybrid retrieval
+        with span("scoring"):
+            sim_q = cosine_similarity(cv.transform([query]), vectors[top_idxs]).flatten() if len(top_idxs) else []
+        recs_df = new_df.iloc[top_idxs].copy()
+        recs_df['similarity'] = sim_q
+        return recs_df[['restaurant_name', 'PriceRange', 'Rating', 'review_count', 'similarity']].values.tolist()
+    with span("vectorization"):
+        q_vec = cv.transform([query]).toarray()
+    with span("scoring"):
+        if scene:
+            # score only the scene's rows, so the top 10 are all scene members
+            rows = scene_rows(scene, state)
+            if not len(rows):
+                return []
+            sim_q = cosine_similarity(q_vec, vectors[rows]).flatten()
+            order = sim_q.argsort()[::-1][:10]
+            top_idxs, sim_q = rows[order], sim_q[order]
+        else:
+            sim_q = cosine_similarity(q_vec, vectors).flatten()
+            top_idxs = sim_q.argsort()[::-1][:10]
+            sim_q = sim_q[top_idxs]
     recs_df = new_df.iloc[top_idxs].copy()
-    recs_df['similarity'] = sim_q[top_idxs]
+    recs_df['similarity'] = sim_q
 
     return recs_df[['restaurant_name', 'PriceRange', 'Rating', 'review_count', 'similarity']].values.tolist()
 
 
-# handle user query
-def recommend(query: str):
-    try:
-        # extract keywords
+# build return results for a keyword list
+def compute_keyword_results(keywords: list[str], scene: str, state: ModelState):
+    recs = recommend_by_keyword(keywords, scene, state)
+
+    results = []
+    for name, price, rating, reviews, score in recs:
+        results.append({
+            "name": name,
+            "rating": rating,
+            "price": price,
+            "reviews": int(reviews) if str(reviews).isdigit() else 0,
+            "similarity": float(score)
+        })
+    return results
+
+
+# keywords and results of a query, with whether the results came from the cache (None without keywords)
+def compute_recommend(query: str, scene: str, state: ModelState):
+    # extract keywords
+    with span("keyword_extraction"):
         keywords = extractor.extract_keywords(query)
-        if not keywords:
+    if not keywords:
+        return [], [], None
+
+    # recommend by keyword, results are cached per scene, keyword set and model version
+    results, hit = result_cache.get_or_compute(
+        state.version, "keywords", f"{scene or ''}|{keyword_cache_key(keywords, state)}",
+        lambda: compute_keyword_results(keywords, scene, state)
+    )
+    return keywords, results, hit
+
+
+# handle user query, optionally restricted to a scene (dating, family, friend or professional)
+def recommend(query: str, cache_info: dict = None, scene: str = None):
+    try:
+        # one snapshot of the models for the whole request, a reload swaps in a new one
+        state = models
+        # concurrent identical queries wait for one extraction and scoring
+        keywords, results, hit = query_flight.do(
+            (state.version, query, scene), lambda: compute_recommend(query, scene, state)
+        )
+        if hit is None:
             return [], []
+        record_cache_lookup("keywords", hit, cache_info)
 
-        # recommend by keyword
-        recs = recommend_by_keyword(keywords)
-
-        # build return results
-        results = []
-        for name, price, rating, reviews, score in recs:
-            results.append({
-                "name": name,
-                "rating": rating,
-                "price": price,
-                "reviews": int(reviews) if str(reviews).isdigit() else 0,
-                "similarity": float(score)
-            })
-
-        return keywords, results
+        # callers add fields to the result dicts, so hand out copies
+        return list(keywords), [dict(item) for item in results]
     except Exception as e:
         print(f"Error in recommendation process: {e}")
+        error_count.inc("recommend")
         return [], []
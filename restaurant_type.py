@@ -1,77 +1,77 @@
-import pandas as pd
 import os
 import pickle
+import pandas as pd
+from data_io import TableWriter, iter_table
+from scene_index import SCENE_INDEX_PKL, SceneIndex
 
 # Config paths
-input_path = "data/yelp_reviews_classified_output8000.xlsx"
-output_xlsx = "scene_statistics_per_restaurant.xlsx"
+input_path = os.environ.get("CLASSIFIED_REVIEWS_PATH", "data/yelp_reviews_classified_output8000.xlsx")
+output_stats = os.environ.get("SCENE_STATISTICS_PATH", "scene_statistics_per_restaurant.xlsx")
 output_pkl = "models/categorized_restaurants.pkl"
+info_pkl = "models/restaurant_info.pkl"
+chunk_size = int(os.environ.get("CHUNK_SIZE", 500000))
 
-# Load data   
-df = pd.read_excel(input_path)
+# Minimum number of reviews of a category for a restaurant to suit that scene,
+# overridden with e.g. SCENE_THRESHOLDS="dating=5,family=10"
+thresholds = {'dating': 3, 'family': 20, 'friend': 3, 'professional': 3}
+for item in filter(None, os.environ.get("SCENE_THRESHOLDS", "").split(",")):
+    scene, _, value = item.partition("=")
+    if scene.strip() not in thresholds:
+        raise KeyError(f"Unknown scene '{scene.strip()}' in SCENE_THRESHOLDS")
+    thresholds[scene.strip()] = int(value)
+print(f"Scene thresholds: {thresholds}")
 
-# Validate required columns
-for col in ("business_id", "business_name", "category", "text"):
-    if col not in df.columns:
-        raise KeyError(f"Input file must contain a '{col}' column.")
+# Stream the reviews chunk by chunk, counting reviews and categories per business
+counts = None
+totals = None
+names = {}  # business_id -> business_name, in order of first appearance
+n_rows = 0
+for chunk in iter_table(input_path, chunk_size):
+    # Validate required columns
+    for col in ("business_id", "business_name", "category"):
+        if col not in chunk.columns:
+            raise KeyError(f"Input file must contain a '{col}' column.")
 
-# Compute total review counts
-total_reviews = (
-    df
-    .groupby("business_id")
-    .size()
-    .rename("n_reviews")
-    .reset_index()
-)
+    chunk_totals = chunk.groupby("business_id").size()
+    chunk_counts = chunk.groupby(["business_id", "category"]).size().unstack(fill_value=0)
+    totals = chunk_totals if totals is None else totals.add(chunk_totals, fill_value=0)
+    counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
 
-# Pivot to count each category
-pivot = (
-    df
-    .pivot_table(
-        index=["business_id", "business_name"],
-        columns="category",
-        values="text",
-        aggfunc="count",
-        fill_value=0
-    )
-    .reset_index()
-)
+    firsts = chunk.drop_duplicates("business_id")
+    for business_id, name in zip(firsts["business_id"], firsts["business_name"]):
+        names.setdefault(business_id, name)
+    n_rows += len(chunk)
+    print(f"Aggregated {n_rows} reviews of {len(names)} restaurants")
 
-# Merge total_reviews into pivot
-result = pivot.merge(total_reviews, on="business_id")
+if counts is None:
+    raise ValueError(f"No reviews found in '{input_path}'")
 
-# Reorder rows to match original appearance
-order_df = df[["business_id", "business_name"]].drop_duplicates()
-result = order_df.merge(
-    result,
-    on=["business_id", "business_name"],
-    how="left"
-)
+# One row per restaurant: name, id, n_reviews, then sorted category columns
+order = list(names)
+result = counts.reindex(order).fillna(0).astype(int)
+for scene in thresholds:
+    if scene not in result.columns:
+        result[scene] = 0
+result = result[sorted(result.columns)]
+result.insert(0, "n_reviews", totals.reindex(order).astype(int).values)
+result.insert(0, "business_id", order)
+result.insert(0, "business_name", [names[business_id] for business_id in order])
+result = result.reset_index(drop=True)
+result.columns.name = None
 
-# Reorder columns: name, id, n_reviews, then sorted category columns
-cat_cols = sorted([
-    c for c in result.columns
-    if c not in ("business_id", "business_name", "n_reviews")
-])
-result = result[["business_name", "business_id", "n_reviews"] + cat_cols]
-
-# Save summary to Excel
-result.to_excel(output_xlsx, index=False)
-print(f"Saved scene statistics to '{output_xlsx}'")
+# Save summary
+with TableWriter(output_stats) as writer:
+    writer.write(result)
+print(f"Saved scene statistics to '{output_stats}'")
 
 # Categorize restaurants by thresholds
-dating_list = result.loc[result['dating'] >= 3, 'business_name'].tolist()
-family_list = result.loc[result['family'] >= 20, 'business_name'].tolist()
-friend_list = result.loc[result['friend'] >= 3, 'business_name'].tolist()
-pro_list = result.loc[result['professional'] >= 3, 'business_name'].tolist()
+members = {
+    scene: result.loc[result[scene] >= threshold, 'business_name'].tolist()
+    for scene, threshold in thresholds.items()
+}
 
 # Build a DataFrame with columns aligned
-cats = {
-    'dating': dating_list,
-    'family': family_list,
-    'friend': friend_list,
-    'professional': pro_list
-}
+cats = dict(members)
 max_len = max(len(v) for v in cats.values())
 for k, v in cats.items():
     # pad shorter lists with NaN so all columns have equal length
@@ -85,5 +85,16 @@ os.makedirs(os.path.dirname(output_pkl), exist_ok=True)
 with open(output_pkl, "wb") as f:
     pickle.dump(df_categorized, f)
 print(f"Saved categorized restaurants to '{output_pkl}'")
+
+# Save the scene index, aligned with the recommender's restaurant rows when they exist
+# (otherwise it is aligned when the recommender loads it)
+index = SceneIndex(members, thresholds)
+if os.path.exists(info_pkl):
+    info_df = pickle.load(open(info_pkl, "rb"))
+    index.align(info_df['restaurant_name'].tolist())
+    print(f"Scene index rows: {index.counts()}, names not in {info_pkl}: {index.unmatched}")
+index.save(SCENE_INDEX_PKL)
+print(f"Saved scene index to '{SCENE_INDEX_PKL}'")
+
 print("\n===== Categorized Restaurants Preview =====")
 print(df_categorized.head(10).to_string(index=False))
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Bounded LRU cache for recommendation results.
+    Keys are namespaced by model version, so results computed with old models are never
+    returned after a reload, and clear() frees them at once.
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, version, kind, key):
+        """
+        Return (found, value) for a cached result
+        """
+        full_key = (version, kind, key)
+        with self.lock:
+            if full_key in self.entries:
+                self.entries.move_to_end(full_key)
+                self.hits += 1
+                return True, self.entries[full_key]
+            self.misses += 1
+            return False, None
+
+    def put(self, version, kind, key, value):
+        if self.maxsize <= 0:
+            return
+        full_key = (version, kind, key)
+        with self.lock:
+            self.entries[full_key] = value
+            self.entries.move_to_end(full_key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, version, kind, key, compute):
+        """
+        Return (value, hit), calling compute() and caching its result on a miss
+        """
+        found, value = self.get(version, kind, key)
+        if found:
+            return value, True
+        value = compute()
+        self.put(version, kind, key, value)
+        return value, False
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
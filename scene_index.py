@@ -0,0 +1,93 @@
+"""
+Scene membership of the restaurants, aligned with the recommender's restaurant row ids.
+
+restaurant_type.py writes models/scene_index.pkl with the restaurant names of every scene.
+At load time they are mapped to the rows of models/restaurant_info.pkl (every row sharing a
+member's name is a member) and kept as one packed bitset per scene, so checking whether a
+row belongs to a scene is a single bit test and the mask of a scene is one unpack.
+"""
+import hashlib
+import pickle
+
+import numpy as np
+
+SCENE_INDEX_PKL = "models/scene_index.pkl"
+SCENES = ("dating", "family", "friend", "professional")
+
+
+# digest of the restaurant names in row order, to tell whether an alignment still holds
+def names_digest(restaurant_names):
+    digest = hashlib.sha1()
+    for name in restaurant_names:
+        digest.update(str(name).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class SceneIndex:
+    def __init__(self, members, thresholds=None):
+        # scene -> list of member restaurant names
+        self.members = {scene: list(names) for scene, names in members.items()}
+        self.thresholds = thresholds or {}
+        self.n_rows = 0
+        self.digest = None
+        self.bits = {}
+        self.row_ids = {}
+        self.unmatched = {}
+
+    # map the member names to row ids of restaurant_names and pack them into bitsets
+    def align(self, restaurant_names):
+        restaurant_names = np.asarray(restaurant_names, dtype=object)
+        self.n_rows = len(restaurant_names)
+        self.digest = names_digest(restaurant_names)
+        positions = {}
+        for row, name in enumerate(restaurant_names):
+            positions.setdefault(name, []).append(row)
+        for scene, names in self.members.items():
+            rows = [row for name in names for row in positions.get(name, ())]
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[rows] = True
+            self.row_ids[scene] = np.flatnonzero(mask)
+            self.bits[scene] = np.packbits(mask, bitorder="little")
+            self.unmatched[scene] = sum(1 for name in names if name not in positions)
+        return self
+
+    # align again only if the restaurant rows changed since the last alignment
+    def ensure_aligned(self, restaurant_names):
+        if self.digest != names_digest(restaurant_names):
+            self.align(restaurant_names)
+        return self
+
+    def scenes(self):
+        return list(self.members)
+
+    # O(1) membership check of one restaurant row
+    def contains(self, scene, row):
+        bits = self.bits.get(scene)
+        if bits is None or not 0 <= row < self.n_rows:
+            return False
+        return bool((bits[row >> 3] >> (row & 7)) & 1)
+
+    # boolean mask over all restaurant rows
+    def mask(self, scene):
+        bits = self.bits.get(scene)
+        if bits is None:
+            return np.zeros(self.n_rows, dtype=bool)
+        return np.unpackbits(bits, count=self.n_rows, bitorder="little").astype(bool)
+
+    def rows(self, scene):
+        return self.row_ids.get(scene, np.empty(0, dtype=np.int64))
+
+    def counts(self):
+        return {scene: len(self.rows(scene)) for scene in self.members}
+
+    def save(self, path=SCENE_INDEX_PKL):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+
+def load_scene_index(path=SCENE_INDEX_PKL, restaurant_names=None):
+    with open(path, "rb") as f:
+        index = pickle.load(f)
+    if restaurant_names is not None:
+        index.ensure_aligned(restaurant_names)
+    return index
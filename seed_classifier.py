@@ -0,0 +1,110 @@
+"""
+SBERT-Seed zero-shot classification of reviews into social scenes.
+
+Each label is described by a few seed sentences. A review gets the label of its most similar
+seed sentence, by cosine similarity. All seeds are stacked into one matrix, so a chunk of
+reviews is classified with one matrix product followed by a max over each label's seeds.
+"""
+import numpy as np
+
+SEED_SENTENCES = {
+    "friend": [
+        "Had a great time hanging out with friends.",
+        "Nice place to catch up with buddies.",
+        "Perfect for a fun evening with friends.",
+        "My college pals and I loved the lively vibe here.",
+        "Grabbed drinks with friends after work and it was awesome.",
+        "Best spot to celebrate a friend's birthday together.",
+        "Met up with my old roommates for a fun reunion dinner.",
+        "Great place for a weekend brunch with the gang.",
+        "Shared appetizers and laughs with my buddies all night.",
+        "Our friend group made this our new go‑to hangout."
+    ],
+
+    "family": [
+        "Went out with my parents and kids.",
+        "Great family‑friendly place.",
+        "Perfect for a dinner with mom, dad, and kids.",
+        "Brought the whole family for Sunday lunch and everyone was happy.",
+        "High chairs and kids' menu made dining with toddlers easy.",
+        "Grandma enjoyed the quiet corner table we got.",
+        "Spacious enough for our extended family gathering.",
+        "Celebrated my sister's graduation with the family here.",
+        "The staff was patient with our noisy little ones.",
+        "Family reunion dinner felt warm and welcoming."
+    ],
+
+    "dating": [
+        "Took my girlfriend on a date.",
+        "Ideal for a romantic dinner or anniversary.",
+        "Perfect spot for couples or lovers.",
+        "Candle‑lit tables set the mood for our first date.",
+        "My partner loved the cozy two‑top by the window.",
+        "Great wine list for a special date night.",
+        "Surprised my spouse with an anniversary dessert here.",
+        "Lovely ambience for popping the big question.",
+        "Quiet corner booths perfect for intimate conversation.",
+        "The live jazz made our date unforgettable."
+    ],
+
+    "professional": [
+        "Had a business lunch with colleagues.",
+        "Great for team outings and meetings.",
+        "Coworkers and I came here during work.",
+        "Met a client here to discuss the new contract.",
+        "Convenient location for after‑work networking drinks.",
+        "Wi‑Fi and power outlets made it easy to work over coffee.",
+        "Reserved a private room for our quarterly team dinner.",
+        "Impressed our partners with the professional atmosphere.",
+        "Quick service ideal for a tight lunch break with coworkers.",
+        "Hosted a small recruiting event in their lounge area."
+    ],
+
+    "other": [
+        "Food was good but nothing special.",
+        "Service was average.",
+        "Nice atmosphere and menu.",
+        "Stopped by for a quick bite before the movie.",
+        "Decent place to grab a late‑night snack.",
+        "Menu had plenty of options for everyone.",
+        "Overall experience was fine but not exceptional.",
+        "Visited while sightseeing and it did the job.",
+        "Solid choice when you don't know what you want to eat.",
+        "Good spot for a casual solo meal."
+    ]
+}
+
+
+# normalized embeddings of all seed sentences, stacked label by label,
+# with the index of the first seed of each label
+def encode_seeds(model, seed_sentences=SEED_SENTENCES):
+    labels = list(seed_sentences)
+    sentences = [s for label in labels for s in seed_sentences[label]]
+    seed_matrix = model.encode(sentences, normalize_embeddings=True, convert_to_numpy=True)
+    starts = np.cumsum([0] + [len(seed_sentences[label]) for label in labels[:-1]])
+    return labels, seed_matrix.astype(np.float32), starts
+
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def classify(embeddings, labels, seed_matrix, starts, chunk_size=65536):
+    """
+    Classify review embeddings, in chunks of rows.
+    Returns the predicted labels, the per-label scores (best seed cosine similarity, one column
+    per label) and the margin between the best and second best label.
+    """
+    n = len(embeddings)
+    scores = np.empty((n, len(labels)), dtype=np.float32)
+    for begin in range(0, n, chunk_size):
+        chunk = normalize(embeddings[begin:begin + chunk_size])
+        scores[begin:begin + len(chunk)] = np.maximum.reduceat(chunk @ seed_matrix.T, starts, axis=1)
+
+    # first label wins ties, like comparing labels in order with a strict >
+    best = scores.argmax(axis=1)
+    ordered = np.sort(scores, axis=1)
+    margins = ordered[:, -1] - ordered[:, -2] if len(labels) > 1 else ordered[:, -1]
+    return np.array(labels, dtype=object)[best], scores, margins
@@ -0,0 +1,100 @@
+"""
+Single-flight deduplication of identical concurrent calls.
+
+While a call for a key is running, further calls with the same key do not run again: they
+wait for the running call and get its result (or its exception). Nothing is cached once the
+call is done. single_flight_calls_total counts calls per name that ran ("leader") and that
+waited on another one ("collapsed").
+"""
+import asyncio
+import functools
+import threading
+
+from metrics import single_flight_calls
+
+
+class Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            single_flight_calls.inc(self.name, "collapsed")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        single_flight_calls.inc(self.name, "leader")
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Same as SingleFlight for coroutines, within one event loop
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+
+    async def do(self, key, func):
+        task = self.calls.get(key)
+        if task is not None:
+            single_flight_calls.inc(self.name, "collapsed")
+        else:
+            single_flight_calls.inc(self.name, "leader")
+            task = self.calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        # a cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+
+# decorator collapsing concurrent calls with the same arguments, copy (e.g. dict) is applied to
+# the shared result for every caller so callers can modify what they get
+def single_flight(name, copy=None):
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            async_flight = AsyncSingleFlight(name)
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+                result = await async_flight.do(key, lambda: func(*args, **kwargs))
+                return copy(result) if copy else result
+            return async_wrapper
+
+        flight = SingleFlight(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            result = flight.do(key, lambda: func(*args, **kwargs))
+            return copy(result) if copy else result
+        return wrapper
+    return decorator
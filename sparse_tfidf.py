@@ -0,0 +1,106 @@
+"""
+Sparse, hashed TF-IDF for building the restaurant model out of core.
+
+Term counts come from a HashingVectorizer, so there is no vocabulary to fit and review chunks
+can be counted one at a time and summed per restaurant. The IDF and the feature selection are
+computed from the summed counts, and instead of the dense restaurant x restaurant similarity
+matrix only the top-K neighbors of every restaurant are kept, computed block by block.
+"""
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+NEIGHBORS_PKL = "models/restaurant_neighbors.pkl"
+HASH_FEATURES = int(os.environ.get("TFIDF_HASH_FEATURES", 2 ** 20))
+TOP_K = int(os.environ.get("TFIDF_TOP_K", 50))
+# memory for one block of similarity scores while computing the neighbors
+BLOCK_MB = float(os.environ.get("TFIDF_BLOCK_MB", 256))
+
+
+def hashing_vectorizer(n_features=HASH_FEATURES):
+    # raw counts, with the tokenization and stop words of the dense TfidfVectorizer
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None,
+                             stop_words='english', dtype=np.float32)
+
+
+# sum the rows of X into n_rows groups, row_ids[i] being the group of row i
+def group_sum(row_ids, X, n_rows):
+    indicator = sp.csr_matrix((np.ones(len(row_ids), dtype=np.float32), (row_ids, np.arange(len(row_ids)))),
+                              shape=(n_rows, len(row_ids)))
+    return (indicator @ X).tocsr()
+
+
+class HashedTfidfVectorizer:
+    """
+    Transforms texts like the fitted TfidfVectorizer of the dense build: hashed counts of the
+    kept columns, weighted by IDF and L2-normalized
+    """
+
+    def __init__(self, n_features, columns, idf):
+        self.n_features = n_features
+        self.columns = columns
+        self.idf = idf
+
+    def transform(self, texts):
+        counts = hashing_vectorizer(self.n_features).transform(texts)[:, self.columns]
+        return normalize(sp.csr_matrix(counts.multiply(self.idf)), copy=False)
+
+
+def fit_tfidf(counts, max_features=None):
+    """
+    TF-IDF of summed hashed counts, keeping the max_features most frequent columns (all if None),
+    as (vectorizer, CSR matrix with L2-normalized rows). The IDF is smoothed like sklearn's.
+    """
+    counts = sp.csr_matrix(counts)
+    n_features = counts.shape[1]
+    totals = np.asarray(counts.sum(axis=0)).ravel()
+    columns = np.flatnonzero(totals)
+    if max_features and len(columns) > max_features:
+        columns = np.sort(columns[np.argsort(-totals[columns], kind="stable")[:max_features]])
+    counts = counts[:, columns]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = (np.log((1 + counts.shape[0]) / (1 + df)) + 1).astype(np.float32)
+    tfidf = normalize(sp.csr_matrix(counts.multiply(idf), dtype=np.float32), copy=False)
+    return HashedTfidfVectorizer(n_features, columns, idf), tfidf
+
+
+def top_k_neighbors(vectors, extra=None, k=TOP_K, block_mb=BLOCK_MB):
+    """
+    The k most similar other rows of every row by cosine similarity of [vectors, extra] (sparse
+    vectors, optional dense extra columns), as (indices, scores) arrays of shape (n, k), best first
+    and ties broken by lower index. Rows are scored in blocks of at most block_mb of scores.
+    """
+    vectors = sp.csr_matrix(vectors, dtype=np.float32)
+    n = vectors.shape[0]
+    k = min(k, n - 1)
+    indices = np.zeros((n, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    squared = np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel()
+    if extra is not None:
+        extra = np.asarray(extra, dtype=np.float32)
+        squared = squared + (extra ** 2).sum(axis=1)
+    norms = np.sqrt(squared)
+    norms[norms == 0] = 1
+    vectors_t = vectors.T.tocsr()
+
+    block = max(1, int(block_mb * 2 ** 20 / (4 * n)))
+    for start in range(0, n, block):
+        rows = np.arange(start, min(start + block, n))
+        block_scores = (vectors[rows] @ vectors_t).toarray()
+        if extra is not None:
+            block_scores += extra[rows] @ extra.T
+        block_scores /= norms[rows, None] * norms[None, :]
+        block_scores[np.arange(len(rows)), rows] = -np.inf
+
+        candidates = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(block_scores, candidates, axis=1)
+        order = np.lexsort((candidates, -candidate_scores), axis=1)
+        indices[rows] = np.take_along_axis(candidates, order, axis=1)
+        scores[rows] = np.take_along_axis(candidate_scores, order, axis=1)
+    return indices, scores
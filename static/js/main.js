@@ -261,8 +261,8 @@ function initTrafficTileLayer() {
 document.addEventListener('DOMContentLoaded', function () {
     setTimeout(getUserLocation, 2000);
 
-    // load restaurants list after page loaded
-    loadRestaurants();
+    // set restaurant name autocomplete
+    setupRestaurantSearch();
 
     // load categorized restaurant data
     loadCategorizedRestaurants();
@@ -310,26 +310,49 @@ function clearResults() {
     currentRecommendations = [];
 }
 
-// load restaurants list
-function loadRestaurants() {
-    const select = document.getElementById('restaurant-select');
-    select.innerHTML = '<option value="">-- Loading Restaurants... --</option>';
+// autocomplete restaurant names as the user types
+function setupRestaurantSearch() {
+    const input = document.getElementById('restaurant-input');
+    const options = document.getElementById('restaurant-options');
+    let searchTimer = null;
+    let latestQuery = '';
+
+    input.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        const query = input.value.trim();
+        if (!query) {
+            options.innerHTML = '';
+            return;
+        }
 
-    fetch('/api/restaurants')
-        .then(response => response.json())
-        .then(data => {
-            select.innerHTML = '<option value="">-- Select Restaurant --</option>';
-            data.restaurants.forEach(restaurant => {
-                const option = document.createElement('option');
-                option.value = restaurant;
-                option.textContent = restaurant;
-                select.appendChild(option);
-            });
-        })
-        .catch(error => {
-            console.error('Failed to load restaurants:', error);
-            select.innerHTML = '<option value="">-- Failed to Load --</option>';
-        });
+        // wait until typing pauses before asking the server
+        searchTimer = setTimeout(() => {
+            latestQuery = query;
+            fetch(`/api/restaurants/search?q=${encodeURIComponent(query)}&limit=10`)
+                .then(response => response.json())
+                .then(data => {
+                    // ignore responses for queries the user has already changed
+                    if (query !== latestQuery) return;
+
+                    options.innerHTML = '';
+                    data.restaurants.forEach(restaurant => {
+                        const option = document.createElement('option');
+                        option.value = restaurant;
+                        options.appendChild(option);
+                    });
+                })
+                .catch(error => {
+                    console.error('Failed to search restaurants:', error);
+                });
+        }, 150);
+    });
+
+    // recommend on Enter
+    input.addEventListener('keypress', e => {
+        if (e.key === 'Enter') {
+            recommendByRestaurant();
+        }
+    });
 }
 
 // handle recommend by restaurant name event
@@ -337,10 +360,9 @@ document.getElementById('btn-recommend').addEventListener('click', recommendByRe
 
 // recommend by restaurant name
 function recommendByRestaurant() {
-    const select = document.getElementById('restaurant-select');
-    const restaurantName = select.value;
+    const restaurantName = document.getElementById('restaurant-input').value.trim();
     if (!restaurantName) {
-        alert('Please select a restaurant');
+        alert('Please enter a restaurant');
         return;
     }
 
@@ -504,45 +526,63 @@ function sendMessage() {
     // show typing status
     showTypingIndicator();
 
-    // prepare data object to send to server, including categorized restaurant data
+    // prepare data object to send to server, the server restricts recommendations to the selected scene
     const requestData = {
         message: message,
         latitude: userLocation.latitude,
         longitude: userLocation.longitude,
-        // add four categories of restaurant data
-        categorized_restaurants: categoryData
+        scene: selectedScene()
     };
 
-    // send message to server
-    fetch('/api/chatbot', {
+    // bot message element, created when the first token arrives
+    let botContent = null;
+
+    // send message to server and render the streamed reply incrementally
+    fetch('/api/chatbot/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify(requestData),
     })
-        .then(response => response.json())
-        .then(data => {
-            // hide typing status
-            hideTypingIndicator();
-
-            // add bot reply
-            addMessage(data.response, 'bot');
+        .then(response => {
+            if (!response.ok || !response.body) {
+                throw new Error(`Chatbot stream failed with status ${response.status}`);
+            }
 
-            // clear current recommended list
-            clearResults();
+            return readEventStream(response, (event, data) => {
+                if (event === 'recommendations') {
+                    // clear current recommended list
+                    clearResults();
 
-            // if has recommended data, show in map and list
-            if (data.data && data.data.length > 0) {
-                // save current recommended results
-                currentRecommendations = data.data;
+                    // if has recommended data, show in map and list
+                    if (data.data && data.data.length > 0) {
+                        // save current recommended results
+                        currentRecommendations = data.data;
 
-                // show recommended results
-                displayResults(data.data);
+                        // show recommended results
+                        displayResults(data.data);
 
-                // update map markers
-                updateMapMarkers(data.data);
-            }
+                        // update map markers
+                        updateMapMarkers(data.data);
+                    }
+                } else if (event === 'token') {
+                    // replace typing status with the bot reply on the first token
+                    if (!botContent) {
+                        hideTypingIndicator();
+                        botContent = addMessage('', 'bot');
+                    }
+                    botContent.textContent += data.text;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event === 'error') {
+                    hideTypingIndicator();
+                    addMessage(data.response, 'bot');
+                }
+            });
+        })
+        .then(() => {
+            // hide typing status if the reply was empty
+            hideTypingIndicator();
         })
         .catch(error => {
             console.error('Error:', error);
@@ -551,6 +591,46 @@ function sendMessage() {
         });
 }
 
+// read a Server-Sent Events stream from a fetch response, calling onEvent(event, data) per event
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) return;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+
+                if (dataLines.length > 0) {
+                    onEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+
+            return pump();
+        });
+    }
+
+    return pump();
+}
+
 // send button click event
 chatSend.addEventListener('click', sendMessage);
 
@@ -575,6 +655,8 @@ function addMessage(text, sender) {
 
     // scroll to bottom
     chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return messageContent;
 }
 
 // show typing status
@@ -653,6 +735,12 @@ function setupCategoryCheckboxes() {
     });
 }
 
+// scene to ask the chatbot for: the selected category if exactly one is checked, otherwise none
+function selectedScene() {
+    const checkboxes = document.querySelectorAll('input[name="category"]:checked');
+    return checkboxes.length === 1 ? checkboxes[0].value : null;
+}
+
 // update legend display
 function updateLegendDisplay() {
     const legend = document.getElementById('map-legend');
@@ -0,0 +1,202 @@
+"""
+Local stand-ins for the OpenWeatherMap, HERE Routing and Gemini APIs, and for the SerpApi Yelp
+reviews endpoint used by get_reviews.py (GET /reviews?place_id=...).
+
+Responses have the shapes read by app.parse_weather, app.parse_route_traffic and the Gemini
+calls in app.py. Every request waits --latency-ms (plus up to --jitter-ms) before answering, to
+mimic the real services. --error-rate answers that share of requests with the error response of
+each service, and --stream-delay-ms paces the chunks of the streaming Gemini endpoint.
+
+Usage:
+    python stub_upstreams.py --port 8099 --latency-ms 200 --jitter-ms 100 --error-rate 0.01
+
+Then start the app with the upstream URLs pointed at the stubs (printed on startup).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WEATHER_RESPONSE = {
+    "weather": [{"description": "clear sky", "icon": "01d"}],
+    "main": {"temp": 21.5, "feels_like": 21.0, "humidity": 40},
+    "wind": {"speed": 3.1}
+}
+
+ROUTE_RESPONSE = {
+    "routes": [{
+        "sections": [{
+            "summary": {"duration": 900, "baseDuration": 720, "jamFactor": 3.2, "length": 4200}
+        }]
+    }]
+}
+
+GEMINI_TEXT = (
+    "Here are two places that fit what you are looking for.\n\n"
+    "The first one is close by and the traffic is light right now.\n\n"
+    "The second one is a little further but has great reviews."
+)
+
+
+# error bodies of each service, sent with status 503
+ERROR_RESPONSES = {
+    "weather": {"cod": 503, "message": "Service temporarily unavailable"},
+    "routes": {"title": "Service unavailable", "status": 503},
+    "gemini": {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}},
+    "reviews": {"error": "Service temporarily unavailable"},
+}
+
+REVIEW_COMMENTS = [
+    "Great pasta and a cozy room, perfect for a date night.",
+    "Came with the kids, friendly staff and big portions.",
+    "Good spot for drinks with friends after work.",
+    "Quiet enough for a business lunch, the service was quick.",
+    "The tacos were fine but the wait was long.",
+]
+
+
+# SerpApi-shaped Yelp reviews of a business, the same for the same place_id
+def reviews_response(place_id):
+    seed = zlib.crc32(place_id.encode("utf-8"))
+    reviews = []
+    for i in range(seed % 10):
+        reviews.append({
+            "user": {"name": f"user{(seed + i) % 1000}"},
+            "rating": 1 + (seed + i) % 5,
+            "date": f"2024-{1 + (seed + i) % 12:02d}-{1 + (seed + i) % 28:02d}",
+            "comment": {"text": REVIEW_COMMENTS[(seed + i) % len(REVIEW_COMMENTS)], "language": "en"},
+        })
+    return {"search_metadata": {"status": "Success"}, "reviews": reviews}
+
+
+def gemini_response(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    stream_delay = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    # wait like the real service, then decide whether this request fails
+    def simulate(self):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        return random.random() < self.error_rate
+
+    def do_GET(self):
+        failed = self.simulate()
+        url = urlparse(self.path)
+        path = url.path
+        if path.endswith("/weather"):
+            service, response = "weather", WEATHER_RESPONSE
+        elif path.endswith("/routes"):
+            service, response = "routes", ROUTE_RESPONSE
+        elif path.endswith("/reviews"):
+            service, response = "reviews", reviews_response(parse_qs(url.query).get("place_id", [""])[0])
+        else:
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        if failed:
+            self.send_json(ERROR_RESPONSES[service], status=503)
+        else:
+            self.send_json(response)
+
+    def do_POST(self):
+        self.read_body()
+        failed = self.simulate()
+        path = urlparse(self.path).path
+        if not path.endswith((":generateContent", ":streamGenerateContent")):
+            self.send_json({"error": "not found"}, status=404)
+        elif failed:
+            self.send_json(ERROR_RESPONSES["gemini"], status=503)
+        elif path.endswith(":generateContent"):
+            self.send_json(gemini_response(GEMINI_TEXT))
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in GEMINI_TEXT.split(" "):
+                chunk = json.dumps(gemini_response(word + " "))
+                self.wfile.write(f"data: {chunk}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+                if self.stream_delay:
+                    time.sleep(self.stream_delay)
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+# start the stub server in a background thread
+def start_stub_server(host="127.0.0.1", port=8099, latency_ms=200, jitter_ms=0, error_rate=0.0,
+                      stream_delay_ms=0):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency": latency_ms / 1000,
+        "jitter": jitter_ms / 1000,
+        "error_rate": error_rate,
+        "stream_delay": stream_delay_ms / 1000,
+    })
+    server = StubServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# environment variables pointing app.py at a stub server
+def stub_environment(host="127.0.0.1", port=8099):
+    base = f"http://{host}:{port}"
+    return {
+        "WEATHER_API_URL": f"{base}/weather",
+        "HERE_ROUTER_URL": f"{base}/routes",
+        "GEMINI_MODEL_URL": f"{base}/gemini",
+        "WEATHER_API_KEY": "stub-key",
+        "HERE_API_KEY": "stub-key",
+        "GEMINI_API_KEY": "stub-key",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the external APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="extra random latency, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--stream-delay-ms", type=float, default=0, help="delay between streamed chunks")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                               args.stream_delay_ms)
+    print(f"Stub upstreams listening on http://{args.host}:{args.port}")
+    for key, value in stub_environment(args.host, args.port).items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
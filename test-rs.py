@@ -1,58 +1,90 @@
+import argparse
+import os
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 
-
-def load_data():
-    # Load precomputed similarity matrix and restaurant info
-    similarity = pickle.load(open('models/restaurant_similarity.pkl', 'rb'))
-    info = pickle.load(open('models/restaurant_info.pkl', 'rb'))
-    return similarity, info
-
-
-def get_recommendations(similarity, names, idx, K):
-    # Get top-K similar restaurants (excluding itself)
-    sims = list(enumerate(similarity[idx]))
-    sims = sorted(sims, key=lambda x: x[1], reverse=True)
-    top_indices = [i for i, _ in sims[1:K+1]]
-    return [names[i] for i in top_indices]
-
-
-def evaluate(similarity, info, relevant_set, query_idxs, K):
-    hr_list, prec_list, rec_list, ndcg_list = [], [], [], []
-    names = info['restaurant_name'].tolist()
-    for idx in query_idxs:
-        recs = get_recommendations(similarity, names, idx, K)
-        # Binary hits for relevance
-        hits = [1 if r in relevant_set else 0 for r in recs]
-        # Hit Rate
-        hr_list.append(1.0 if any(hits) else 0.0)
-        # Precision@K
-        prec_list.append(sum(hits) / K)
-        # Recall@K
-        rec_list.append(sum(hits) / len(relevant_set) if len(relevant_set) > 0 else 0.0)
-        # NDCG@K
-        dcg = sum([hit / np.log2(i + 2) for i, hit in enumerate(hits)])
-        ideal_hits = [1] * min(len(relevant_set), K)
-        idcg = sum([ideal_hits[i] / np.log2(i + 2) for i in range(len(ideal_hits))])
-        ndcg_list.append(dcg / idcg if idcg > 0 else 0.0)
-
-    # Aggregate metrics
-    precision = np.mean(prec_list)
-    recall = np.mean(rec_list)
-    f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) > 0 else 0.0
-    return {
-        'HR': np.mean(hr_list),
-        'Precision': precision,
-        'Recall': recall,
-        'F1': f1,
-        'NDCG': np.mean(ndcg_list)
-    }
-
-
-def main():
+# similarity matrix, top-K neighbors (used without the matrix) and restaurant info of each model
+MODELS = {
+    'tfidf': ('models/restaurant_similarity.pkl', 'models/restaurant_neighbors.pkl', 'models/restaurant_info.pkl'),
+    'sbert': ('models_sbert/restaurant_similarity_sbert.pkl', 'models_sbert/restaurant_neighbors_sbert.pkl',
+              'models_sbert/restaurant_info_sbert.pkl'),
+}
+
+
+def load_data(model='tfidf'):
+    # Load precomputed similarity matrix (or top-K neighbors if there is none) and restaurant info
+    similarity_path, neighbors_path, info_path = MODELS[model]
+    if os.path.exists(similarity_path):
+        similarity, neighbors = pickle.load(open(similarity_path, 'rb')), None
+    else:
+        similarity, neighbors = None, pickle.load(open(neighbors_path, 'rb'))
+    info = pickle.load(open(info_path, 'rb'))
+    return similarity, neighbors, info
+
+
+def top_k_block(similarity, rows, k):
+    # Top-k most similar restaurants for a block of query rows (excluding the row itself),
+    # best first and ties broken by lower index, like a stable sort of each row
+    scores = np.array(similarity[rows], dtype=float)
+    scores[np.arange(len(rows)), rows] = -np.inf
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (len(rows), 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)[:, :k]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def top_k(similarity, query_idxs, k, block_size=1024, workers=None):
+    # Rank all query rows in blocks, spread over threads (NumPy releases the GIL while partitioning)
+    query_idxs = np.asarray(query_idxs, dtype=int)
+    k = min(k, similarity.shape[0] - 1)
+    if len(query_idxs) == 0 or k <= 0:
+        return np.empty((len(query_idxs), 0), dtype=int)
+    blocks = [query_idxs[i:i + block_size] for i in range(0, len(query_idxs), block_size)]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return np.vstack(list(executor.map(lambda rows: top_k_block(similarity, rows, k), blocks)))
+
+
+def evaluate(ranking, relevant_mask, n_relevant, Ks):
+    # Metrics for every K from one ranking: hits[q, i] is 1 if the i-th recommendation is relevant.
+    # n_relevant is the number of distinct relevant names, the recall and IDCG denominator
+    hits = relevant_mask[ranking].astype(float)
+    cum_hits = np.cumsum(hits, axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, hits.shape[1] + 2))
+    cum_dcg = np.cumsum(hits * discounts, axis=1)
+
+    results = {}
+    for K in Ks:
+        if hits.shape[0] == 0:
+            results[K] = dict.fromkeys(['HR', 'Precision', 'Recall', 'F1', 'NDCG'], np.nan)
+            continue
+        # recommendations beyond the catalog size count as misses
+        col = min(K, hits.shape[1]) - 1
+        hits_at_k = cum_hits[:, col] if col >= 0 else np.zeros(hits.shape[0])
+        dcg = cum_dcg[:, col] if col >= 0 else np.zeros(hits.shape[0])
+        idcg = (1.0 / np.log2(np.arange(2, min(n_relevant, K) + 2))).sum()
+
+        precision = np.mean(hits_at_k / K)
+        recall = np.mean(hits_at_k / n_relevant) if n_relevant > 0 else 0.0
+        f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) > 0 else 0.0
+        results[K] = {
+            'HR': np.mean(hits_at_k > 0),
+            'Precision': precision,
+            'Recall': recall,
+            'F1': f1,
+            'NDCG': np.mean(dcg / idcg) if idcg > 0 else 0.0
+        }
+    return results
+
+
+def evaluate_model(model, Ks, block_size, workers):
     # Load data
-    similarity, info = load_data()
+    similarity, neighbors, info = load_data(model)
+    info = info.reset_index(drop=True)
 
     # Convert columns to numeric types
     info['review_count'] = info['review_count'].astype(int)
@@ -63,24 +95,53 @@ def main():
     rating_threshold = 4.5
     review_count_threshold = info['review_count'].median()
 
-    # Prepare explicit feedback ground truth (by rating)
-    explicit_idxs = info[info['Rating'] >= rating_threshold].index.tolist()
-    explicit_relevant = set(info.loc[info['Rating'] >= rating_threshold, 'restaurant_name'])
+    # Ground truths are sets of names, so every restaurant sharing a relevant name is relevant
+    names = info['restaurant_name']
+    explicit = (info['Rating'] >= rating_threshold).to_numpy()
+    implicit = (info['review_count'] >= review_count_threshold).to_numpy()
+    explicit_relevant = names.isin(set(names[explicit])).to_numpy()
+    implicit_relevant = names.isin(set(names[implicit])).to_numpy()
+
+    # Rank the union of both query sets once, up to the largest K
+    query_idxs = np.flatnonzero(explicit | implicit)
+    if similarity is not None:
+        ranking = top_k(similarity, query_idxs, max(Ks), block_size, workers)
+    else:
+        # the neighbors are ranked the same way, best first and ties by lower index
+        if max(Ks) > neighbors['indices'].shape[1]:
+            print(f"{model}: only the top {neighbors['indices'].shape[1]} neighbors were saved")
+        ranking = neighbors['indices'][query_idxs, :max(Ks)].astype(int)
+    row_of = np.full(len(info), -1)
+    row_of[query_idxs] = np.arange(len(query_idxs))
+
+    exp_metrics = evaluate(ranking[row_of[np.flatnonzero(explicit)]], explicit_relevant,
+                           len(set(names[explicit])), Ks)
+    imp_metrics = evaluate(ranking[row_of[np.flatnonzero(implicit)]], implicit_relevant,
+                           len(set(names[implicit])), Ks)
+    return [{
+        'model': model,
+        'K': K,
+        **{f'exp_{m}': v for m, v in exp_metrics[K].items()},
+        **{f'imp_{m}': v for m, v in imp_metrics[K].items()}
+    } for K in Ks]
 
-    # Prepare implicit feedback ground truth (by review count)
-    implicit_idxs = info[info['review_count'] >= review_count_threshold].index.tolist()
-    implicit_relevant = set(info.loc[info['review_count'] >= review_count_threshold, 'restaurant_name'])
 
-    # Evaluate for different K values
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation of the recommendation models")
+    parser.add_argument('--models', nargs='+', default=['tfidf', 'sbert'], choices=list(MODELS))
+    parser.add_argument('--k', nargs='+', type=int, default=[1, 5, 10])
+    parser.add_argument('--block-size', type=int, default=1024, help="query rows ranked per block")
+    parser.add_argument('--workers', type=int, default=None, help="threads ranking blocks (default: all cores)")
+    args = parser.parse_args()
+
+    # Evaluate each model whose artifacts are present
     results = []
-    for K in [1, 5, 10]:
-        exp_metrics = evaluate(similarity, info, explicit_relevant, explicit_idxs, K)
-        imp_metrics = evaluate(similarity, info, implicit_relevant, implicit_idxs, K)
-        results.append({
-            'K': K,
-            **{f'exp_{m}': v for m, v in exp_metrics.items()},
-            **{f'imp_{m}': v for m, v in imp_metrics.items()}
-        })
+    for model in args.models:
+        similarity_path, neighbors_path, info_path = MODELS[model]
+        if not os.path.exists(info_path) or not (os.path.exists(similarity_path) or os.path.exists(neighbors_path)):
+            print(f"Skipping {model}: missing {info_path} or both {similarity_path} and {neighbors_path}")
+            continue
+        results.extend(evaluate_model(model, sorted(args.k), args.block_size, args.workers))
 
     # Display results
     df_res = pd.DataFrame(results)
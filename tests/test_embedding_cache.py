@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+
+from embedding_cache import KEY_DTYPE, EmbeddingCache, text_key
+
+
+# deterministic fake embeddings that remember which texts were encoded
+class FakeEncoder:
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def vector(self, text):
+        return np.random.default_rng(list(text_key(text))).random(self.dim, dtype=np.float32)
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([self.vector(text) for text in texts])
+
+
+def shard_files(cache):
+    return sorted(os.listdir(cache.directory))
+
+
+def test_encode_returns_vectors_in_order_and_encodes_each_new_text_once(tmp_path):
+    cache, encoder = EmbeddingCache("model", directory=tmp_path), FakeEncoder()
+    texts = ["b", "a", "b", "c", "a"]
+    out = cache.encode(texts, encoder)
+    np.testing.assert_array_equal(out, np.stack([encoder.vector(t) for t in texts]))
+    assert sorted(encoder.calls[0]) == ["a", "b", "c"]
+    assert (cache.hits, cache.encoded) == (0, 3)
+
+    out = cache.encode(["c", "d", "a"], encoder)
+    np.testing.assert_array_equal(out, np.stack([encoder.vector(t) for t in ["c", "d", "a"]]))
+    assert encoder.calls[1] == ["d"]
+    assert (cache.hits, cache.encoded) == (2, 1)
+
+
+def test_incremental_index_matches_the_index_read_from_disk(tmp_path):
+    cache, encoder = EmbeddingCache("model", directory=tmp_path), FakeEncoder()
+    rng = np.random.default_rng(0)
+    for _ in range(6):
+        cache.encode([f"text {i}" for i in rng.integers(0, 200, size=40)], encoder)
+    assert np.all(cache.keys[:-1] <= cache.keys[1:])
+
+    reread = EmbeddingCache("model", directory=tmp_path)
+    np.testing.assert_array_equal(cache.keys, reread.keys)
+    texts = [f"text {i}" for i in range(200)]
+    np.testing.assert_array_equal(cache.encode(texts, encoder), reread.encode(texts, encoder))
+
+
+def test_add_keeps_rows_with_their_keys_when_the_keys_are_not_sorted(tmp_path):
+    cache, encoder = EmbeddingCache("model", directory=tmp_path), FakeEncoder()
+    cache.encode(["m", "n"], encoder)
+    texts = [f"text {i}" for i in range(50)]
+    keys = np.array([text_key(t) for t in texts], dtype=KEY_DTYPE)
+    assert not np.all(keys[:-1] <= keys[1:])
+    cache.add(keys, encoder(texts))
+    found = cache.find(keys)
+    for text, pos in zip(texts, found):
+        np.testing.assert_array_equal(cache.shards[cache.shard_ids[pos]][cache.rows[pos]], encoder.vector(text))
+
+
+def test_find_misses_keys_outside_the_index(tmp_path):
+    cache = EmbeddingCache("model", directory=tmp_path)
+    missing = np.array([b"\x00" * 16, b"\xff" * 16], dtype=KEY_DTYPE)
+    np.testing.assert_array_equal(cache.find(missing), [-1, -1])
+    cache.encode(["a", "b"], FakeEncoder())
+    np.testing.assert_array_equal(cache.find(missing), [-1, -1])
+    assert sorted(cache.find(np.array([text_key("a"), text_key("b")], dtype=KEY_DTYPE))) == [0, 1]
+
+
+def test_compact_merges_all_shards_including_other_writers(tmp_path):
+    cache, encoder = EmbeddingCache("model", directory=tmp_path), FakeEncoder()
+    for start in range(0, 30, 10):
+        cache.encode([f"text {i}" for i in range(start, start + 10)], encoder)
+    # another process adds a shard this cache has not read yet
+    EmbeddingCache("model", directory=tmp_path).encode(["other"], encoder)
+    assert len(shard_files(cache)) == 8
+
+    cache.compact()
+    assert len(cache.shards) == 1 and len(shard_files(cache)) == 2
+    texts = [f"text {i}" for i in range(30)] + ["other"]
+    calls = len(encoder.calls)
+    np.testing.assert_array_equal(cache.encode(texts, encoder), np.stack([encoder.vector(t) for t in texts]))
+    assert len(encoder.calls) == calls
+    assert len(EmbeddingCache("model", directory=tmp_path)) == 31
+
+
+def test_partial_shards_and_other_variants_are_not_read(tmp_path):
+    cache = EmbeddingCache("model", directory=tmp_path)
+    cache.encode(["a"], FakeEncoder())
+    # a shard whose keys were never written
+    np.save(os.path.join(cache.directory, "partial.vectors.npy"), np.ones((1, 4), dtype=np.float32))
+    assert len(EmbeddingCache("model", directory=tmp_path)) == 1
+    assert len(EmbeddingCache("model", directory=tmp_path, variant="onnx")) == 0
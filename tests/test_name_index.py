@@ -0,0 +1,69 @@
+import random
+
+from name_index import NameIndex, normalize_name, single_deletes
+
+NAMES = ["Joe's Pizza", "Pizza Suprema", "Café Mogador", "Mogador Express", "Ippudo", "Ippudo Westside",
+         "Los Tacos No. 1", "Tacombi", "Xi'an Famous Foods", "Zz's Clam Bar"]
+
+
+def test_normalize_name():
+    assert normalize_name("Café  Mogador!") == "cafe mogador"
+    assert normalize_name("Joe’s Pizza") == "joes pizza"
+    assert normalize_name("Los Tacos No. 1") == "los tacos no 1"
+
+
+def test_prefix_range_is_exactly_the_tokens_with_the_prefix():
+    rng = random.Random(0)
+    tokens = ["".join(rng.choice("abz") for _ in range(rng.randint(1, 4))) for _ in range(300)]
+    index = NameIndex(tokens)
+    for prefix in set(t[:k] for t in tokens for k in range(1, len(t) + 1)) | {"zzzzz", "c", "ab"}:
+        lo, hi = index._prefix_range(prefix)
+        assert index.tokens[lo:hi] == sorted(t for t in index.tokens if t.startswith(prefix))
+
+
+def test_prefix_search_ranks_whole_name_prefixes_first():
+    index = NameIndex(NAMES)
+    assert index.search("pizza") == ["Pizza Suprema", "Joe's Pizza"]
+    assert index.search("mog") == ["Mogador Express", "Café Mogador"]
+    assert index.search("ippudo west") == ["Ippudo Westside"]
+    assert index.search("taco") == ["Tacombi", "Los Tacos No. 1"]
+
+
+def test_popularity_breaks_ties():
+    index = NameIndex(["Ippudo", "Ippudo Westside"], popularity=[1, 10])
+    assert index.search("ipp") == ["Ippudo Westside", "Ippudo"]
+
+
+def test_single_deletes():
+    assert single_deletes("taco") == {"aco", "tco", "tao", "tac"}
+
+
+def test_fuzzy_matches_one_edit():
+    # fuzzy matches all rank the same, shorter names first
+    index = NameIndex(NAMES)
+    assert index.search("piza") == ["Joe's Pizza", "Pizza Suprema"]       # deletion
+    assert index.search("pizzza") == ["Joe's Pizza", "Pizza Suprema"]     # insertion
+    assert index.search("pizze") == ["Joe's Pizza", "Pizza Suprema"]      # substitution
+    assert index.search("mogadro") == ["Café Mogador", "Mogador Express"]  # transposition
+    assert index.search("pxzzb") == []                                    # two substitutions
+
+
+def test_short_tokens_are_not_fuzzy():
+    index = NameIndex(NAMES)
+    assert index.search("zx") == []
+    assert index.search("xi") == ["Xi'an Famous Foods"]
+
+
+def test_exact_matches_fill_the_page_before_fuzzy_ones():
+    index = NameIndex(["Pizza Hut", "Pizzeria", "Piza Place"])
+    assert index.search("pizza", limit=1) == ["Pizza Hut"]
+    assert index.search("pizza") == ["Pizza Hut", "Piza Place"]
+
+
+def test_empty_queries_and_pages():
+    index = NameIndex(NAMES)
+    assert index.search("") == []
+    assert index.search("!!") == []
+    assert index.search("pizza", limit=0) == []
+    assert index.page(8) == NAMES[8:]
+    assert index.page(-5, 2) == NAMES[:2]
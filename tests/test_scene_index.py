@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from scene_index import SceneIndex, load_scene_index
+
+
+@pytest.mark.parametrize("n_rows", [0, 1, 7, 8, 9, 64, 101])
+def test_bitsets_round_trip(n_rows):
+    rng = np.random.default_rng(n_rows)
+    names = [f"r{i}" for i in range(n_rows)]
+    expected = rng.random(n_rows) < 0.3
+    index = SceneIndex({"dating": [name for name, member in zip(names, expected) if member]}).align(names)
+
+    np.testing.assert_array_equal(index.mask("dating"), expected)
+    np.testing.assert_array_equal(index.rows("dating"), np.flatnonzero(expected))
+    assert [index.contains("dating", row) for row in range(n_rows)] == expected.tolist()
+    assert len(index.bits["dating"]) == (n_rows + 7) // 8
+
+
+def test_contains_is_false_outside_the_rows_and_scenes():
+    index = SceneIndex({"family": ["a", "c"]}).align(["a", "b", "c"])
+    assert not index.contains("family", -1)
+    assert not index.contains("family", 3)
+    # the padding bits of the last byte stay clear
+    assert not index.contains("family", 7)
+    assert not index.contains("dating", 0)
+    assert not index.mask("dating").any() and len(index.mask("dating")) == 3
+    assert len(index.rows("dating")) == 0
+
+
+def test_every_row_sharing_a_member_name_is_a_member():
+    index = SceneIndex({"friend": ["dup", "gone"]}).align(["dup", "x", "dup"])
+    np.testing.assert_array_equal(index.rows("friend"), [0, 2])
+    assert index.unmatched == {"friend": 1}
+    assert index.counts() == {"friend": 2}
+
+
+def test_realigns_only_when_the_rows_change(tmp_path):
+    index = SceneIndex({"professional": ["b"]}).align(["a", "b"])
+    index.save(tmp_path / "scene_index.pkl")
+
+    loaded = load_scene_index(tmp_path / "scene_index.pkl", ["a", "b"])
+    np.testing.assert_array_equal(loaded.rows("professional"), [1])
+    bits = loaded.bits["professional"]
+    assert loaded.ensure_aligned(["a", "b"]).bits["professional"] is bits
+
+    loaded.ensure_aligned(["b", "c", "a"])
+    np.testing.assert_array_equal(loaded.rows("professional"), [0])
+    assert loaded.contains("professional", 0) and not loaded.contains("professional", 1)
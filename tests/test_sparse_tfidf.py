@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from sparse_tfidf import fit_tfidf, group_sum, hashing_vectorizer, top_k_neighbors
+
+WORDS = "pizza pasta ramen sushi taco burger wine beer cocktail brunch vegan spicy cheap cozy loud".split()
+
+
+def random_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=rng.integers(1, 12))) for _ in range(n)]
+
+
+# top k of a dense similarity matrix without the diagonal, ties broken by lower index
+def dense_top_k(similarity, k):
+    similarity = similarity.copy()
+    np.fill_diagonal(similarity, -np.inf)
+    order = np.argsort(-similarity, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(similarity, order, axis=1)
+
+
+def test_group_sum_adds_the_rows_of_each_group():
+    X = sp.random(20, 6, density=0.5, format="csr", random_state=0, dtype=np.float32)
+    groups = np.random.default_rng(0).integers(0, 4, size=20)
+    expected = np.stack([X.toarray()[groups == g].sum(axis=0) for g in range(5)])
+    np.testing.assert_allclose(group_sum(groups, X, 5).toarray(), expected, rtol=1e-6)
+
+
+def test_tfidf_matches_sklearn_up_to_column_order():
+    texts = random_texts(40)
+    counts = group_sum(np.arange(40), hashing_vectorizer().transform(texts), 40)
+    vectorizer, vectors = fit_tfidf(counts)
+    expected = TfidfVectorizer(stop_words="english").fit_transform(texts)
+    np.testing.assert_allclose((vectors @ vectors.T).toarray(), (expected @ expected.T).toarray(), atol=1e-5)
+    # the vectorizer maps new texts like the fitted rows
+    np.testing.assert_allclose(vectorizer.transform(texts[:5]).toarray(), vectors[:5].toarray(), atol=1e-6)
+
+
+def test_max_features_keeps_the_most_frequent_columns():
+    counts = sp.csr_matrix(np.array([[5, 0, 1, 0], [3, 0, 0, 2], [1, 0, 0, 4]], dtype=np.float32))
+    vectorizer, vectors = fit_tfidf(counts, max_features=2)
+    np.testing.assert_array_equal(vectorizer.columns, [0, 3])
+    assert vectors.shape == (3, 2)
+
+
+@pytest.mark.parametrize("with_extra", [False, True])
+def test_top_k_neighbors_equal_dense_top_k(with_extra):
+    texts = random_texts(60, seed=1)
+    _, vectors = fit_tfidf(hashing_vectorizer().transform(texts))
+    extra = np.random.default_rng(1).normal(size=(60, 3)).astype(np.float32) if with_extra else None
+    # a block of a few rows, so the rows are scored over several blocks
+    indices, scores = top_k_neighbors(vectors, extra, k=7, block_mb=0.001)
+
+    features = np.hstack([vectors.toarray(), extra]) if with_extra else vectors.toarray()
+    expected_indices, expected_scores = dense_top_k(cosine_similarity(features), 7)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+    np.testing.assert_array_equal(indices, expected_indices)
+
+
+def test_top_k_neighbors_break_ties_by_lower_index_and_cap_k():
+    vectors = sp.csr_matrix(np.array([[1, 0], [1, 0], [1, 0], [0, 1]], dtype=np.float32))
+    indices, scores = top_k_neighbors(vectors, k=10)
+    assert indices.shape == (4, 3)
+    np.testing.assert_array_equal(indices[:3, :2], [[1, 2], [0, 2], [0, 1]])
+    np.testing.assert_allclose(scores[:3, :2], 1)
+    assert top_k_neighbors(vectors[:1], k=5)[0].shape == (1, 0)